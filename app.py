@@ -1,10 +1,31 @@
+import io
 import streamlit as st
-import json
-import os
-import requests
 import time
+import uuid
 import streamlit.components.v1 as components
-from typing import Optional, Dict, Any
+from typing import Callable, Optional, Dict, Any, List, Sequence
+from prompt_engine import (
+    PromptSelection, build_base_prompt, build_alternative_prompts, build_prompt_data,
+    QUALITY_LEVELS, VISUAL_EFFECTS, DEFAULT_EFFECTS, DEFAULT_TIMESTAMP
+)
+from cache_keys import enhancement_key, index_partition
+from enhancement_cache import EnhancementCache
+from gemini import (
+    DEFAULT_MODEL, GeminiError, GeminiResponseError, build_system_prompt, generate_content,
+    stream_generate_content
+)
+from key_pool import KeyPool, keys_from
+from near_duplicate import DEFAULT_THRESHOLD, PATCH_THRESHOLD, NearDuplicateIndex, reuse_enhancement, sync_from_cache, warm_from_cache
+from metrics import API_IN_FLIGHT, API_LATENCY, API_REQUESTS, API_TOKENS, CACHE_LOOKUPS, COALESCED, FALLBACKS, PREFETCHES, key_label, start_exporters
+from library import CATEGORIES, DATA_FILE, DEFAULT_LIBRARY, freeze_library, item_key
+from library_db import LIBRARY_DB, LibraryDB
+from library_io import export_text, guess_format, import_items, library_items
+from library_store import LibraryStore
+from option_search import PAGE_SIZE, OptionIndex
+from prefetch import CLAIM_TIMEOUT, PREFETCH_FLIGHT, Prefetcher
+from rerun_profiler import RerunProfiler
+from single_flight import SingleFlight
+from sampler import SAMPLER_RULES, PromptSampler, load_rules
 
 # Data persistence functions
 def copy_to_clipboard(text, button_key):
@@ -49,33 +70,159 @@ def copy_to_clipboard(text, button_key):
     """
     components.html(copy_script, height=0)
 
+@st.cache_resource(show_spinner=False)
+def get_library_store() -> LibraryStore:
+    """One handle per process on the journaled library file"""
+    return LibraryStore(DATA_FILE)
+
 def load_data():
-    """Load data from JSON file if it exists"""
-    data_file = "prompt_generator_data.json"
-    if os.path.exists(data_file):
+    """Load the saved library (snapshot + journal; only new journal records are parsed on later calls)"""
+    try:
+        return get_library_store().read()
+    except Exception as e:
+        st.error(f"Error loading data: {e}")
+    return None
+
+@st.cache_resource(show_spinner=False)
+def get_library_db() -> Optional[LibraryDB]:
+    """Shared SQLite library when PROMPT_LIBRARY_DB is set; seeded from the JSON library on first use"""
+    if not LIBRARY_DB:
+        return None
+    db = LibraryDB(LIBRARY_DB)
+    if db.is_empty():
+        db.import_library(get_library_store().read())
+    return db
+
+def shared_names(category: str) -> Sequence[str]:
+    """Names of a category every session sees; one shared tuple until the library changes"""
+    db = get_library_db()
+    return db.names(category) if db is not None else shared_library[category].names
+
+def pending_names(category: str) -> Sequence[str]:
+    """This session's additions not yet in the shared library"""
+    if get_library_db() is not None:
+        return ()
+    return tuple(name for name, _ in st.session_state.library_overlay[category].values())
+
+def library_names(category: str) -> Sequence[str]:
+    """Selectable names of a category (keys for characters and palettes)"""
+    names = shared_names(category)
+    pending = pending_names(category)
+    return names + pending if pending else names
+
+def library_value(category: str, name: str) -> str:
+    """Description of a character (origin) or palette (colors)"""
+    db = get_library_db()
+    if db is not None:
+        return db.value(category, name) or ""
+    pending = st.session_state.library_overlay[category].get(item_key(name))
+    return pending[1] if pending else shared_library[category][name]
+
+def find_item(category: str, name: str) -> Optional[str]:
+    """Stored spelling of an item equivalent to name (same words, any case or spacing)"""
+    db = get_library_db()
+    if db is not None:
+        return db.find(category, name)
+    pending = st.session_state.library_overlay[category].get(item_key(name))
+    return pending[0] if pending else shared_library[category].find(name)
+
+@st.cache_resource(show_spinner=False)
+def _option_indexes() -> Dict[str, OptionIndex]:
+    return {}
+
+def option_index(category: str) -> OptionIndex:
+    """Search index over a category's shared names, shared by all sessions until those change
+    (a session's pending additions are searched separately, see pending_names)"""
+    names = shared_names(category)
+    indexes = _option_indexes()
+    index = indexes.get(category)
+    if index is None or index.names is not names:
+        index = indexes[category] = OptionIndex(names)
+    return index
+
+@st.cache_resource(show_spinner=False)
+def sampler_rules() -> Dict[str, Any]:
+    """Weights and exclusions for the surprise button (PROMPT_SAMPLER_RULES)"""
+    try:
+        return load_rules(SAMPLER_RULES)
+    except (OSError, ValueError) as e:
+        st.error(f"Sampler rules could not be loaded: {e}")
+        return {}
+
+def surprise_me() -> None:
+    """Pick one weighted random value per category for the selectors"""
+    options = {category: library_names(category) for category in CATEGORIES}
+    try:
+        st.session_state.surprise = PromptSampler(options, library_value, sampler_rules()).surprise()
+    except ValueError as e:
+        st.warning(f"⚠️ {e}")
+
+def library_selectbox(label: str, category: str) -> Optional[str]:
+    """Selectbox over a category; large ones get a search box and only one page of options"""
+    shared, pending = shared_names(category), pending_names(category)
+    preferred = st.session_state.get("surprise", {}).get(category)
+    if len(shared) + len(pending) <= PAGE_SIZE:
+        names = library_names(category)
+        index = names.index(preferred) if preferred in names else 0
+        return st.selectbox(label, names, index=index)
+    query = st.text_input(f"🔍 {label}", key=f"{category}_query",
+                          placeholder=f"{len(shared) + len(pending)} öğe içinde ara...")
+    page_key = f"{category}_page"
+    if st.session_state.get(f"{category}_last_query") != query:
+        st.session_state[f"{category}_last_query"] = query
+        st.session_state[page_key] = 1
+    page_number = st.session_state.get(page_key, 1)
+    index = option_index(category)
+    page = index.search(query, offset=(page_number - 1) * PAGE_SIZE, extra=pending)
+    if not page.names and page_number > 1:  # paged past the end
+        st.session_state[page_key] = page_number = 1
+        page = index.search(query, extra=pending)
+    if not page.names:
+        st.caption("🔍 Eşleşme bulunamadı")
+        page = index.search("", extra=pending)
+    elif page.capped:
+        st.caption("🔍 Daha fazla eşleşme var, aramayı daraltın")
+    options = page.names
+    if preferred is not None and preferred not in options:
+        options = [preferred] + options
+    choice = st.selectbox(label, options, index=options.index(preferred) if preferred in options else 0)
+    if page.has_more or page_number > 1:
+        st.number_input("Sayfa", min_value=1, step=1, key=page_key)
+    return choice
+
+def add_item(category: str, name: str, value: Optional[str] = None) -> bool:
+    """Add one item to the library and persist it; False if it is already there"""
+    name = name.strip()
+    if not name:
+        return False
+    existing = find_item(category, name)
+    if existing is not None:
+        st.warning(f"⚠️ Zaten mevcut: {existing}")
+        return False
+    db = get_library_db()
+    if db is not None:
         try:
-            with open(data_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return db.add(category, name, value)
         except Exception as e:
-            st.error(f"Error loading data: {e}")
-    return None
+            st.error(f"Error saving data: {e}")
+            return False
+    # Visible to this session right away; to the others once the shared library picks it up
+    st.session_state.library_overlay[category][item_key(name)] = (name, value)
+    return record_addition(category, name, value)
+
+def record_addition(category: str, item: str, value: Optional[str] = None) -> bool:
+    """Append one added item to the library journal"""
+    try:
+        get_library_store().add(category, item, value)
+        return True
+    except Exception as e:
+        st.error(f"Error saving data: {e}")
+        return False
 
 def save_data():
-    """Save current session state to JSON file"""
-    data_file = "prompt_generator_data.json"
+    """Fold the journal into the JSON snapshot (additions are already saved as they happen)"""
     try:
-        data = {
-            'characters': st.session_state.characters,
-            'poses': st.session_state.poses,
-            'color_palettes': st.session_state.color_palettes,
-            'art_styles': st.session_state.art_styles,
-            'lighting_types': st.session_state.lighting_types,
-            'backgrounds': st.session_state.backgrounds,
-            'moods': st.session_state.moods,
-            'expressions': st.session_state.expressions
-        }
-        with open(data_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        get_library_store().compact()
         return True
     except Exception as e:
         st.error(f"Error saving data: {e}")
@@ -89,101 +236,49 @@ def get_cached_prompt_enhancement(base_prompt: str, style: str, character: str)
     # Streamlit will handle the caching automatically
     return None  # This will be replaced by actual API call result
 
-def call_gemini_api(prompt: str, api_key: str, creativity: float = 0.8, max_tokens: int = 200, 
-                   focus: str = "Genel Artistik Kalite", model: str = "gemini-1.5-flash") -> Optional[str]:
-    """Call AI API with error handling and customizable parameters"""
+def call_gemini_api(prompt: str, key_pool: KeyPool, key_index: int, creativity: float = 0.8,
+                    max_tokens: int = 200, focus: str = "Genel Artistik Kalite",
+                    model: str = "gemini-1.5-flash",
+                    on_chunk: Optional[Callable[[str], None]] = None, quiet: bool = False) -> Optional[str]:
+    """Call AI API with error handling and customizable parameters; reports the outcome to the key pool.
+    With on_chunk, the response is streamed and on_chunk gets the text received so far.
+    quiet skips the error messages (background threads have no page to show them on)."""
+    started = time.perf_counter()
     try:
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
-        headers = {
-            "Content-Type": "application/json",
-            "x-goog-api-key": api_key
-        }
-        
-        # Dynamic system prompt based on focus
-        focus_prompts = {
-            "Genel Artistik Kalite": "Focus on overall artistic quality, professional terminology, and visual impact",
-            "Işık ve Atmosfer": "Focus on lighting effects, atmospheric elements, and mood enhancement",
-            "Karakter Detayları": "Focus on character design, clothing details, and facial expressions",
-            "Kompozisyon ve Açılar": "Focus on camera angles, composition, and visual perspective",
-            "Malzeme ve Dokular": "Focus on materials, textures, surface details, and tactile qualities"
-        }
-        
-        system_prompt = f"""You are an expert AI art prompt engineer specializing in anime and digital art. 
-
-TASK: Enhance the given prompt to be more artistic and detailed while maintaining all core elements.
-
-FOCUS: {focus_prompts.get(focus, focus_prompts["Genel Artistik Kalite"])}
-
-ENHANCEMENT RULES:
-- Keep ALL original characters, settings, colors, and key descriptors
-- Add 5-10 high-impact artistic enhancement words/phrases
-- Use professional photography and digital art terminology
-- Enhance lighting, texture, and atmospheric details
-- Make descriptions more specific and vivid
-- Add technical quality indicators
-- Maintain the cyberpunk/neon anime aesthetic
-- DO NOT add explanations or meta-commentary
-- Return ONLY the enhanced prompt
-
-Original prompt to enhance:"""
-        
-        data = {
-            "contents": [{
-                "parts": [{
-                    "text": f"{system_prompt}\n\n{prompt}"
-                }]
-            }],
-            "generationConfig": {
-                "temperature": creativity,
-                "maxOutputTokens": max_tokens,
-                "topP": min(0.95, creativity + 0.1),
-                "topK": int(40 * creativity),
-                "stopSequences": ["Original:", "Explanation:", "Note:", "Focus:", "Enhancement:"]
-            }
-        }
-        
-        response = requests.post(url, headers=headers, json=data, timeout=15)
-        
-        if response.status_code == 200:
-            result = response.json()
-            
-            # Debug: Print the API response structure
-            # st.write("Debug - API Response:", result)
-            
-            if 'candidates' in result and len(result['candidates']) > 0:
-                candidate = result['candidates'][0]
-                
-                # Check if candidate has content/parts structure
-                if 'content' in candidate and 'parts' in candidate['content']:
-                    enhanced_prompt = candidate['content']['parts'][0]['text'].strip()
-                elif 'parts' in candidate:
-                    enhanced_prompt = candidate['parts'][0]['text'].strip()
-                else:
-                    st.error(f"Unexpected API response structure: {candidate}")
-                    return None
-                
-                # Clean up any unwanted text
-                enhanced_prompt = enhanced_prompt.replace("Enhanced prompt:", "").strip()
-                enhanced_prompt = enhanced_prompt.replace("Enhanced:", "").strip()
-                return enhanced_prompt
-            else:
-                if 'error' in result:
-                    st.error(f"API Error: {result['error']}")
-                else:
-                    st.error(f"No candidates in response: {result}")
+        if on_chunk is None:
+            enhanced = generate_content(prompt, key_pool.keys[key_index], creativity, max_tokens, focus, model)
         else:
-            error_text = response.text
-            st.warning(f"API Error {response.status_code}: {error_text}")
-            
-    except Exception as e:
-        st.warning(f"API call failed: {str(e)}")
+            enhanced = ""
+            for chunk in stream_generate_content(prompt, key_pool.keys[key_index], creativity,
+                                                 max_tokens, focus, model):
+                enhanced += chunk
+                on_chunk(enhanced)
+            enhanced = enhanced.strip()
+    except GeminiResponseError as e:
+        key_pool.record_failure(key_index, e.status)
+        if not quiet:
+            st.error(str(e))
+    except GeminiError as e:
+        key_pool.record_failure(key_index, e.status, e.retry_after)
+        if not quiet:
+            st.warning(str(e))
+    except BaseException:
+        key_pool.release(key_index)
+        raise
+    else:
+        key_pool.record_success(key_index, time.perf_counter() - started)
+        return enhanced
     
     return None
 
 def enhance_prompt_with_gemini(base_prompt: str, character: str, style: str, 
                               creativity: float = 0.8, max_tokens: int = 200, 
-                              focus: str = "Genel Artistik Kalite") -> tuple[str, dict]:
-    """Enhance prompt using AI with fallback API keys and return debug info"""
+                              focus: str = "Genel Artistik Kalite",
+                              similarity_threshold: float = DEFAULT_THRESHOLD,
+                              on_chunk: Optional[Callable[[str], None]] = None,
+                              patch_threshold: Optional[float] = None) -> tuple[str, dict]:
+    """Enhance prompt using AI with fallback API keys and return debug info; on_chunk enables streaming.
+    patch_threshold opts in to patching one-slot neighbours below the similarity threshold"""
     
     debug_info = {
         "api_used": None,
@@ -194,190 +289,296 @@ def enhance_prompt_with_gemini(base_prompt: str, character: str, style: str,
         "settings": {
             "creativity": creativity,
             "max_tokens": max_tokens,
-            "focus": focus
+            "focus": focus,
+            "streaming": on_chunk is not None
         }
     }
     
     start_time = time.time()
     
     # Check if API keys are configured
-    api_key_1 = st.secrets.get("GEMINI_API_KEY_1", "")
-    api_key_2 = st.secrets.get("GEMINI_API_KEY_2", "")
+    key_pool = get_key_pool()
     
-    if not api_key_1 and not api_key_2:
+    if not len(key_pool):
         debug_info["error"] = "No API keys configured"
         return base_prompt, debug_info
     
-    # Create more efficient cache key (less specific = more cache hits)
-    # Group similar prompts together by using normalized components
-    cache_key = f"{hash(base_prompt[:100])}_{creativity:.1f}_{max_tokens//50}_{focus[:10]}_{character[:5]}_{style[:10]}"
+    # Versioned digests of the full normalized request: stable across restarts and replicas
+    cache_key = enhancement_key(base_prompt, DEFAULT_MODEL, creativity, max_tokens, focus)
+    partition = index_partition(DEFAULT_MODEL, focus)
+    
+    # A speculative prefetch of this very prompt: drop it if it has not started, else wait a
+    # bounded time for it; when it enhanced the prompt, the exact cache below returns it
+    if get_prefetcher().claim(cache_key, CLAIM_TIMEOUT):
+        debug_info["prefetched"] = True
     
-    # Try to get cached result first with more aggressive caching
+    # Both cache tiers are read-only: only a genuine miss reaches the network
     try:
         # First try exact cache
-        cached_result = cached_gemini_call(cache_key, base_prompt, api_key_1 or api_key_2, 
-                                         creativity, max_tokens, focus)
-        if cached_result and cached_result != base_prompt:
+        cached_result = get_enhancement_cache().get(cache_key)
+        exact_hit = bool(cached_result) and cached_result != base_prompt
+        CACHE_LOOKUPS.inc(tier="exact", result="hit" if exact_hit else "miss")
+        if exact_hit:
             debug_info["cache_hit"] = True
+            debug_info["cache_type"] = "exact"
             debug_info["enhanced_length"] = len(cached_result.split())
             debug_info["processing_time"] = time.time() - start_time
             return cached_result, debug_info
         
-        # Second try: similar prompt cache (more lenient)
-        similar_cache_key = f"{hash(base_prompt[:50])}_{focus[:5]}_{character[:3]}"
-        cached_result = cached_gemini_call(similar_cache_key, base_prompt, api_key_1 or api_key_2,
-                                         creativity, max_tokens, focus)
-        if cached_result and cached_result != base_prompt:
+        # Second try: near-duplicate of a previously enhanced prompt, patched slot by slot
+        match = get_similarity_index().lookup(base_prompt, partition, similarity_threshold,
+                                              patch_threshold=patch_threshold)
+        reused = reuse_enhancement(match, similarity_threshold) if match else None
+        similar_hit = bool(reused) and reused != base_prompt
+        CACHE_LOOKUPS.inc(tier="similar", result="hit" if similar_hit else "miss")
+        if similar_hit:
+            get_enhancement_cache().record("similar_hits")
             debug_info["cache_hit"] = True
             debug_info["cache_type"] = "similar"
-            debug_info["enhanced_length"] = len(cached_result.split())
+            debug_info["similarity"] = round(match.similarity, 3)
+            debug_info["patched_slots"] = len(match.slot_diff)
+            debug_info["enhanced_length"] = len(reused.split())
             debug_info["processing_time"] = time.time() - start_time
-            return cached_result, debug_info
+            return reused, debug_info
             
-    except:
+    except Exception:
         pass  # If cache fails, continue with API call
     
-    # Try primary API key
-    if api_key_1:
-        enhanced = call_gemini_api(base_prompt, api_key_1, creativity, max_tokens, focus)
-        if enhanced and enhanced != base_prompt:
-            debug_info["api_used"] = "Primary"
-            debug_info["enhanced_length"] = len(enhanced.split())
-            debug_info["processing_time"] = time.time() - start_time
-            return enhanced, debug_info
-        time.sleep(1)  # Brief delay before fallback
-    
-    # Fallback to secondary API key
-    if api_key_2:
-        enhanced = call_gemini_api(base_prompt, api_key_2, creativity, max_tokens, focus)
-        if enhanced and enhanced != base_prompt:
-            debug_info["api_used"] = "Fallback"
-            debug_info["enhanced_length"] = len(enhanced.split())
-            debug_info["processing_time"] = time.time() - start_time
-            return enhanced, debug_info
+    stream_to = None
+    if on_chunk is not None:
+        def stream_to(text: str):
+            debug_info.setdefault("first_chunk_time", time.time() - start_time)
+            on_chunk(text)
+    
+    # Healthiest key first; keys with an open circuit are skipped without waiting
+    tried = []
+    def fetch(publish: Callable[[str], None]) -> Optional[str]:
+        while True:
+            key_index, _ = key_pool.acquire(tried)
+            if key_index is None:
+                return None
+            tried.append(key_index)
+            if len(tried) > 1:
+                FALLBACKS.inc(reason="next_key")
+            enhanced = call_gemini_api(base_prompt, key_pool, key_index, creativity, max_tokens, focus,
+                                       on_chunk=publish if stream_to is not None else None)
+            if enhanced and enhanced != base_prompt:
+                debug_info["api_used"] = "Primary" if key_index == 0 else "Fallback"
+                debug_info["api_key"] = key_index + 1
+                store_enhancement(cache_key, partition, base_prompt, enhanced)
+                return enhanced
+    
+    def recheck() -> Optional[str]:
+        cached = get_enhancement_cache().get(cache_key)
+        return cached if cached and cached != base_prompt else None
+    
+    # Identical requests from other sessions (or, with PROMPT_SINGLE_FLIGHT_DIR, other
+    # processes) that are in flight right now share one upstream call
+    enhanced, shared = get_single_flight().do(cache_key, fetch, stream_to, recheck)
+    if shared:
+        # The upstream call (or, across processes, its cached result) belonged to another request
+        debug_info["coalesced"] = True
+        debug_info["api_used"] = "Coalesced"
+        debug_info["cache_type"] = "coalesced"
+    if enhanced:
+        debug_info["enhanced_length"] = len(enhanced.split())
+        debug_info["processing_time"] = time.time() - start_time
+        return enhanced, debug_info
     
     # Return original if all API calls fail
-    debug_info["error"] = "All API calls failed"
+    FALLBACKS.inc(reason="unenhanced")
+    debug_info["error"] = "All API calls failed" if tried or shared else "All API keys cooling down"
     debug_info["processing_time"] = time.time() - start_time
     return base_prompt, debug_info
 
-# Enhanced cached function with longer TTL and better key strategy
-@st.cache_data(ttl=86400, show_spinner=False)  # 24 hour cache
-def cached_gemini_call(cache_key: str, base_prompt: str, api_key: str, 
-                      creativity: float, max_tokens: int, focus: str) -> Optional[str]:
-    """Cached version of AI API call with aggressive caching for token efficiency"""
-    return call_gemini_api(base_prompt, api_key, creativity, max_tokens, focus)
-
-# Load existing data or use defaults
-saved_data = load_data()
-
-# Initialize session state
-# Initialize session state
-if 'characters' not in st.session_state:
-    if saved_data and 'characters' in saved_data:
-        st.session_state.characters = saved_data['characters']
-    else:
-        st.session_state.characters = {
-            "cyberpunk hacker girl": "neon-lit server room",
-            "futuristic samurai": "cyberpunk Neo-Tokyo", 
-            "anime spellcaster": "digital magic realm",
-            "superhero": "cyberpunk metropolis"
-        }
+# Enhancement cache shared on disk by all sessions, processes and restarts
+@st.cache_resource(show_spinner=False)
+def get_enhancement_cache() -> EnhancementCache:
+    """One handle per process on the persistent enhancement cache"""
+    return EnhancementCache()
 
-if 'poses' not in st.session_state:
-    if saved_data and 'poses' in saved_data:
-        st.session_state.poses = saved_data['poses']
-    else:
-        st.session_state.poses = [
-            "dynamic crouched pose ready to strike with glowing weapon",
-            "heroic standing pose with cape flowing in neon wind",
-            "profile view looking upward thoughtfully with glowing eyes", 
-            "arms outstretched with energy coursing through body",
-            "confident standing with arms crossed and electric aura",
-            "mid-air jumping pose with trailing energy effects",
-            "sitting meditation pose with floating energy orbs",
-            "walking forward with determination and glowing footsteps",
-            "dramatic pose with one hand extended casting energy",
-            "battle-ready stance with dual weapons glowing"
-        ]
-
-if 'color_palettes' not in st.session_state:
-    if saved_data and 'color_palettes' in saved_data:
-        st.session_state.color_palettes = saved_data['color_palettes']
-    else:
-        st.session_state.color_palettes = {
-            "Cyberpunk Classic": "electric blue, hot pink, neon purple, cyan",
-            "Neon Sunset": "neon orange, electric pink, bright purple, yellow glow",
-            "Ice Fire": "ice blue, neon red, white, cyan",
-            "Toxic Glow": "neon green, electric purple, bright cyan, lime"
-        }
+@st.cache_resource(show_spinner=False)
+def _key_pool(api_keys: tuple) -> KeyPool:
+    return KeyPool(api_keys)
 
-if 'art_styles' not in st.session_state:
-    if saved_data and 'art_styles' in saved_data:
-        st.session_state.art_styles = saved_data['art_styles']
-    else:
-        st.session_state.art_styles = [
-            "anime style digital art",
-            "highly detailed anime illustration", 
-            "cyberpunk anime art style",
-            "cinematic anime style digital art",
-            "masterpiece anime artwork"
-        ]
-
-if 'lighting_types' not in st.session_state:
-    if saved_data and 'lighting_types' in saved_data:
-        st.session_state.lighting_types = saved_data['lighting_types']
-    else:
-        st.session_state.lighting_types = [
-            "dramatic neon lighting",
-            "cinematic rim lighting",
-            "atmospheric neon glow",
-            "multiple colored light sources",
-            "volumetric neon lighting"
-        ]
-
-if 'backgrounds' not in st.session_state:
-    if saved_data and 'backgrounds' in saved_data:
-        st.session_state.backgrounds = saved_data['backgrounds']
-    else:
-        st.session_state.backgrounds = [
-            "pure black background",
-            "dark void with neon grid",
-            "black background with subtle geometric patterns",
-            "deep space black",
-            "minimalist dark cityscape silhouette"
-        ]
-
-if 'moods' not in st.session_state:
-    if saved_data and 'moods' in saved_data:
-        st.session_state.moods = saved_data['moods']
-    else:
-        st.session_state.moods = [
-            "dark and mysterious",
-            "vibrant and energetic", 
-            "serene and mystical",
-            "intense and dramatic",
-            "futuristic and clean"
-        ]
-
-if 'expressions' not in st.session_state:
-    if saved_data and 'expressions' in saved_data:
-        st.session_state.expressions = saved_data['expressions']
-    else:
-        st.session_state.expressions = [
-            "confident and determined",
-            "mysterious and enigmatic",
-            "fierce and powerful",
-            "calm and contemplative",
-            "rebellious and edgy"
-        ]
+def get_key_pool() -> KeyPool:
+    """Process-wide key pool, so key health is shared by all sessions"""
+    return _key_pool(tuple(keys_from(st.secrets)))
+
+@st.cache_resource(show_spinner=False)
+def _similarity_index() -> NearDuplicateIndex:
+    # Same limits as the cache it mirrors; filled from it in the background
+    cache = get_enhancement_cache()
+    index = NearDuplicateIndex(max_entries=cache.max_entries, ttl=cache.ttl)
+    warm_from_cache(index, cache)
+    return index
+
+def get_similarity_index() -> NearDuplicateIndex:
+    """Process-wide near-duplicate index, topped up with entries other processes cached"""
+    index = _similarity_index()
+    sync_from_cache(index, get_enhancement_cache())
+    return index
+
+def store_enhancement(cache_key: str, partition: str, base_prompt: str, enhanced: str):
+    """Record a fresh API result in both cache tiers"""
+    try:
+        get_enhancement_cache().set(cache_key, enhanced, base_prompt, partition)
+        get_similarity_index().add(cache_key, base_prompt, enhanced, partition)
+    except Exception:
+        pass  # Caching is best effort; the result is still returned
+
+@st.cache_resource(show_spinner=False)
+def get_single_flight() -> SingleFlight:
+    """Process-wide table of enhancement requests in flight"""
+    return SingleFlight()
+
+@st.cache_resource(show_spinner=False)
+def get_prefetcher() -> Prefetcher:
+    """Process-wide speculative enhancement queue (idle until a session opts in)"""
+    return Prefetcher()
+
+def prefetch_job(cache_key: str, base_prompt: str, creativity: float, max_tokens: int, focus: str,
+                 similarity_threshold: float, patch_threshold: Optional[float] = None) -> Callable[[], bool]:
+    """Background enhancement of a prompt before it is asked for. Shared resources are
+    resolved here, on the script thread; the job itself makes no Streamlit calls and
+    tries one key only, so speculation never eats the fallbacks of real requests"""
+    key_pool = get_key_pool()
+    cache = get_enhancement_cache()
+    index = _similarity_index()
+    flights = get_single_flight()
+    partition = index_partition(DEFAULT_MODEL, focus)
+    
+    def fetch(publish: Callable[[str], None]) -> Optional[str]:
+        key_index, _ = key_pool.acquire()
+        if key_index is None:
+            return None
+        enhanced = call_gemini_api(base_prompt, key_pool, key_index, creativity, max_tokens, focus,
+                                   quiet=True)
+        if not enhanced or enhanced == base_prompt:
+            return None
+        cache.set(cache_key, enhanced, base_prompt, partition)
+        index.add(cache_key, base_prompt, enhanced, partition)
+        return enhanced
+    
+    def recheck() -> Optional[str]:
+        cached = cache.get(cache_key)
+        return cached if cached and cached != base_prompt else None
+    
+    def run() -> bool:
+        if cache.contains(cache_key) or flights.in_flight(cache_key):
+            return False  # Cached, or a click is already fetching it
+        match = index.lookup(base_prompt, partition, similarity_threshold, patch_threshold=patch_threshold)
+        if match and reuse_enhancement(match, similarity_threshold):
+            return False  # The click is served from the similarity tier anyway
+        # Coalesced with identical prefetches of other sessions and processes only: a click
+        # must never inherit the None of a one-key speculative call, so it claims the job
+        # (bounded wait) and then makes its own call under the plain key
+        enhanced, shared = flights.do(PREFETCH_FLIGHT + cache_key, fetch, recheck=recheck)
+        return enhanced is not None and not shared
+    
+    return run
+
+@st.cache_resource(show_spinner=False)
+def get_profiler() -> RerunProfiler:
+    """Process-wide rerun profiler (PROMPT_PROFILE); every call is a no-op when it is off"""
+    return RerunProfiler.from_env()
+
+# Every session reads the same frozen library (only new journal records are parsed per run);
+# a session keeps just its own additions until they show up there. Nothing is loaded
+# when the library lives in SQLite (sessions then query the shared store)
+profiler = get_profiler()
+profiler.begin()
+with profiler.phase("load_data"):
+    use_library_db = get_library_db() is not None
+    shared_library = None
+    if not use_library_db:
+        shared_library = load_data() or freeze_library(DEFAULT_LIBRARY)
+if not use_library_db:
+    with profiler.phase("session_state"):
+        if "library_overlay" not in st.session_state:
+            st.session_state.library_overlay = {category: {} for category in CATEGORIES}
+        for category, pending in st.session_state.library_overlay.items():
+            for key in [key for key, (name, _) in pending.items() if shared_library[category].find(name)]:
+                del pending[key]
+
+@st.cache_resource(show_spinner=False)
+def metrics_exporters() -> List[str]:
+    """Prometheus exporters from PROMPT_METRICS_PORT / PROMPT_METRICS_FILE, started once per process"""
+    try:
+        return start_exporters()
+    except OSError as e:  # e.g. another replica holds the port
+        return [f"❌ {e}"]
+
+def metrics_panel():
+    """Process-wide API, cache and key metrics, aggregated for the sidebar"""
+    with st.expander("📈 Metrikler"):
+        requests = API_REQUESTS.total()
+        if requests:
+            statuses: Dict[str, float] = {}
+            for (_, _, status), count in API_REQUESTS.series().items():
+                statuses[status] = statuses.get(status, 0) + count
+            st.caption(f"🌐 {requests:.0f} istek · p50 {API_LATENCY.quantile(0.5) * 1000:.0f} ms · "
+                       f"p95 {API_LATENCY.quantile(0.95) * 1000:.0f} ms · şu an {API_IN_FLIGHT.total():.0f}")
+            st.caption("📟 " + " · ".join(f"{status}: {count:.0f}" for status, count in sorted(statuses.items())))
+            for model in sorted({model for model, _, _ in API_REQUESTS.series()}):
+                st.caption(f"🧠 {model}: p95 {API_LATENCY.quantile(0.95, model=model) * 1000:.0f} ms · "
+                           f"{API_TOKENS.total(model=model, kind='prompt'):.0f} giriş / "
+                           f"{API_TOKENS.total(model=model, kind='output'):.0f} çıkış token")
+            for i, api_key in enumerate(get_key_pool().keys, 1):
+                label = key_label(api_key)
+                if API_LATENCY.count(key=label):
+                    st.caption(f"🔑 Anahtar {i}: {API_LATENCY.count(key=label)} istek · "
+                               f"p95 {API_LATENCY.quantile(0.95, key=label) * 1000:.0f} ms")
+        else:
+            st.caption("🌐 Henüz API isteği yok")
+        for tier, title in (("exact", "Tam"), ("similar", "Benzer")):
+            hits = CACHE_LOOKUPS.total(tier=tier, result="hit")
+            lookups = CACHE_LOOKUPS.total(tier=tier)
+            if lookups:
+                st.caption(f"⚡ {title} önbellek: %{hits / lookups * 100:.0f} isabet ({hits:.0f}/{lookups:.0f})")
+        st.caption(f"↪️ Yedek anahtar: {FALLBACKS.total(reason='next_key'):.0f} · "
+                   f"geliştirilemeyen: {FALLBACKS.total(reason='unenhanced'):.0f}")
+        if COALESCED.total():
+            st.caption(f"🤝 Paylaşılan istek: {COALESCED.total(scope='thread'):.0f} · "
+                       f"diğer süreçlerden: {COALESCED.total(scope='process'):.0f}")
+        if PREFETCHES.total():
+            st.caption(f"🔮 Önden hazırlanan: {PREFETCHES.total(outcome='enhanced'):.0f} · "
+                       f"iptal: {PREFETCHES.total(outcome='superseded') + PREFETCHES.total(outcome='cancelled'):.0f} · "
+                       f"beklenen: {PREFETCHES.total(outcome='joined'):.0f}")
+        for target in metrics_exporters():
+            st.caption(f"📤 {target}")
+
+def profiler_panel():
+    """Developer panel: slowest rerun phases over the profiler's window"""
+    profiler = get_profiler()
+    if not profiler.enabled:
+        return
+    with st.expander("🛠️ Rerun Profili"):
+        reruns = profiler.recent()
+        if not reruns:
+            st.caption("Henüz tamamlanan rerun yok")
+            return
+        last = reruns[-1]
+        st.caption(f"Son rerun: {last['total_ms']:.0f} ms · pencere: {len(reruns)} rerun")
+        st.dataframe([{key: round(value, 1) if isinstance(value, float) else value for key, value in row.items()}
+                      for row in profiler.summary()], hide_index=True, use_container_width=True)
+        if last.get("hotspots"):
+            st.caption("🔥 Son rerun, kümülatif süreye göre")
+            st.code("\n".join(f"{spot['cumulative_ms']:8.1f} ms {spot['calls']:7d}× {spot['function']}"
+                              for spot in last["hotspots"]), language=None)
+        if last.get("memory"):
+            memory = last["memory"]
+            st.caption(f"🧠 Bellek: {memory['current_kb']:.0f} KiB · tepe {memory['peak_kb']:.0f} KiB")
+            st.code("\n".join(memory["top"]), language=None)
+        if st.button("💾 Profili Diske Yaz", use_container_width=True):
+            st.success(f"✅ {profiler.dump()}")
 
 def add_character():
     """Basit öğe ekleme fonksiyonu"""
     st.header("➕ Yeni Öğe Ekle")
     
     # Tek satırda hızlı ekleme
-    tab1, tab2, tab3, tab4, tab5, tab6, tab7 = st.tabs(["🎭 Karakter", "🤸 Pose", "🎨 Renk", "🎬 Art Style", "💡 Lighting", "🖼️ Background", "😊 Mood/Expression"])
+    tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8 = st.tabs(["🎭 Karakter", "🤸 Pose", "🎨 Renk", "🎬 Art Style", "💡 Lighting", "🖼️ Background", "😊 Mood/Expression", "📦 Toplu"])
     
     with tab1:
         col1, col2 = st.columns([3, 1])
@@ -387,10 +588,9 @@ def add_character():
         with col2:
             if st.button("Ekle", key="char_add", use_container_width=True):
                 if char_name and char_origin:
-                    st.session_state.characters[char_name] = char_origin
-                    save_data()  # Save to file
-                    st.success("✅ Eklendi!")
-                    st.rerun()
+                    if add_item("characters", char_name, char_origin):
+                        st.success("✅ Eklendi!")
+                        st.rerun()
     
     with tab2:
         col1, col2 = st.columns([3, 1])
@@ -399,10 +599,9 @@ def add_character():
         with col2:
             if st.button("Ekle", key="pose_add", use_container_width=True):
                 if new_pose:
-                    st.session_state.poses.append(new_pose)
-                    save_data()  # Save to file
-                    st.success("✅ Eklendi!")
-                    st.rerun()
+                    if add_item("poses", new_pose):
+                        st.success("✅ Eklendi!")
+                        st.rerun()
     
     with tab3:
         col1, col2, col3 = st.columns([2, 2, 1])
@@ -413,10 +612,9 @@ def add_character():
         with col3:
             if st.button("Ekle", key="palette_add", use_container_width=True):
                 if palette_name and palette_colors:
-                    st.session_state.color_palettes[palette_name] = palette_colors
-                    save_data()  # Save to file
-                    st.success("✅ Eklendi!")
-                    st.rerun()
+                    if add_item("color_palettes", palette_name, palette_colors):
+                        st.success("✅ Eklendi!")
+                        st.rerun()
     
     with tab4:
         col1, col2 = st.columns([3, 1])
@@ -425,10 +623,9 @@ def add_character():
         with col2:
             if st.button("Ekle", key="art_add", use_container_width=True):
                 if new_art_style:
-                    st.session_state.art_styles.append(new_art_style)
-                    save_data()  # Save to file
-                    st.success("✅ Eklendi!")
-                    st.rerun()
+                    if add_item("art_styles", new_art_style):
+                        st.success("✅ Eklendi!")
+                        st.rerun()
     
     with tab5:
         col1, col2 = st.columns([3, 1])
@@ -437,10 +634,9 @@ def add_character():
         with col2:
             if st.button("Ekle", key="light_add", use_container_width=True):
                 if new_lighting:
-                    st.session_state.lighting_types.append(new_lighting)
-                    save_data()  # Save to file
-                    st.success("✅ Eklendi!")
-                    st.rerun()
+                    if add_item("lighting_types", new_lighting):
+                        st.success("✅ Eklendi!")
+                        st.rerun()
     
     with tab6:
         col1, col2 = st.columns([3, 1])
@@ -449,10 +645,9 @@ def add_character():
         with col2:
             if st.button("Ekle", key="bg_add", use_container_width=True):
                 if new_background:
-                    st.session_state.backgrounds.append(new_background)
-                    save_data()  # Save to file
-                    st.success("✅ Eklendi!")
-                    st.rerun()
+                    if add_item("backgrounds", new_background):
+                        st.success("✅ Eklendi!")
+                        st.rerun()
     
     with tab7:
         col1, col2, col3 = st.columns([2, 2, 1])
@@ -462,65 +657,92 @@ def add_character():
             new_expression = st.text_input("Expression:", placeholder="wise and ancient")
         with col3:
             if st.button("Ekle", key="mood_add", use_container_width=True):
-                if new_mood:
-                    st.session_state.moods.append(new_mood)
-                if new_expression:
-                    st.session_state.expressions.append(new_expression)
-                if new_mood or new_expression:
-                    save_data()  # Save to file
+                added_mood = bool(new_mood) and add_item("moods", new_mood)
+                added_expression = bool(new_expression) and add_item("expressions", new_expression)
+                if added_mood or added_expression:
                     st.success("✅ Eklendi!")
                     st.rerun()
 
+    with tab8:
+        bulk_import_export()
+
+def bulk_import_export():
+    """CSV/JSONL import and export of the whole library"""
+    st.caption("Her satır bir öğe: category, name, value (value yalnızca characters ve color_palettes için)")
+    db = get_library_db()
+    store = get_library_store()
+    # Outcome of an import, kept across the rerun that shows the new items
+    report = st.session_state.pop("bulk_import_report", None)
+    if report is not None:
+        st.success(f"✅ {report.added} öğe eklendi, {report.duplicates} tekrar atlandı")
+        if report.errors:
+            st.warning(f"⚠️ {len(report.errors)} satır geçersiz")
+            st.code("\n".join(f"{error.line}: {error.message}" for error in report.errors[:50]),
+                    language=None)
+    uploaded = st.file_uploader("CSV / JSONL dosyası", type=["csv", "jsonl", "ndjson"])
+    if uploaded is not None and st.button("📥 İçe Aktar", key="bulk_import"):
+        try:
+            stream = io.TextIOWrapper(uploaded, encoding="utf-8-sig", newline="")
+            try:
+                report = import_items(stream, guess_format(uploaded.name), db or store)
+            finally:
+                stream.detach()  # leave the uploaded file open for Streamlit
+        except Exception as e:
+            st.error(f"Error importing data: {e}")
+        else:
+            st.session_state.bulk_import_report = report
+            st.rerun()
+
+    export_format = st.radio("Dışa aktarma biçimi", ["csv", "jsonl"], horizontal=True)
+    # The export is built on request only, not on every rerun of the page
+    if st.button("📦 Dışa Aktarmayı Hazırla", key="bulk_export"):
+        st.download_button(
+            "📤 Dışa Aktar",
+            data=export_text(db.iter_items() if db is not None else library_items(store.read()),
+                             export_format),
+            file_name=f"prompt_library.{export_format}",
+            mime="text/csv" if export_format == "csv" else "application/jsonl",
+        )
+
 def generate_prompt():
     """Prompt oluşturma fonksiyonu"""
     st.header("🚀 Prompt Oluştur")
+    if st.button("🎲 Beni Şaşırt"):
+        surprise_me()
     
     col1, col2, col3 = st.columns(3)
     
-    with col1:
-        selected_char = st.selectbox("Karakter Seç:", list(st.session_state.characters.keys()))
-        selected_pose = st.selectbox("Pose Seç:", st.session_state.poses)
+    with col1, profiler.phase("generate_prompt.selectors"):
+        selected_char = library_selectbox("Karakter Seç:", "characters")
+        selected_pose = library_selectbox("Pose Seç:", "poses")
     
-    with col2:
-        selected_palette = st.selectbox("Renk Paleti Seç:", list(st.session_state.color_palettes.keys()))
+    with col2, profiler.phase("generate_prompt.selectors"):
+        selected_palette = library_selectbox("Renk Paleti Seç:", "color_palettes")
         
         # Gelişmiş ayarlar
-        art_style = st.selectbox("Art Style:", st.session_state.art_styles)
+        art_style = library_selectbox("Art Style:", "art_styles")
         
-    with col3:
-        lighting_type = st.selectbox("Lighting:", st.session_state.lighting_types)
+    with col3, profiler.phase("generate_prompt.selectors"):
+        lighting_type = library_selectbox("Lighting:", "lighting_types")
         
-        background_type = st.selectbox("Background:", st.session_state.backgrounds)
+        background_type = library_selectbox("Background:", "backgrounds")
         
     # Gelişmiş seçenekler
-    with st.expander("🎛️ Gelişmiş Ayarlar"):
+    with st.expander("🎛️ Gelişmiş Ayarlar"), profiler.phase("generate_prompt.settings"):
         col4, col5 = st.columns(2)
         
         with col4:
-            quality_level = st.selectbox("Kalite:", [
-                "masterpiece, best quality, ultra detailed",
-                "8K ultra HD, professional artwork",
-                "award-winning digital art, perfect composition",
-                "studio quality, photorealistic rendering"
-            ])
+            quality_level = st.selectbox("Kalite:", QUALITY_LEVELS)
             
-            effects = st.multiselect("Görsel Efektler:", [
-                "soft outer glow",
-                "volumetric lighting",
-                "particle effects", 
-                "energy aura",
-                "holographic elements",
-                "light bloom and lens flare",
-                "electromagnetic field visualization"
-            ], default=["soft outer glow", "volumetric lighting"])
+            effects = st.multiselect("Görsel Efektler:", VISUAL_EFFECTS, default=DEFAULT_EFFECTS)
             
         with col5:
-            mood = st.selectbox("Atmosfer:", st.session_state.moods)
+            mood = library_selectbox("Atmosfer:", "moods")
             
-            expression = st.selectbox("İfade:", st.session_state.expressions)
+            expression = library_selectbox("İfade:", "expressions")
             
     # AI Enhancement Toggle
-    with st.expander("🤖 AI Enhancement"):
+    with st.expander("🤖 AI Enhancement"), profiler.phase("generate_prompt.settings"):
         col_ai_main1, col_ai_main2 = st.columns(2)
         
         with col_ai_main1:
@@ -554,88 +776,86 @@ def generate_prompt():
                     "Kompozisyon ve Açılar",
                     "Malzeme ve Dokular"
                 ])
+                similarity_threshold = st.slider("Cache Benzerlik Eşiği", 0.5, 1.0, DEFAULT_THRESHOLD, 0.05,
+                                                 help="Daha önce geliştirilmiş benzer bir prompt bu oranda benziyorsa sonucu API çağrısı yapmadan kullanılır")
+                patch_slots = st.checkbox("🩹 Tek Slot Farkını Yamala", value=False,
+                                          help="Eşiğin altında kalsa da yalnızca bir slotu farklı olan (en az %50 benzer) önceki sonucu, farklı slotu değiştirerek kullanır")
+                stream_enhancement = st.checkbox("⚡ Canlı Akış", value=True,
+                                                 help="AI çıktısını geldikçe gösterir; ilk kelimeler tüm yanıtı beklemeden görünür")
+                speculative = st.checkbox("🔮 Önden Hazırla", value=False,
+                                          help="Seçimler kısa bir süre değişmeden kalınca AI geliştirmesini arka planda başlatır; butona basıldığında sonuç genellikle hazırdır (ek API çağrısı yapabilir)")
         else:
             ai_creativity = 0.8
             max_tokens = 200
             enhancement_focus = "Genel Artistik Kalite"
+            similarity_threshold = DEFAULT_THRESHOLD
+            patch_slots = False
+            stream_enhancement = False
+            speculative = False
             show_debug_info = False
     
+    selection = PromptSelection(
+        character=selected_char,
+        origin=library_value("characters", selected_char),
+        pose=selected_pose,
+        palette_name=selected_palette,
+        colors=library_value("color_palettes", selected_palette),
+        art_style=art_style,
+        lighting=lighting_type,
+        background=background_type,
+        mood=mood,
+        expression=expression,
+        quality=quality_level,
+        effects=tuple(effects)
+    )
+    
+    # Base prompt oluştur
+    base_prompt = build_base_prompt(selection)
+    
+    patch_threshold = PATCH_THRESHOLD if patch_slots else None
+    
+    # Every rerun reschedules the current selection; it is only enhanced once it has been
+    # left alone for the debounce interval, and a newer selection replaces it
+    if "prefetch_session" not in st.session_state:
+        st.session_state.prefetch_session = uuid.uuid4().hex
+    if speculative and len(get_key_pool()):
+        cache_key = enhancement_key(base_prompt, DEFAULT_MODEL, ai_creativity, max_tokens, enhancement_focus)
+        get_prefetcher().schedule(
+            st.session_state.prefetch_session, cache_key,
+            prefetch_job(cache_key, base_prompt, ai_creativity, max_tokens, enhancement_focus,
+                         similarity_threshold, patch_threshold))
+    else:
+        get_prefetcher().cancel(st.session_state.prefetch_session)
+    
     if st.button("🎨 ULTRA PROMPT OLUŞTUR", type="primary", use_container_width=True):
-        origin = st.session_state.characters[selected_char]
-        colors = st.session_state.color_palettes[selected_palette]
-        effects_str = ", ".join(effects) if effects else "soft outer glow"
-        
-        # Base prompt oluştur
-        base_prompt = f"{quality_level}, {art_style}, {selected_char} from {origin}, {expression} expression, {selected_pose}, wearing detailed outfit with intricate design elements, {lighting_type} with strong rim lighting creating dramatic shadows, {background_type}, {colors} with glowing edges and neon accents, {effects_str}, {mood} atmosphere, sharp focus, perfect composition, cinematic quality"
-        
         # AI Enhancement
         debug_info = None
         if use_ai_enhancement:
-            with st.spinner("🤖 AI ile prompt geliştiriliyor..."):
+            # Live preview while the response streams in; replaced by the result tabs below
+            live_preview = st.empty()
+            on_chunk = None
+            if stream_enhancement:
+                def on_chunk(text: str):
+                    live_preview.code(text + " ▌", language=None)
+            with st.spinner("🤖 AI ile prompt geliştiriliyor..."), profiler.phase("generate_prompt.enhance"):
                 enhanced_prompt, debug_info = enhance_prompt_with_gemini(
                     base_prompt, selected_char, art_style, 
-                    ai_creativity, max_tokens, enhancement_focus
+                    ai_creativity, max_tokens, enhancement_focus, similarity_threshold,
+                    on_chunk=on_chunk, patch_threshold=patch_threshold
                 )
                 detailed_prompt = enhanced_prompt
                 ai_enhanced = enhanced_prompt != base_prompt
+            live_preview.empty()
         else:
             detailed_prompt = base_prompt
             ai_enhanced = False
         
         # Ultra detaylı JSON
-        prompt_data = {
-            "metadata": {
-                "generator": "Neon Anime Prompt Generator v2.1",
-                "timestamp": st.session_state.get('timestamp', '2025-08-03'),
-                "version": "professional_ai_enhanced" if ai_enhanced else "professional",
-                "style_category": "cyberpunk_neon_anime",
-                "ai_enhanced": ai_enhanced,
-                "enhancement_model": "ai_model" if ai_enhanced else None
-            },
-            "character_details": {
-                "character_name": selected_char,
-                "origin_world": origin,
-                "personality": expression,
-                "visual_description": f"{expression} {selected_char} with intricate design details"
-            },
-            "visual_composition": {
-                "art_style": art_style,
-                "pose_description": selected_pose,
-                "lighting_system": lighting_type,
-                "background_setting": background_type,
-                "atmosphere": mood
-            },
-            "color_system": {
-                "palette_name": selected_palette,
-                "color_scheme": colors,
-                "glow_effects": "neon edges with luminescent outlines",
-                "contrast": "high contrast with vibrant saturation"
-            },
-            "technical_specifications": {
-                "quality_level": quality_level,
-                "visual_effects": effects,
-                "rendering_style": "photorealistic with anime aesthetics",
-                "resolution": "8K ultra HD",
-                "lighting_model": "ray-traced with volumetric rendering"
-            },
-            "dall_e_optimized_prompt": detailed_prompt,
-            "base_prompt": base_prompt if ai_enhanced else detailed_prompt,
-            "alternative_prompts": {
-                "short_version": f"{art_style}, {selected_char}, {selected_pose}, {colors}, {background_type}",
-                "midjourney_style": f"{selected_char} from {origin} :: {selected_pose} :: {colors} :: {lighting_type} :: anime style --ar 16:9 --niji",
-                "stable_diffusion": f"({quality_level}), {art_style}, {selected_char}, {origin}, {selected_pose}, {colors}, {lighting_type}, {background_type}"
-            },
-            "style_tags": [
-                "cyberpunk", "neon", "anime", "digital_art", "futuristic", 
-                "glowing_effects", "dramatic_lighting", "high_contrast", "professional_quality"
-            ],
-            "prompt_engineering_notes": {
-                "strength_keywords": ["masterpiece", "ultra detailed", "professional", "cinematic"],
-                "color_emphasis": "neon glow effects prioritized",
-                "composition_focus": "character-centered with dramatic lighting",
-                "style_consistency": "maintained anime aesthetic with cyberpunk elements"
-            }
-        }
+        with profiler.phase("generate_prompt.prompt_data"):
+            prompt_data = build_prompt_data(
+                selection, base_prompt, build_alternative_prompts(selection), detailed_prompt,
+                timestamp=st.session_state.get('timestamp', DEFAULT_TIMESTAMP)
+            )
         
         if ai_enhanced:
             st.success("✅ AI ile Geliştirilmiş Ultra Detaylı Prompt Oluşturuldu! 🤖")
@@ -662,6 +882,8 @@ def generate_prompt():
                             st.success("⚡ **Hızlı İşlem:** Cache kullanıldı")
                         elif api_status in ["Primary", "Fallback"]:
                             st.info("🔄 **Canlı İşlem:** API çağrısı yapıldı")
+                        elif api_status == "Coalesced":
+                            st.info("🤝 **Paylaşılan İşlem:** Aynı anda yapılan özdeş bir API çağrısının sonucu kullanıldı")
                         else:
                             st.warning("⚠️ **API Sorunu**")
                     
@@ -767,8 +989,11 @@ def generate_prompt():
                         st.code(f"""
 Model: ai-model
 API Used: {debug_info.get('api_used', 'Unknown')}
-Cache Hit: {debug_info.get('cache_hit', False)}
+Cache Hit: {debug_info.get('cache_hit', False)} ({debug_info.get('cache_type', '-')})
+Similarity: {debug_info.get('similarity', '-')} (patched slots: {debug_info.get('patched_slots', 0)})
+Coalesced: {debug_info.get('coalesced', False)}
 Processing Time: {debug_info.get('processing_time', 0):.3f}s
+First Chunk: {f"{debug_info['first_chunk_time']:.3f}s" if 'first_chunk_time' in debug_info else '-'}
                         """)
                     
                     with col2:
@@ -780,6 +1005,7 @@ Max Tokens: {settings.get('max_tokens', 200)}
 TopP: {min(0.95, settings.get('creativity', 0.8) + 0.1)}
 TopK: {int(40 * settings.get('creativity', 0.8))}
 Focus: {settings.get('focus', 'Unknown')}
+Streaming: {settings.get('streaming', False)}
                         """)
                     
                     with col3:
@@ -793,33 +1019,7 @@ Improvement: {((debug_info.get('enhanced_length', 0) / max(debug_info.get('origi
                     
                     # Show the actual prompt sent to AI
                     st.write("**📝 AI'a Gönderilen System Prompt:**")
-                    focus_prompts = {
-                        "Genel Artistik Kalite": "Focus on overall artistic quality, professional terminology, and visual impact",
-                        "Işık ve Atmosfer": "Focus on lighting effects, atmospheric elements, and mood enhancement",
-                        "Karakter Detayları": "Focus on character design, clothing details, and facial expressions",
-                        "Kompozisyon ve Açılar": "Focus on camera angles, composition, and visual perspective",
-                        "Malzeme ve Dokular": "Focus on materials, textures, surface details, and tactile qualities"
-                    }
-                    
-                    focus_desc = focus_prompts.get(settings.get('focus', ''), 'Unknown focus')
-                    system_prompt_display = f"""You are an expert AI art prompt engineer specializing in anime and digital art.
-
-TASK: Enhance the given prompt to be more artistic and detailed while maintaining all core elements.
-
-FOCUS: {focus_desc}
-
-ENHANCEMENT RULES:
-- Keep ALL original characters, settings, colors, and key descriptors
-- Add 5-10 high-impact artistic enhancement words/phrases
-- Use professional photography and digital art terminology
-- Enhance lighting, texture, and atmospheric details
-- Make descriptions more specific and vivid
-- Add technical quality indicators
-- Maintain the cyberpunk/neon anime aesthetic
-- DO NOT add explanations or meta-commentary
-- Return ONLY the enhanced prompt
-
-Original prompt to enhance:
+                    system_prompt_display = f"""{build_system_prompt(settings.get('focus', ''))}
 {base_prompt}"""
                     
                     st.code(system_prompt_display, language="text")
@@ -834,6 +1034,7 @@ def main():
     
     st.title("⚡ Neon Anime Prompt Generator")
     st.markdown("---")
+    metrics_exporters()
     
     # Sidebar menü
     with st.sidebar:
@@ -841,22 +1042,24 @@ def main():
         mode = st.radio("Mod Seç:", ["🎨 Prompt Oluştur", "➕ Öğe Ekle"])
     
     if mode == "➕ Öğe Ekle":
-        add_character()
+        with profiler.phase("add_character"):
+            add_character()
     else:
-        generate_prompt()
+        with profiler.phase("generate_prompt"):
+            generate_prompt()
     
     # Mevcut öğeleri göster
-    with st.sidebar:
+    with st.sidebar, profiler.phase("sidebar"):
         st.markdown("---")
         st.subheader("📊 Mevcut Öğeler")
-        st.write(f"🎭 Karakterler: {len(st.session_state.characters)}")
-        st.write(f"🤸 Pozlar: {len(st.session_state.poses)}")
-        st.write(f"🎨 Paletler: {len(st.session_state.color_palettes)}")
-        st.write(f"🎬 Art Styles: {len(st.session_state.art_styles)}")
-        st.write(f"💡 Lighting: {len(st.session_state.lighting_types)}")
-        st.write(f"🖼️ Backgrounds: {len(st.session_state.backgrounds)}")
-        st.write(f"😊 Moods: {len(st.session_state.moods)}")
-        st.write(f"😎 Expressions: {len(st.session_state.expressions)}")
+        st.write(f"🎭 Karakterler: {len(library_names('characters'))}")
+        st.write(f"🤸 Pozlar: {len(library_names('poses'))}")
+        st.write(f"🎨 Paletler: {len(library_names('color_palettes'))}")
+        st.write(f"🎬 Art Styles: {len(library_names('art_styles'))}")
+        st.write(f"💡 Lighting: {len(library_names('lighting_types'))}")
+        st.write(f"🖼️ Backgrounds: {len(library_names('backgrounds'))}")
+        st.write(f"😊 Moods: {len(library_names('moods'))}")
+        st.write(f"😎 Expressions: {len(library_names('expressions'))}")
         
         # Data management
         st.markdown("---")
@@ -879,18 +1082,32 @@ def main():
         
         # API Status
         st.markdown("---")
-        api_key_1 = st.secrets.get("GEMINI_API_KEY_1", "")
-        api_key_2 = st.secrets.get("GEMINI_API_KEY_2", "")
+        key_pool = get_key_pool()
         
-        if not api_key_1 and not api_key_2:
+        if not len(key_pool):
             st.subheader("🤖 AI API Durumu")
             st.error("❌ AI Enhancement disabled - No API keys configured")
+        else:
+            cache_stats = get_enhancement_cache().stats()
+            st.caption(f"⚡ AI Cache: {cache_stats['entries']} kayıt · "
+                       f"{cache_stats['hits']} tam + {cache_stats.get('similar_hits', 0)} benzer isabet / "
+                       f"{cache_stats['misses']} ıska")
+            for key in key_pool.snapshot():
+                state = {"closed": "🟢", "half_open": "🟡", "open": "🔴"}[key["state"]]
+                latency = "-" if key["latency_ms"] is None else f"{key['latency_ms']:.0f} ms"
+                retry = f" · {key['retry_in']:.0f} sn sonra" if key["retry_in"] else ""
+                st.caption(f"{state} Anahtar {key['key']}: {latency} · hata %{key['error_rate'] * 100:.0f}{retry}")
+        metrics_panel()
+        profiler_panel()
         
         # Detayları göster
         if st.checkbox("Detayları Göster"):
             st.write("**Karakterler:**")
-            for char, origin in st.session_state.characters.items():
-                st.write(f"• {char} → {origin}")
+            for char in library_names("characters"):
+                st.write(f"• {char} → {library_value('characters', char)}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    try:
+        main()
+    finally:
+        profiler.end()
\ No newline at end of file
@@ -0,0 +1,237 @@
+"""Batch prompt generation over the library.
+
+Enumerates the cartesian product of all categories (or a seeded random /
+stratified sample of it) lazily and streams prompt_data records to JSONL, so
+sweeps of millions of combinations run in constant memory.
+
+    python batch.py --mode product --output prompts.jsonl
+    python batch.py --mode random --limit 10000 --seed 42 --output sample.jsonl
+    python batch.py --mode stratified --stratify-by color_palettes --limit 400
+    python batch.py --mode weighted --rules rules.json --limit 1000000 --seed 7
+
+Weighted mode draws with replacement through sampler.PromptSampler, with
+per-value weights and excluded pairs from the --rules JSON file.
+"""
+import argparse
+import itertools
+import json
+import random
+import sys
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, TextIO
+
+from library import CATEGORIES, DATA_FILE
+from library_db import LIBRARY_DB, LibraryDB
+from library_store import LibraryStore
+from prompt_engine import DEFAULT_EFFECTS, QUALITY_LEVELS, PromptSelection, build_prompt, render_prompt_json
+from sampler import SAMPLER_RULES, PromptSampler, load_rules
+
+
+def category_options(library: Dict[str, Any]) -> List[List[str]]:
+    """Selectable values per category, in CATEGORIES order"""
+    return [list(library[category]) for category in CATEGORIES]
+
+
+def count_combinations(library: Dict[str, Any]) -> int:
+    """Size of the full cartesian product"""
+    total = 1
+    for options in category_options(library):
+        total *= len(options)
+    return total
+
+
+def _decode_index(index: int, radices: Sequence[int]) -> List[int]:
+    """Mixed-radix decode; the last category varies fastest like itertools.product"""
+    digits = [0] * len(radices)
+    for pos in range(len(radices) - 1, -1, -1):
+        index, digits[pos] = divmod(index, radices[pos])
+    return digits
+
+
+def _make_selection(library: Dict[str, Any], values: Sequence[str], quality: str,
+                    effects: Sequence[str]) -> PromptSelection:
+    character, pose, palette, art_style, lighting, background, mood, expression = values
+    return PromptSelection(
+        character=character,
+        origin=library["characters"][character],
+        pose=pose,
+        palette_name=palette,
+        colors=library["color_palettes"][palette],
+        art_style=art_style,
+        lighting=lighting,
+        background=background,
+        mood=mood,
+        expression=expression,
+        quality=quality,
+        effects=tuple(effects)
+    )
+
+
+def iter_product(library: Dict[str, Any], start: int = 0, stop: Optional[int] = None,
+                 quality: str = QUALITY_LEVELS[0],
+                 effects: Sequence[str] = DEFAULT_EFFECTS) -> Iterator[PromptSelection]:
+    """Lazily yield every combination with index in [start, stop)"""
+    options = category_options(library)
+    radices = [len(values) for values in options]
+    total = count_combinations(library)
+    stop = total if stop is None else min(stop, total)
+    for index in range(start, stop):
+        digits = _decode_index(index, radices)
+        values = [options[pos][digit] for pos, digit in enumerate(digits)]
+        yield _make_selection(library, values, quality, effects)
+
+
+def _permuted_indices(total: int, rng: random.Random, rounds: int = 4) -> Iterator[int]:
+    """Every index in range(total) once, in a seeded pseudo-random order, in constant memory.
+
+    A Feistel network keyed from rng (multiply-shift round functions) is a
+    bijection on the smallest even-width bit domain covering total (less than
+    4 * total values); walking a counter through it and dropping outputs
+    >= total leaves a permutation of range(total).
+    """
+    half = max(1, ((total - 1).bit_length() + 1) // 2)
+    mask = (1 << half) - 1
+    keys = [(rng.getrandbits(half), rng.getrandbits(2 * half) | 1) for _ in range(rounds)]
+    for counter in range(1 << (2 * half)):
+        left, right = counter >> half, counter & mask
+        for xor, multiplier in keys:
+            left, right = right, left ^ (((right ^ xor) * multiplier >> half) & mask)
+        index = (left << half) | right
+        if index < total:
+            yield index
+
+
+def iter_random(library: Dict[str, Any], limit: int, seed: Optional[int] = None,
+                unique: bool = True, quality: str = QUALITY_LEVELS[0],
+                effects: Sequence[str] = DEFAULT_EFFECTS) -> Iterator[PromptSelection]:
+    """Seeded random sample of the product.
+
+    With unique=True combinations are drawn without replacement from a lazy
+    pseudo-random permutation of the product, so memory stays constant even
+    when limit covers the whole product.
+    """
+    rng = random.Random(seed)
+    options = category_options(library)
+    radices = [len(values) for values in options]
+    total = count_combinations(library)
+    if total == 0:
+        return
+    if unique:
+        indices: Iterable[int] = _permuted_indices(total, rng)
+        if limit < total:  # islice needs a stop that fits in a machine word
+            indices = itertools.islice(indices, limit)
+    else:
+        indices = (rng.randrange(total) for _ in range(limit))
+    for index in indices:
+        digits = _decode_index(index, radices)
+        values = [options[pos][digit] for pos, digit in enumerate(digits)]
+        yield _make_selection(library, values, quality, effects)
+
+
+def iter_stratified(library: Dict[str, Any], limit: int, stratify_by: str = "characters",
+                    seed: Optional[int] = None, quality: str = QUALITY_LEVELS[0],
+                    effects: Sequence[str] = DEFAULT_EFFECTS) -> Iterator[PromptSelection]:
+    """Seeded sample with every value of stratify_by equally represented.
+
+    Strata are visited round-robin; the other categories are drawn uniformly.
+    """
+    if stratify_by not in CATEGORIES:
+        raise ValueError(f"Unknown category: {stratify_by}")
+    rng = random.Random(seed)
+    options = category_options(library)
+    if any(not values for values in options):
+        return
+    strata_pos = CATEGORIES.index(stratify_by)
+    strata = options[strata_pos]
+    for n in range(limit):
+        values = [rng.choice(values) for values in options]
+        values[strata_pos] = strata[n % len(strata)]
+        yield _make_selection(library, values, quality, effects)
+
+
+def iter_records(selections: Iterable[PromptSelection]) -> Iterator[Dict[str, Any]]:
+    """Turn selections into prompt_data records"""
+    for selection in selections:
+        yield build_prompt(selection).prompt_data
+
+
+def iter_json_records(selections: Iterable[PromptSelection]) -> Iterator[str]:
+    """prompt_data records as JSON text, rendered from the compiled template without building dicts"""
+    for selection in selections:
+        yield render_prompt_json(selection)
+
+
+def write_lines(lines: Iterable[str], out: TextIO) -> int:
+    """Stream pre-serialized records to an open text file, one per line"""
+    count = 0
+    for line in lines:
+        out.write(line)
+        out.write("\n")
+        count += 1
+    return count
+
+
+def write_jsonl(records: Iterable[Dict[str, Any]], out: TextIO) -> int:
+    """Stream records to an open text file, one JSON document per line"""
+    count = 0
+    for record in records:
+        out.write(json.dumps(record, ensure_ascii=False))
+        out.write("\n")
+        count += 1
+    return count
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Generate prompt datasets from the library")
+    parser.add_argument("--data", default=DATA_FILE, help="library JSON file (defaults are used if missing)")
+    parser.add_argument("--db", default=LIBRARY_DB or None, help="SQLite library (overrides --data)")
+    parser.add_argument("--mode", choices=["product", "random", "stratified", "weighted"], default="product")
+    parser.add_argument("--limit", type=int, default=None, help="maximum number of records")
+    parser.add_argument("--start", type=int, default=0, help="first product index (product mode)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--with-replacement", action="store_true", help="allow repeats in random mode")
+    parser.add_argument("--rules", default=SAMPLER_RULES, help="weights and exclusions JSON file (weighted mode)")
+    parser.add_argument("--stratify-by", choices=CATEGORIES, default="characters")
+    parser.add_argument("--quality", default=QUALITY_LEVELS[0])
+    parser.add_argument("--effect", action="append", dest="effects", help="visual effect (repeatable)")
+    parser.add_argument("--output", "-o", default="-", help="output JSONL path, '-' for stdout")
+    parser.add_argument("--count", action="store_true", help="only print the number of combinations")
+    args = parser.parse_args(argv)
+
+    library = LibraryDB(args.db).as_library() if args.db else LibraryStore(args.data).read()
+    total = count_combinations(library)
+    if args.count:
+        print(total)
+        return 0
+
+    effects = DEFAULT_EFFECTS if args.effects is None else args.effects
+    if args.mode == "product":
+        stop = None if args.limit is None else args.start + args.limit
+        selections = iter_product(library, args.start, stop, args.quality, effects)
+    elif args.mode == "random":
+        limit = total if args.limit is None else args.limit
+        selections = iter_random(library, limit, args.seed, not args.with_replacement,
+                                 args.quality, effects)
+    elif args.mode == "weighted":
+        try:
+            sampler = PromptSampler.from_library(library, load_rules(args.rules), args.seed)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+        if args.limit is None:
+            parser.error("--limit is required in weighted mode")
+        selections = sampler.selections(args.limit, args.quality, effects)
+    else:
+        limit = len(library[args.stratify_by]) if args.limit is None else args.limit
+        selections = iter_stratified(library, limit, args.stratify_by, args.seed,
+                                     args.quality, effects)
+
+    if args.output == "-":
+        written = write_lines(iter_json_records(selections), sys.stdout)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            written = write_lines(iter_json_records(selections), f)
+    print(f"{written} / {total} records written", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
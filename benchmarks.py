@@ -0,0 +1,301 @@
+"""Offline benchmark suite.
+
+Measures prompt assembly, library load/save at several sizes, enhancement
+cache lookups and end-to-end enhancement throughput against the local
+Gemini stub (stub_server; latency, jitter and error rate are configurable).
+Inputs are seeded, so two runs on the same machine measure the same work.
+Results are written as JSON; --compare prints the change against an
+earlier run.
+
+    python benchmarks.py -o before.json
+    python benchmarks.py -o after.json --compare before.json
+    python benchmarks.py --only render,cache --quick
+    python benchmarks.py --only enhancement --latency 0.2 --error-rate 0.05 --concurrency 1,16,64
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from cache_keys import enhancement_key, index_partition
+from enhancement_cache import EnhancementCache
+from enhancement_pool import EnhancementPool
+from gemini import DEFAULT_FOCUS, DEFAULT_MODEL
+from http_client import HTTP2_AVAILABLE, percentiles
+from library import CATEGORIES, DEFAULT_LIBRARY, MAPPING_CATEGORIES, freeze_library
+from library_db import LibraryDB
+from library_store import LibraryStore
+from near_duplicate import NearDuplicateIndex
+from prompt_engine import PromptSelection, build_base_prompt, build_prompt, render_prompt_json
+from sampler import PromptSampler
+from stub_server import StubGeminiServer
+
+SECTIONS = ("render", "library", "cache", "enhancement")
+LIBRARY_SIZES = (100, 1000, 10000, 100000)
+CONCURRENCY = (1, 4, 16, 64)
+QUICK = dict(selections=2000, sizes=(100, 1000), entries=200, requests=40, concurrency=(1, 8))
+
+
+def _selections(n: int, seed: int) -> List[PromptSelection]:
+    return list(PromptSampler.from_library(freeze_library(DEFAULT_LIBRARY), seed=seed).selections(n))
+
+
+def _rate(fn: Callable[[PromptSelection], Any], selections: Sequence[PromptSelection],
+          repeat: int = 3) -> float:
+    """Calls per second over all selections, best of repeat"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for sel in selections:
+            fn(sel)
+        best = min(best, time.perf_counter() - start)
+    return len(selections) / best
+
+
+def _median_ms(fn: Callable[[], Any], repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples)["p50_ms"]
+
+
+def bench_render(selections: int, seed: int) -> Dict[str, Any]:
+    """Prompts assembled per second"""
+    sample = _selections(selections, seed)
+    return {
+        "selections": selections,
+        "base_prompt_per_s": _rate(build_base_prompt, sample),
+        "build_prompt_per_s": _rate(build_prompt, sample),
+        "prompt_json_per_s": _rate(render_prompt_json, sample),
+    }
+
+
+def _synthetic_items(size: int) -> Iterator[Tuple[str, str, Optional[str]]]:
+    """size distinct items spread over all categories"""
+    for i in range(size):
+        category = CATEGORIES[i % len(CATEGORIES)]
+        yield category, f"{category} benchmark item {i}", (
+            f"benchmark description {i}" if category in MAPPING_CATEGORIES else None)
+
+
+def bench_library(sizes: Sequence[int], repeat: int = 5) -> Dict[str, Any]:
+    """Load, save and single-add time of the JSON store and the SQLite library per size"""
+    results: Dict[str, Any] = {"json": {}, "sqlite": {}}
+    for size in sizes:
+        with tempfile.TemporaryDirectory(prefix="bench-library-") as directory:
+            path = os.path.join(directory, "library.json")
+            store = LibraryStore(path, compact_bytes=sys.maxsize)
+            start = time.perf_counter()
+            store.add_items(_synthetic_items(size))
+            import_ms = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            store.compact()
+            save_ms = (time.perf_counter() - start) * 1000
+            added = iter(range(repeat))
+
+            def add_one():
+                store.add("poses", f"added pose {next(added)}")
+                store.read()
+
+            store.read()
+            results["json"][str(size)] = {
+                "import_ms": import_ms,
+                "save_ms": save_ms,
+                "load_ms": _median_ms(lambda: LibraryStore(path).read(), repeat),
+                "add_ms": _median_ms(add_one, repeat),
+                "file_bytes": os.path.getsize(path),
+            }
+
+            db_path = os.path.join(directory, "library.sqlite3")
+            db = LibraryDB(db_path)
+            start = time.perf_counter()
+            db.add_items(_synthetic_items(size))
+            import_ms = (time.perf_counter() - start) * 1000
+            added = iter(range(repeat))
+
+            def db_add_one():
+                db.add("poses", f"added pose {next(added)}")
+                db.names("poses")
+
+            results["sqlite"][str(size)] = {
+                "import_ms": import_ms,
+                "load_ms": _median_ms(lambda: LibraryDB(db_path).as_library(), repeat),
+                "add_ms": _median_ms(db_add_one, repeat),
+            }
+        print(f"library: {size} items done", file=sys.stderr)
+    return results
+
+
+def bench_cache(entries: int, seed: int) -> Dict[str, Any]:
+    """Latency of exact-cache hits, misses and writes, and of similarity lookups"""
+    prompts = [build_base_prompt(sel) for sel in _selections(entries * 2, seed)]
+    stored, novel = prompts[:entries], prompts[entries:]
+    key = lambda prompt: enhancement_key(prompt, DEFAULT_MODEL, 0.8, 200, DEFAULT_FOCUS)
+    partition = index_partition(DEFAULT_MODEL, DEFAULT_FOCUS)
+    with tempfile.TemporaryDirectory(prefix="bench-cache-") as directory:
+        cache = EnhancementCache(os.path.join(directory, "cache.sqlite3"))
+        index = NearDuplicateIndex()
+        writes, hits, misses, lookups = [], [], [], []
+        for prompt in stored:
+            start = time.perf_counter()
+            cache.set(key(prompt), prompt + ", enhanced", prompt, partition)
+            writes.append(time.perf_counter() - start)
+            index.add(key(prompt), prompt, prompt + ", enhanced", partition)
+        for prompt in stored:
+            start = time.perf_counter()
+            cache.get(key(prompt))
+            hits.append(time.perf_counter() - start)
+        similar = 0
+        for prompt in novel:
+            start = time.perf_counter()
+            cache.get(key(prompt) + "-missing")
+            misses.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            similar += index.lookup(prompt, partition) is not None
+            lookups.append(time.perf_counter() - start)
+    return {
+        "entries": entries,
+        "set": percentiles(writes),
+        "hit": percentiles(hits),
+        "miss": percentiles(misses),
+        "similarity_lookup": percentiles(lookups),
+        "similarity_hit_ratio": similar / len(novel),
+    }
+
+
+def bench_enhancement(levels: Sequence[int], requests: int, seed: int, latency: float,
+                      jitter: float, error_rate: float, batch_size: int = 1) -> Dict[str, Any]:
+    """Throughput and latency of EnhancementPool against the stub per concurrency level"""
+    prompts = [build_base_prompt(sel) for sel in _selections(requests, seed)]
+    results: Dict[str, Any] = {}
+    with StubGeminiServer(latency=latency, jitter=jitter, error_rate=error_rate, seed=seed) as stub:
+        for level in levels:
+            with EnhancementPool(["bench-key-1", "bench-key-2"], max_in_flight=level,
+                                 base_url=stub.base_url, batch_size=batch_size) as pool:
+                start = time.perf_counter()
+                done = list(pool.imap(prompts, ordered=False))
+                wall = time.perf_counter() - start
+            errors = sum(1 for result in done if result.error)
+            results[f"c{level}"] = {
+                "concurrency": level,
+                "requests": len(done),
+                "errors": errors,
+                "throughput_per_s": len(done) / wall,
+                **percentiles([result.elapsed for result in done]),
+            }
+            print(f"enhancement: concurrency {level} done", file=sys.stderr)
+        results["stub"] = {"latency": latency, "jitter": jitter, "error_rate": error_rate,
+                           "requests_seen": stub.config.requests}
+    return results
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment() -> Dict[str, Any]:
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": importlib.util.find_spec("numpy") is not None,
+        "http2": HTTP2_AVAILABLE,
+    }
+
+
+def flatten(results: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    """Numeric leaves as dotted paths ("library.json.1000.load_ms")"""
+    flat: Dict[str, float] = {}
+    for name, value in results.items():
+        path = f"{prefix}{name}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, path + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any]) -> List[str]:
+    """One line per metric present in both runs, with the relative change"""
+    before, after = flatten(baseline["results"]), flatten(current["results"])
+    lines = []
+    for path in sorted(before.keys() & after.keys()):
+        old, new = before[path], after[path]
+        change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+        lines.append(f"{path:48s} {old:14.3f} {new:14.3f} {change:>9s}")
+    return lines
+
+
+def _levels(text: str) -> Tuple[int, ...]:
+    return tuple(int(part) for part in text.split(",") if part)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run the offline benchmark suite")
+    parser.add_argument("--output", "-o", default="-", help="results JSON path, '-' for stdout")
+    parser.add_argument("--only", default=",".join(SECTIONS), help=f"comma-separated subset of {','.join(SECTIONS)}")
+    parser.add_argument("--quick", action="store_true", help="small sizes, for a fast smoke run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--selections", type=int, default=20000, help="selections rendered per repeat")
+    parser.add_argument("--sizes", type=_levels, default=LIBRARY_SIZES, help="library sizes, e.g. 100,1000")
+    parser.add_argument("--entries", type=int, default=2000, help="cache entries")
+    parser.add_argument("--requests", type=int, default=400, help="enhancements per concurrency level")
+    parser.add_argument("--concurrency", type=_levels, default=CONCURRENCY, help="levels, e.g. 1,16,64")
+    parser.add_argument("--batch-size", type=int, default=1, help="prompts per enhancement request")
+    parser.add_argument("--latency", type=float, default=0.05, help="stub seconds per request")
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of stub requests failing")
+    parser.add_argument("--compare", metavar="BASELINE", help="earlier results JSON to compare against")
+    args = parser.parse_args(argv)
+
+    sections = [section for section in args.only.split(",") if section]
+    unknown = set(sections) - set(SECTIONS)
+    if unknown:
+        parser.error(f"unknown sections: {', '.join(sorted(unknown))}")
+    if args.quick:
+        for name, value in QUICK.items():
+            if getattr(args, name) == parser.get_default(name):
+                setattr(args, name, value)
+
+    results: Dict[str, Any] = {}
+    if "render" in sections:
+        results["render"] = bench_render(args.selections, args.seed)
+    if "library" in sections:
+        results["library"] = bench_library(args.sizes)
+    if "cache" in sections:
+        results["cache"] = bench_cache(args.entries, args.seed)
+    if "enhancement" in sections:
+        results["enhancement"] = bench_enhancement(args.concurrency, args.requests, args.seed, args.latency,
+                                                   args.jitter, args.error_rate, args.batch_size)
+    report = {"environment": environment(), "settings": vars(args), "results": results}
+
+    text = json.dumps(report, indent=2)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        for line in compare(baseline, report):
+            print(line, file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+"""Canonical, versioned cache keys for enhancement results.
+
+Keys are a BLAKE2b digest of the full normalized request, so they are the
+same in every process and across restarts (unlike the salted built-in
+hash()) and never collide on a shared prefix. Bump KEY_SCHEMA_VERSION when
+normalization or the request fields change; old entries then simply stop
+matching and age out of the cache.
+"""
+import hashlib
+import json
+import re
+import unicodedata
+from typing import Any, Dict
+
+KEY_SCHEMA_VERSION = 1
+
+_WHITESPACE = re.compile(r"\s+")
+_COMMA = re.compile(r"\s*,\s*")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """NFC, collapsed whitespace and uniform comma spacing; case is preserved"""
+    text = unicodedata.normalize("NFC", prompt)
+    text = _WHITESPACE.sub(" ", text).strip()
+    return _COMMA.sub(", ", text)
+
+
+def canonical_request(prompt: str, model: str, creativity: float, max_tokens: int,
+                      focus: str) -> Dict[str, Any]:
+    """Everything that determines an enhancement, in normalized form"""
+    return {
+        "v": KEY_SCHEMA_VERSION,
+        "prompt": normalize_prompt(prompt),
+        "model": model,
+        "temperature": round(float(creativity), 2),
+        "max_tokens": int(max_tokens),
+        "focus": focus
+    }
+
+
+def _digest(kind: str, payload: Dict[str, Any]) -> str:
+    encoded = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    digest = hashlib.blake2b(encoded.encode("utf-8"), digest_size=20).hexdigest()
+    return f"{kind}:v{KEY_SCHEMA_VERSION}:{digest}"
+
+
+def enhancement_key(prompt: str, model: str, creativity: float, max_tokens: int,
+                    focus: str) -> str:
+    """Exact key: same prompt and same generation settings"""
+    return _digest("enh", canonical_request(prompt, model, creativity, max_tokens, focus))
+
+
+def index_partition(model: str, focus: str) -> str:
+    """Bucket for near-duplicate lookups: results are only reused for the same model and focus"""
+    return f"v{KEY_SCHEMA_VERSION}:{model}:{focus}"
@@ -0,0 +1,162 @@
+"""Durable on-disk cache for AI enhancement results.
+
+SQLite in WAL mode so several Streamlit processes and batch workers can
+share one file. Entries expire after a TTL and the least recently used ones
+are evicted once the cache grows past max_entries. Hit/miss counters are
+stored in the same file so they aggregate across processes. Keys come from
+cache_keys so they are identical in every process.
+"""
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+CACHE_FILE = os.environ.get("PROMPT_CACHE_PATH", "prompt_generator_cache.sqlite3")
+DEFAULT_TTL = 86400  # 24 hours, same as the old st.cache_data TTL
+DEFAULT_MAX_ENTRIES = 50000
+# Size is enforced every this many writes per process rather than on every insert
+EVICT_EVERY = 64
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    prompt TEXT,
+    partition TEXT,
+    value TEXT NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries(accessed);
+CREATE INDEX IF NOT EXISTS entries_created ON entries(created);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+class EnhancementCache:
+    """Process- and thread-safe LRU + TTL cache backed by a SQLite file"""
+
+    def __init__(self, path: str = CACHE_FILE, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 ttl: float = DEFAULT_TTL):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(entries)")}
+        if columns and "partition" not in columns:
+            # Files created before similarity lookups existed
+            conn.execute("ALTER TABLE entries ADD COLUMN partition TEXT")
+        conn.executescript(_SCHEMA)
+        self.evict()
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _bump(self, conn: sqlite3.Connection, name: str):
+        conn.execute("INSERT INTO counters(name, value) VALUES(?, 1) "
+                     "ON CONFLICT(name) DO UPDATE SET value = value + 1", (name,))
+
+    def get(self, key: str) -> Optional[str]:
+        """Cached value or None; refreshes the entry's LRU position on a hit"""
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT value, created FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] > self.ttl:
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self._bump(conn, "misses")
+                value = None
+            else:
+                conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+                self._bump(conn, "hits")
+                value = row[0]
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return value
+
+    def contains(self, key: str) -> bool:
+        """Whether a live entry exists, without counting a lookup or touching its LRU position"""
+        row = self._conn().execute("SELECT created FROM entries WHERE key = ?", (key,)).fetchone()
+        return row is not None and time.time() - row[0] <= self.ttl
+
+    def set(self, key: str, value: str, prompt: Optional[str] = None,
+            partition: Optional[str] = None):
+        """Store a value; prompt and partition are kept for similarity lookups"""
+        conn = self._conn()
+        now = time.time()
+        conn.execute("INSERT INTO entries(key, prompt, partition, value, created, accessed) "
+                     "VALUES(?, ?, ?, ?, ?, ?) "
+                     "ON CONFLICT(key) DO UPDATE SET prompt = excluded.prompt, "
+                     "partition = excluded.partition, value = excluded.value, "
+                     "created = excluded.created, accessed = excluded.accessed",
+                     (key, prompt, partition, value, now, now))
+        with self._writes_lock:
+            self._writes += 1
+            due = self._writes % EVICT_EVERY == 0
+        if due:
+            self.evict()
+
+    def entries_since(self, created_after: float) -> List[Tuple[str, str, str, str, float]]:
+        """(key, prompt, partition, value, created) of entries written after a timestamp"""
+        return self._conn().execute(
+            "SELECT key, prompt, partition, value, created FROM entries "
+            "WHERE created > ? AND prompt IS NOT NULL ORDER BY created", (created_after,)).fetchall()
+
+    def record(self, name: str):
+        """Increment a shared counter (e.g. hits on another cache tier)"""
+        self._bump(self._conn(), name)
+
+    def evict(self) -> int:
+        """Drop expired entries, then the least recently used beyond max_entries"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            removed = conn.execute("DELETE FROM entries WHERE created < ?",
+                                   (time.time() - self.ttl,)).rowcount
+            removed += conn.execute(
+                "DELETE FROM entries WHERE key IN ("
+                "SELECT key FROM entries ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)).rowcount
+            if removed:
+                conn.execute("INSERT INTO counters(name, value) VALUES('evictions', ?) "
+                             "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                             (removed,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return removed
+
+    def stats(self) -> Dict[str, int]:
+        """Entry count plus hit/miss/eviction counters shared by all processes"""
+        conn = self._conn()
+        stats = {"hits": 0, "misses": 0, "evictions": 0}
+        stats.update(dict(conn.execute("SELECT name, value FROM counters").fetchall()))
+        stats["entries"] = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return stats
+
+    def clear(self):
+        conn = self._conn()
+        conn.execute("DELETE FROM entries")
+        conn.execute("DELETE FROM counters")
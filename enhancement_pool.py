@@ -0,0 +1,281 @@
+"""Concurrent AI enhancement for batch jobs.
+
+A thread pool with a bounded number of in-flight requests and a token-bucket
+rate limit per API key. Each request goes to the healthiest key (see
+key_pool). With batch_size > 1 several prompts share one request and its
+system prompt. Results can be consumed in input order or as they complete.
+
+    GEMINI_API_KEY_1=... python enhancement_pool.py -i prompts.jsonl -o enhanced.jsonl --concurrency 16
+    GEMINI_API_KEY_1=... python enhancement_pool.py -i prompts.jsonl --batch-size 8 -o enhanced.jsonl
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple, TypeVar
+
+from gemini import (
+    DEFAULT_FOCUS, DEFAULT_MODEL, MAX_OUTPUT_TOKENS, REQUEST_TIMEOUT, GeminiError, GeminiResponseError,
+    generate_batch, generate_content
+)
+from http_client import TimeoutSpec
+from key_pool import KeyPool, keys_from
+from metrics import FALLBACKS, start_exporters
+
+T = TypeVar("T")
+
+
+class RateLimiter:
+    """Token bucket allowing `rate` calls per second with bursts up to `burst`"""
+
+    def __init__(self, rate: Optional[float], burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate or 1.0)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> float:
+        """Take a token if available; returns 0, or the seconds until one will be"""
+        if self.rate is None:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return 0.0
+            return (1.0 - self._tokens) / self.rate
+
+
+class EnhancementResult(NamedTuple):
+    index: int
+    prompt: str
+    enhanced: Optional[str]
+    key_index: Optional[int]
+    error: Optional[str]
+    elapsed: float
+
+
+class EnhancementPool:
+    """Enhance many prompts concurrently across one or more API keys"""
+
+    def __init__(self, api_keys: Sequence[str], max_in_flight: int = 8,
+                 rate_per_key: Optional[float] = None, burst: Optional[float] = None,
+                 creativity: float = 0.8, max_tokens: int = 200, focus: str = DEFAULT_FOCUS,
+                 model: str = DEFAULT_MODEL, base_url: Optional[str] = None,
+                 timeout: TimeoutSpec = REQUEST_TIMEOUT, batch_size: int = 1):
+        self.api_keys = [key for key in api_keys if key]
+        if not self.api_keys:
+            raise ValueError("At least one API key is required")
+        self.max_in_flight = max_in_flight
+        self.batch_size = max(1, min(batch_size, MAX_OUTPUT_TOKENS // max(1, max_tokens)))
+        # Batched requests sent, and items that had to be retried on their own
+        self.batch_stats = {"requests": 0, "retried": 0}
+        self._stats_lock = threading.Lock()
+        self.limiters = [RateLimiter(rate_per_key, burst) for _ in self.api_keys]
+        self.key_pool = KeyPool(self.api_keys)
+        self.settings = dict(creativity=creativity, max_tokens=max_tokens, focus=focus,
+                             model=model, base_url=base_url, timeout=timeout)
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight,
+                                            thread_name_prefix="enhance")
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+
+    def _acquire_key(self, tried: Sequence[int]) -> Optional[int]:
+        """Block until the healthiest untried key has rate budget and a closed circuit;
+        None once every key has been tried"""
+        while True:
+            key_index, wait_time = self.key_pool.acquire(
+                tried, admit=lambda i: self.limiters[i].try_acquire())
+            if key_index is not None or wait_time == 0.0:
+                return key_index
+            time.sleep(wait_time)
+
+    def _call(self, request: Callable[[str], T]) -> Tuple[Optional[T], Optional[int], Optional[str]]:
+        """Run request(api_key) on the healthiest keys until one succeeds: (value, key_index, error)"""
+        tried: List[int] = []
+        error = "No API key available"
+        # Each key is tried at most once; a failing key falls straight through to the next
+        while True:
+            key_index = self._acquire_key(tried)
+            if key_index is None:
+                return None, None, error
+            tried.append(key_index)
+            if len(tried) > 1:
+                FALLBACKS.inc(reason="next_key")
+            call_start = time.perf_counter()
+            try:
+                value = request(self.api_keys[key_index])
+            except GeminiResponseError as e:
+                # The key worked; the payload did not (e.g. unparseable batch output)
+                self.key_pool.record_success(key_index, time.perf_counter() - call_start)
+                return None, key_index, str(e)
+            except GeminiError as e:
+                self.key_pool.record_failure(key_index, e.status, e.retry_after)
+                error = str(e)
+                continue
+            except BaseException:
+                self.key_pool.release(key_index)
+                raise
+            self.key_pool.record_success(key_index, time.perf_counter() - call_start)
+            return value, key_index, None
+
+    def _enhance(self, index: int, prompt: str) -> EnhancementResult:
+        start = time.perf_counter()
+        enhanced, key_index, error = self._call(
+            lambda api_key: generate_content(prompt, api_key, **self.settings))
+        if not enhanced:
+            FALLBACKS.inc(reason="unenhanced")
+        return EnhancementResult(index, prompt, enhanced, key_index if enhanced else None,
+                                 None if enhanced else error, time.perf_counter() - start)
+
+    def _enhance_batch(self, items: Sequence[Tuple[int, str]]) -> List[EnhancementResult]:
+        """One request for all items; any item missing from the answer is retried on its own"""
+        if len(items) == 1:
+            return [self._enhance(*items[0])]
+        start = time.perf_counter()
+        prompts = [prompt for _, prompt in items]
+        enhanced, key_index, error = self._call(
+            lambda api_key: generate_batch(prompts, api_key, **self.settings))
+        if enhanced is None and key_index is None:
+            # Every key refused the request itself; single calls would fail the same way
+            FALLBACKS.inc(len(items), reason="unenhanced")
+            return [EnhancementResult(index, prompt, None, None, error, time.perf_counter() - start)
+                    for index, prompt in items]
+        with self._stats_lock:
+            self.batch_stats["requests"] += 1
+        results = []
+        for position, (index, prompt) in enumerate(items):
+            text = enhanced[position] if enhanced else None
+            if text:
+                results.append(EnhancementResult(index, prompt, text, key_index, None,
+                                                 time.perf_counter() - start))
+            else:
+                with self._stats_lock:
+                    self.batch_stats["retried"] += 1
+                results.append(self._enhance(index, prompt))
+        return results
+
+    def _schedule(self, fn: Callable[..., T], *args) -> "Future[T]":
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def submit(self, prompt: str, index: int = 0) -> "Future[EnhancementResult]":
+        """Schedule one prompt; blocks while max_in_flight requests are outstanding"""
+        return self._schedule(self._enhance, index, prompt)
+
+    def submit_batch(self, items: Sequence[Tuple[int, str]]) -> "Future[List[EnhancementResult]]":
+        """Schedule (index, prompt) pairs as one batched request"""
+        return self._schedule(self._enhance_batch, list(items))
+
+    def imap(self, prompts: Iterable[str], ordered: bool = True) -> Iterator[EnhancementResult]:
+        """Enhance a (possibly lazy) stream of prompts.
+
+        Prompts are packed batch_size to a request. At most max_in_flight
+        requests' worth of prompts are pulled from the input ahead of the
+        consumer. ordered=False yields results as they complete.
+        """
+        pending: Deque[Future] = deque()
+        batch: List[Tuple[int, str]] = []
+        for item in enumerate(prompts):
+            batch.append(item)
+            if len(batch) < self.batch_size:
+                continue
+            if len(pending) >= self.max_in_flight:
+                yield from self._drain(pending, ordered, block_until=self.max_in_flight - 1)
+            pending.append(self.submit_batch(batch))
+            batch = []
+        if batch:
+            pending.append(self.submit_batch(batch))
+        yield from self._drain(pending, ordered, block_until=0)
+
+    def _drain(self, pending: Deque[Future], ordered: bool,
+               block_until: int) -> Iterator[EnhancementResult]:
+        while len(pending) > block_until:
+            if ordered:
+                yield from pending.popleft().result()
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+                    yield from future.result()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self) -> "EnhancementPool":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Enhance a JSONL file of prompts concurrently")
+    parser.add_argument("--input", "-i", default="-", help="JSONL from batch.py, '-' for stdin")
+    parser.add_argument("--output", "-o", default="-", help="output JSONL, '-' for stdout")
+    parser.add_argument("--field", default="base_prompt", help="record field holding the prompt")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate-per-key", type=float, default=None, help="requests/second per key")
+    parser.add_argument("--unordered", action="store_true", help="write results as they complete")
+    parser.add_argument("--batch-size", type=int, default=1, help="prompts packed into one request")
+    parser.add_argument("--creativity", type=float, default=0.8)
+    parser.add_argument("--max-tokens", type=int, default=200)
+    parser.add_argument("--focus", default=DEFAULT_FOCUS)
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--base-url", default=None)
+    args = parser.parse_args(argv)
+
+    start_exporters()
+    api_keys = keys_from(os.environ)
+    src = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    dst = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    # Only records still in flight are held in memory
+    records: Dict[int, dict] = {}
+
+    def prompts() -> Iterator[str]:
+        lines = (line for line in src if line.strip())
+        for index, line in enumerate(lines):
+            record = json.loads(line)
+            records[index] = record
+            yield record[args.field]
+
+    written = failures = 0
+    try:
+        with EnhancementPool(api_keys, args.concurrency, args.rate_per_key,
+                             creativity=args.creativity, max_tokens=args.max_tokens,
+                             focus=args.focus, model=args.model, base_url=args.base_url,
+                             batch_size=args.batch_size) as pool:
+            for result in pool.imap(prompts(), ordered=not args.unordered):
+                record = records.pop(result.index)
+                record["enhanced_prompt"] = result.enhanced
+                if result.error:
+                    record["enhancement_error"] = result.error
+                    failures += 1
+                dst.write(json.dumps(record, ensure_ascii=False) + "\n")
+                written += 1
+    finally:
+        if src is not sys.stdin:
+            src.close()
+        if dst is not sys.stdout:
+            dst.close()
+    print(f"{written} prompts enhanced, {failures} failed", file=sys.stderr)
+    if args.batch_size > 1:
+        print(f"{pool.batch_stats['requests']} batched requests, "
+              f"{pool.batch_stats['retried']} items retried individually", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
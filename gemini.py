@@ -0,0 +1,360 @@
+"""Gemini generateContent API layer (no Streamlit dependency)"""
+import json
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from http_client import AsyncHttpClient, HttpResponse, TimeoutSpec, TransportError, get_client
+from metrics import API_IN_FLIGHT, API_LATENCY, API_REQUESTS, API_TOKENS, key_label
+
+DEFAULT_MODEL = "gemini-1.5-flash"
+DEFAULT_FOCUS = "Genel Artistik Kalite"
+# Overridable so batch jobs and benchmarks can point at a local stub server
+API_BASE_URL = os.environ.get("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta")
+# None means the client defaults (GEMINI_CONNECT_TIMEOUT / GEMINI_READ_TIMEOUT)
+REQUEST_TIMEOUT: TimeoutSpec = None
+
+FOCUS_PROMPTS = {
+    "Genel Artistik Kalite": "Focus on overall artistic quality, professional terminology, and visual impact",
+    "Işık ve Atmosfer": "Focus on lighting effects, atmospheric elements, and mood enhancement",
+    "Karakter Detayları": "Focus on character design, clothing details, and facial expressions",
+    "Kompozisyon ve Açılar": "Focus on camera angles, composition, and visual perspective",
+    "Malzeme ve Dokular": "Focus on materials, textures, surface details, and tactile qualities"
+}
+
+STOP_SEQUENCES = ["Original:", "Explanation:", "Note:", "Focus:", "Enhancement:"]
+
+PROMPT_MARKER = "Original prompt to enhance:"
+BATCH_MARKER = "Prompts to enhance (JSON):"
+# generateContent output cap; batches are sized so K x max_tokens fits
+MAX_OUTPUT_TOKENS = 8192
+
+
+class GeminiError(Exception):
+    """API call failed; status is the HTTP status code (None for transport errors)"""
+
+    def __init__(self, message: str, status: Optional[int] = None,
+                 retry_after: Optional[str] = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class GeminiResponseError(GeminiError):
+    """HTTP call succeeded but the payload had no usable candidate"""
+
+
+def _enhancement_rules(focus: str) -> str:
+    return f"""You are an expert AI art prompt engineer specializing in anime and digital art.
+
+TASK: Enhance the given prompt to be more artistic and detailed while maintaining all core elements.
+
+FOCUS: {FOCUS_PROMPTS.get(focus, FOCUS_PROMPTS[DEFAULT_FOCUS])}
+
+ENHANCEMENT RULES:
+- Keep ALL original characters, settings, colors, and key descriptors
+- Add 5-10 high-impact artistic enhancement words/phrases
+- Use professional photography and digital art terminology
+- Enhance lighting, texture, and atmospheric details
+- Make descriptions more specific and vivid
+- Add technical quality indicators
+- Maintain the cyberpunk/neon anime aesthetic
+- DO NOT add explanations or meta-commentary"""
+
+
+def build_system_prompt(focus: str = DEFAULT_FOCUS) -> str:
+    """Enhancement instructions sent ahead of the prompt"""
+    return f"""{_enhancement_rules(focus)}
+- Return ONLY the enhanced prompt
+
+{PROMPT_MARKER}"""
+
+
+def build_batch_system_prompt(focus: str = DEFAULT_FOCUS) -> str:
+    """Same instructions for several prompts answered as one JSON array"""
+    return f"""{_enhancement_rules(focus)}
+- Enhance EACH prompt independently
+- Return ONLY a JSON array with one object per prompt, in input order:
+  [{{"id": <id>, "enhanced": "<enhanced prompt>"}}, ...]
+
+{BATCH_MARKER}"""
+
+
+def generation_config(creativity: float = 0.8, max_tokens: int = 200) -> Dict[str, Any]:
+    """generationConfig block derived from the UI settings"""
+    return {
+        "temperature": creativity,
+        "maxOutputTokens": max_tokens,
+        "topP": min(0.95, creativity + 0.1),
+        "topK": int(40 * creativity),
+        "stopSequences": STOP_SEQUENCES
+    }
+
+
+def build_request_body(prompt: str, creativity: float = 0.8, max_tokens: int = 200,
+                       focus: str = DEFAULT_FOCUS) -> Dict[str, Any]:
+    """JSON body for a generateContent call"""
+    return {
+        "contents": [{
+            "parts": [{
+                "text": f"{build_system_prompt(focus)}\n\n{prompt}"
+            }]
+        }],
+        "generationConfig": generation_config(creativity, max_tokens)
+    }
+
+
+def build_batch_request_body(prompts: Sequence[str], creativity: float = 0.8, max_tokens: int = 200,
+                             focus: str = DEFAULT_FOCUS) -> Dict[str, Any]:
+    """JSON body enhancing several prompts in one generateContent call"""
+    items = json.dumps([{"id": i, "prompt": prompt} for i, prompt in enumerate(prompts)],
+                       ensure_ascii=False)
+    config = generation_config(creativity, min(MAX_OUTPUT_TOKENS, max_tokens * len(prompts)))
+    # A stop sequence inside one item would truncate the whole array
+    del config["stopSequences"]
+    config["responseMimeType"] = "application/json"
+    return {
+        "contents": [{
+            "parts": [{
+                "text": f"{build_batch_system_prompt(focus)}\n\n{items}"
+            }]
+        }],
+        "generationConfig": config
+    }
+
+
+def parse_batch_response(text: str, count: int) -> List[Optional[str]]:
+    """Cleaned enhancement per input position; None for items missing or malformed.
+
+    Raises GeminiResponseError when the text is not a JSON array at all.
+    """
+    try:
+        items = json.loads(text)
+    except ValueError as e:
+        raise GeminiResponseError(f"Invalid JSON in batch response: {e}", 200) from e
+    if isinstance(items, dict):
+        items = items.get("results", items.get("items"))
+    if not isinstance(items, list):
+        raise GeminiResponseError("Batch response is not a JSON array", 200)
+    results: List[Optional[str]] = [None] * count
+    for position, item in enumerate(items):
+        if not isinstance(item, dict):
+            continue
+        item_id = item.get("id", position)
+        enhanced = item.get("enhanced")
+        if (isinstance(item_id, int) and 0 <= item_id < count and results[item_id] is None
+                and isinstance(enhanced, str)):
+            results[item_id] = clean_enhanced_prompt(enhanced) or None
+    return results
+
+
+def endpoint_url(model: str = DEFAULT_MODEL, method: str = "generateContent",
+                 base_url: Optional[str] = None) -> str:
+    return f"{base_url or API_BASE_URL}/models/{model}:{method}"
+
+
+ENHANCEMENT_LABELS = ("Enhanced prompt:", "Enhanced:")
+
+
+def clean_enhanced_prompt(text: str) -> str:
+    """Strip labels the model sometimes prepends"""
+    text = text.strip()
+    for label in ENHANCEMENT_LABELS:
+        text = text.replace(label, "").strip()
+    return text
+
+
+class StreamCleaner:
+    """clean_enhanced_prompt applied chunk by chunk.
+
+    A tail that could be the start of a label split across chunks is held
+    back until the next chunk decides it.
+    """
+
+    def __init__(self):
+        self._pending = ""
+        self._started = False
+
+    def feed(self, chunk: str) -> str:
+        text = self._pending + chunk
+        for label in ENHANCEMENT_LABELS:
+            text = text.replace(label, "")
+        hold = max((n for label in ENHANCEMENT_LABELS for n in range(1, len(label))
+                    if text.endswith(label[:n])), default=0)
+        text, self._pending = text[:len(text) - hold], text[len(text) - hold:]
+        if not self._started:
+            text = text.lstrip()
+            self._started = bool(text)
+        return text
+
+    def flush(self) -> str:
+        text, self._pending = self._pending, ""
+        return text if self._started else text.lstrip()
+
+
+def extract_text(result: Dict[str, Any]) -> str:
+    """Pull the first candidate's text out of a generateContent response"""
+    if 'candidates' in result and len(result['candidates']) > 0:
+        candidate = result['candidates'][0]
+
+        # Check if candidate has content/parts structure
+        if 'content' in candidate and 'parts' in candidate['content']:
+            return candidate['content']['parts'][0]['text']
+        elif 'parts' in candidate:
+            return candidate['parts'][0]['text']
+        raise GeminiResponseError(f"Unexpected API response structure: {candidate}", 200)
+
+    if 'error' in result:
+        raise GeminiResponseError(f"API Error: {result['error']}", 200)
+    raise GeminiResponseError(f"No candidates in response: {result}", 200)
+
+
+def iter_sse_data(lines: Iterable[str]) -> Iterator[str]:
+    """Payloads of server-sent events; multi-line data fields are joined"""
+    data = []
+    for line in lines:
+        if not line:
+            if data:
+                yield "\n".join(data)
+                data = []
+        elif line.startswith("data:"):
+            data.append(line[5:].lstrip(" "))
+    if data:
+        yield "\n".join(data)
+
+
+@contextmanager
+def _metered(model: str, api_key: str) -> Iterator[Dict[str, Any]]:
+    """Time one API request and count its outcome; the caller sets call["status"]"""
+    key = key_label(api_key)
+    call: Dict[str, Any] = {"status": "transport_error"}
+    API_IN_FLIGHT.inc(model=model)
+    start = time.perf_counter()
+    try:
+        yield call
+    finally:
+        API_IN_FLIGHT.dec(model=model)
+        API_LATENCY.observe(time.perf_counter() - start, model=model, key=key)
+        API_REQUESTS.inc(model=model, key=key, status=str(call["status"]))
+
+
+def _record_usage(model: str, result: Dict[str, Any]):
+    usage = result.get("usageMetadata") or {}
+    for kind, field in (("prompt", "promptTokenCount"), ("output", "candidatesTokenCount")):
+        if usage.get(field):
+            API_TOKENS.inc(usage[field], model=model, kind=kind)
+
+
+def _headers(api_key: str) -> Dict[str, str]:
+    return {
+        "Content-Type": "application/json",
+        "x-goog-api-key": api_key
+    }
+
+
+def _response_text(response: HttpResponse, model: str) -> str:
+    if response.status_code != 200:
+        raise GeminiError(f"API Error {response.status_code}: {response.text}", response.status_code,
+                          response.headers.get("Retry-After"))
+    try:
+        result = response.json()
+    except ValueError as e:
+        raise GeminiResponseError(f"Invalid JSON in API response: {e}", 200) from e
+    _record_usage(model, result)
+    return extract_text(result)
+
+
+def generate_content(prompt: str, api_key: str, creativity: float = 0.8, max_tokens: int = 200,
+                     focus: str = DEFAULT_FOCUS, model: str = DEFAULT_MODEL,
+                     base_url: Optional[str] = None, timeout: TimeoutSpec = REQUEST_TIMEOUT) -> str:
+    """Enhance one prompt over the pooled client; raises GeminiError on any failure"""
+    with _metered(model, api_key) as call:
+        try:
+            response = get_client().post_json(endpoint_url(model, base_url=base_url), _headers(api_key),
+                                              build_request_body(prompt, creativity, max_tokens, focus),
+                                              timeout)
+        except TransportError as e:
+            raise GeminiError(f"API call failed: {e}") from e
+        call["status"] = response.status_code
+        return clean_enhanced_prompt(_response_text(response, model))
+
+
+async def agenerate_content(client: AsyncHttpClient, prompt: str, api_key: str,
+                            creativity: float = 0.8, max_tokens: int = 200,
+                            focus: str = DEFAULT_FOCUS, model: str = DEFAULT_MODEL,
+                            base_url: Optional[str] = None,
+                            timeout: TimeoutSpec = REQUEST_TIMEOUT) -> str:
+    """Async variant of generate_content"""
+    with _metered(model, api_key) as call:
+        try:
+            response = await client.post_json(endpoint_url(model, base_url=base_url), _headers(api_key),
+                                              build_request_body(prompt, creativity, max_tokens, focus),
+                                              timeout)
+        except TransportError as e:
+            raise GeminiError(f"API call failed: {e}") from e
+        call["status"] = response.status_code
+        return clean_enhanced_prompt(_response_text(response, model))
+
+
+def generate_batch(prompts: Sequence[str], api_key: str, creativity: float = 0.8, max_tokens: int = 200,
+                   focus: str = DEFAULT_FOCUS, model: str = DEFAULT_MODEL,
+                   base_url: Optional[str] = None,
+                   timeout: TimeoutSpec = REQUEST_TIMEOUT) -> List[Optional[str]]:
+    """Enhance several prompts with one request; None marks items to retry one by one"""
+    with _metered(model, api_key) as call:
+        try:
+            response = get_client().post_json(endpoint_url(model, base_url=base_url), _headers(api_key),
+                                              build_batch_request_body(prompts, creativity, max_tokens, focus),
+                                              timeout)
+        except TransportError as e:
+            raise GeminiError(f"API call failed: {e}") from e
+        call["status"] = response.status_code
+        return parse_batch_response(_response_text(response, model), len(prompts))
+
+
+def stream_generate_content(prompt: str, api_key: str, creativity: float = 0.8, max_tokens: int = 200,
+                            focus: str = DEFAULT_FOCUS, model: str = DEFAULT_MODEL,
+                            base_url: Optional[str] = None,
+                            timeout: TimeoutSpec = REQUEST_TIMEOUT) -> Iterator[str]:
+    """Enhance one prompt via streamGenerateContent, yielding cleaned text as it arrives.
+
+    HTTP errors are raised before the first chunk; a connection lost midway
+    raises GeminiError after the chunks already yielded.
+    """
+    url = endpoint_url(model, "streamGenerateContent", base_url) + "?alt=sse"
+    cleaner = StreamCleaner()
+    with _metered(model, api_key) as call:
+        try:
+            with get_client().stream_post(url, _headers(api_key),
+                                          build_request_body(prompt, creativity, max_tokens, focus),
+                                          timeout) as response:
+                call["status"] = response.status_code
+                if response.status_code != 200:
+                    raise GeminiError(f"API Error {response.status_code}: {response.read_text()}",
+                                      response.status_code, response.headers.get("Retry-After"))
+                received = False
+                usage: Optional[Dict[str, Any]] = None
+                for data in iter_sse_data(response.lines):
+                    try:
+                        event = json.loads(data)
+                    except ValueError as e:
+                        raise GeminiResponseError(f"Invalid JSON in stream event: {e}", 200) from e
+                    if "usageMetadata" in event:
+                        usage = event  # cumulative: only the last one counts
+                    candidates = event.get("candidates") or [{}]
+                    if "error" not in event and not ({"content", "parts"} & candidates[0].keys()):
+                        continue  # e.g. a trailing usage- or finishReason-only event
+                    text = cleaner.feed(extract_text(event))
+                    received = True
+                    if text:
+                        yield text
+                if usage is not None:
+                    _record_usage(model, usage)
+                if not received:
+                    raise GeminiResponseError("Stream ended without any candidates", 200)
+        except TransportError as e:
+            raise GeminiError(f"API call failed: {e}") from e
+        tail = cleaner.flush()
+        if tail:
+            yield tail
@@ -0,0 +1,254 @@
+"""Pooled keep-alive HTTP client for the Gemini endpoint.
+
+One client per process reuses TCP/TLS connections instead of paying a new
+handshake per enhancement. Uses httpx with HTTP/2 when httpx and h2 are
+installed, otherwise a requests.Session with a sized connection pool.
+An asyncio variant is provided for async callers.
+
+    python http_client.py --requests 200   # pooled vs. unpooled latency against the local stub
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from functools import partial
+from typing import Any, Dict, Iterator, List, Mapping, NamedTuple, Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+except ImportError:  # optional: enables HTTP/2 and the native async client
+    httpx = None
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = httpx is not None
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+POOL_SIZE = int(os.environ.get("GEMINI_POOL_SIZE", "64"))
+
+_TRANSPORT_ERRORS: Tuple[type, ...] = (requests.RequestException,)
+if httpx is not None:
+    _TRANSPORT_ERRORS += (httpx.HTTPError,)
+
+
+class Timeouts(NamedTuple):
+    connect: float = float(os.environ.get("GEMINI_CONNECT_TIMEOUT", "5"))
+    read: float = float(os.environ.get("GEMINI_READ_TIMEOUT", "15"))
+
+
+TimeoutSpec = Union[float, Tuple[float, float], Timeouts, None]
+
+
+def as_timeouts(timeout: TimeoutSpec) -> Timeouts:
+    """Accept a single float (both phases), a (connect, read) pair or Timeouts"""
+    if timeout is None:
+        return Timeouts()
+    if isinstance(timeout, (int, float)):
+        return Timeouts(float(timeout), float(timeout))
+    return Timeouts(*timeout)
+
+
+class TransportError(Exception):
+    """Connection, TLS or timeout failure before an HTTP status was received"""
+
+
+class HttpResponse(NamedTuple):
+    status_code: int
+    headers: Mapping[str, str]
+    text: str
+
+    def json(self) -> Any:
+        return json.loads(self.text)
+
+
+class StreamingResponse(NamedTuple):
+    """Response whose body is read line by line as it arrives"""
+    status_code: int
+    headers: Mapping[str, str]
+    lines: Iterator[str]
+
+    def read_text(self) -> str:
+        return "\n".join(self.lines)
+
+
+def _guarded(lines: Iterator[str]) -> Iterator[str]:
+    # Failures while the body is still arriving surface as TransportError too
+    try:
+        yield from lines
+    except _TRANSPORT_ERRORS as e:
+        raise TransportError(str(e)) from e
+
+
+class HttpClient:
+    """Thread-safe pooled client; one instance is shared per process"""
+
+    def __init__(self, pool_size: int = POOL_SIZE, http2: bool = True):
+        self.http2 = http2 and HTTP2_AVAILABLE
+        if self.http2:
+            self._client = httpx.Client(http2=True, limits=httpx.Limits(
+                max_connections=pool_size, max_keepalive_connections=pool_size))
+            self._session = None
+        else:
+            self._client = None
+            self._session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+            self._session.mount("https://", adapter)
+            self._session.mount("http://", adapter)
+
+    def post_json(self, url: str, headers: Dict[str, str], body: Any,
+                  timeout: TimeoutSpec = None) -> HttpResponse:
+        timeouts = as_timeouts(timeout)
+        try:
+            if self._client is not None:
+                response = self._client.post(url, headers=headers, json=body, timeout=httpx.Timeout(
+                    timeouts.read, connect=timeouts.connect))
+            else:
+                response = self._session.post(url, headers=headers, json=body,
+                                              timeout=(timeouts.connect, timeouts.read))
+        except _TRANSPORT_ERRORS as e:
+            raise TransportError(str(e)) from e
+        return HttpResponse(response.status_code, response.headers, response.text)
+
+    @contextmanager
+    def stream_post(self, url: str, headers: Dict[str, str], body: Any,
+                    timeout: TimeoutSpec = None) -> Iterator[StreamingResponse]:
+        """POST and expose the body as an iterator of lines; the read timeout applies per chunk"""
+        timeouts = as_timeouts(timeout)
+        with ExitStack() as stack:
+            try:
+                if self._client is not None:
+                    response = stack.enter_context(self._client.stream(
+                        "POST", url, headers=headers, json=body,
+                        timeout=httpx.Timeout(timeouts.read, connect=timeouts.connect)))
+                    lines = response.iter_lines()
+                else:
+                    response = self._session.post(url, headers=headers, json=body, stream=True,
+                                                  timeout=(timeouts.connect, timeouts.read))
+                    stack.callback(response.close)
+                    response.encoding = response.encoding or "utf-8"
+                    lines = response.iter_lines(decode_unicode=True)
+            except _TRANSPORT_ERRORS as e:
+                raise TransportError(str(e)) from e
+            yield StreamingResponse(response.status_code, response.headers, _guarded(lines))
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+        if self._session is not None:
+            self._session.close()
+
+
+class AsyncHttpClient:
+    """asyncio variant: native httpx.AsyncClient when available, else the pooled
+    sync client driven from worker threads"""
+
+    def __init__(self, pool_size: int = POOL_SIZE, http2: bool = True):
+        if httpx is not None:
+            self._client = httpx.AsyncClient(http2=http2 and HTTP2_AVAILABLE, limits=httpx.Limits(
+                max_connections=pool_size, max_keepalive_connections=pool_size))
+            self._sync = None
+        else:
+            self._client = None
+            self._sync = HttpClient(pool_size, http2=False)
+            # Own executor: the default one is too small to fill the connection pool
+            self._executor = ThreadPoolExecutor(pool_size, thread_name_prefix="http")
+
+    async def post_json(self, url: str, headers: Dict[str, str], body: Any,
+                        timeout: TimeoutSpec = None) -> HttpResponse:
+        if self._sync is not None:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, partial(self._sync.post_json, url, headers, body, timeout))
+        timeouts = as_timeouts(timeout)
+        try:
+            response = await self._client.post(url, headers=headers, json=body, timeout=httpx.Timeout(
+                timeouts.read, connect=timeouts.connect))
+        except httpx.HTTPError as e:
+            raise TransportError(str(e)) from e
+        return HttpResponse(response.status_code, response.headers, response.text)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+        if self._sync is not None:
+            self._executor.shutdown(wait=False)
+            self._sync.close()
+
+
+_client: Optional[HttpClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> HttpClient:
+    """Process-wide pooled client, created on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = HttpClient()
+    return _client
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """Mean and p50/p95/p99 of durations in seconds, in milliseconds"""
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+    return {"mean_ms": statistics.mean(ordered) * 1000, "p50_ms": pick(0.5),
+            "p95_ms": pick(0.95), "p99_ms": pick(0.99)}
+
+
+def measure_latency(base_url: str, n: int = 200, pooled: bool = True) -> Dict[str, float]:
+    """Sequential generateContent round trips against base_url"""
+    from gemini import build_request_body, endpoint_url
+
+    url = endpoint_url(base_url=base_url)
+    headers = {"Content-Type": "application/json", "x-goog-api-key": "bench"}
+    body = build_request_body("benchmark prompt, neon city")
+    client = HttpClient(http2=False) if pooled else None
+    samples = []
+    try:
+        for _ in range(n):
+            start = time.perf_counter()
+            if client is not None:
+                client.post_json(url, headers, body)
+            else:
+                requests.post(url, headers=headers, json=body, timeout=15)
+            samples.append(time.perf_counter() - start)
+    finally:
+        if client is not None:
+            client.close()
+    return percentiles(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare pooled and unpooled request latency")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--base-url", default=None, help="endpoint to hit (defaults to a local stub)")
+    args = parser.parse_args()
+
+    from stub_server import StubGeminiServer
+
+    stub = None
+    base_url = args.base_url
+    if base_url is None:
+        stub = StubGeminiServer().start()
+        base_url = stub.base_url
+    try:
+        for label, pooled in (("unpooled requests.post", False), ("pooled keep-alive", True)):
+            stats = measure_latency(base_url, args.requests, pooled)
+            print(f"{label:24s} " + "  ".join(f"{k}={v:.2f}" for k, v in stats.items()))
+    finally:
+        if stub is not None:
+            stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""Health-aware routing across several Gemini API keys.
+
+Each key has a circuit breaker: after a run of failures it is opened for an
+exponentially growing, jittered cooldown (or the server's Retry-After on a
+429), then a single half-open probe decides whether it closes again.
+Requests go to the usable key with the best score (smoothed latency, error
+rate and current load), so a dead key costs nothing instead of a failed
+call plus a fixed sleep on every request.
+"""
+import email.utils
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+FAILURE_THRESHOLD = 3  # consecutive failures that open a closed circuit
+BASE_COOLDOWN = 1.0
+MAX_COOLDOWN = 300.0
+EWMA_ALPHA = 0.2
+# Latency assumed for a key before it has answered anything
+DEFAULT_LATENCY = 1.0
+# Statuses caused by the request itself rather than the key; they do not count against it
+REQUEST_ERRORS = frozenset({400, 404, 413})
+
+
+def keys_from(source: Mapping[str, str], prefix: str = "GEMINI_API_KEY_") -> List[str]:
+    """Keys named PREFIX1, PREFIX2, ... (stops at the first missing one; empty values are skipped)"""
+    keys = []
+    n = 1
+    while f"{prefix}{n}" in source:
+        value = source.get(f"{prefix}{n}", "")
+        if value:
+            keys.append(value)
+        n += 1
+    return keys
+
+
+def parse_retry_after(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """Retry-After header as seconds from now; accepts delta-seconds or an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when - (time.time() if now is None else now))
+
+
+class KeyHealth:
+    """Breaker state and smoothed statistics for one key"""
+
+    def __init__(self):
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.trips = 0
+        self.open_until = 0.0
+        self.error_rate = 0.0
+        self.latency: Optional[float] = None
+        self.in_flight = 0
+        self.successes = 0
+        self.failures = 0
+
+    def score(self) -> float:
+        """Lower is better"""
+        latency = DEFAULT_LATENCY if self.latency is None else self.latency
+        return latency * (1 + self.in_flight) * (1 + 4 * self.error_rate)
+
+
+class KeyPool:
+    """Thread-safe key selector; report every acquired key back with record_success/record_failure"""
+
+    def __init__(self, api_keys: Sequence[str], failure_threshold: int = FAILURE_THRESHOLD,
+                 base_cooldown: float = BASE_COOLDOWN, max_cooldown: float = MAX_COOLDOWN,
+                 clock: Callable[[], float] = time.monotonic, seed: Optional[int] = None):
+        self.keys = [key for key in api_keys if key]
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self.health = [KeyHealth() for _ in self.keys]
+        self._clock = clock
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def _usable(self, health: KeyHealth, now: float) -> bool:
+        if health.state == CLOSED:
+            return True
+        # One probe at a time while half-open
+        return health.state == OPEN and now >= health.open_until
+
+    def acquire(self, exclude: Sequence[int] = (),
+                admit: Optional[Callable[[int], float]] = None) -> Tuple[Optional[int], float]:
+        """Healthiest usable key not in exclude, as (index, 0.0).
+
+        admit(index) may veto a key by returning the seconds until it has
+        budget (e.g. a rate limiter). With no key available, returns None and
+        the seconds until one might be (0.0 if every key has been excluded).
+        """
+        with self._lock:
+            now = self._clock()
+            ranked = sorted((i for i in range(len(self.keys)) if i not in exclude),
+                            key=lambda i: self.health[i].score())
+            waits = []
+            for i in ranked:
+                health = self.health[i]
+                if not self._usable(health, now):
+                    if health.state == OPEN:
+                        waits.append(health.open_until - now)
+                    else:  # probe in flight; its answer decides
+                        waits.append(health.latency or DEFAULT_LATENCY)
+                    continue
+                wait_time = admit(i) if admit is not None else 0.0
+                if wait_time > 0:
+                    waits.append(wait_time)
+                    continue
+                if health.state == OPEN:
+                    health.state = HALF_OPEN
+                health.in_flight += 1
+                return i, 0.0
+            return None, (min(waits) if waits else 0.0)
+
+    def record_success(self, index: int, latency: float):
+        with self._lock:
+            health = self.health[index]
+            health.in_flight = max(0, health.in_flight - 1)
+            health.successes += 1
+            health.consecutive_failures = 0
+            health.trips = 0
+            health.state = CLOSED
+            health.error_rate *= 1 - EWMA_ALPHA
+            health.latency = latency if health.latency is None else (
+                (1 - EWMA_ALPHA) * health.latency + EWMA_ALPHA * latency)
+
+    def record_failure(self, index: int, status: Optional[int] = None,
+                       retry_after: Optional[str] = None):
+        """Count a failed call; a 429 opens the circuit for at least Retry-After"""
+        with self._lock:
+            health = self.health[index]
+            health.in_flight = max(0, health.in_flight - 1)
+            if status in REQUEST_ERRORS:
+                if health.state == HALF_OPEN:
+                    health.state = CLOSED  # the key answered; the request was bad
+                return
+            health.failures += 1
+            health.consecutive_failures += 1
+            health.error_rate = (1 - EWMA_ALPHA) * health.error_rate + EWMA_ALPHA
+            delay = parse_retry_after(retry_after)
+            if (status == 429 or health.state == HALF_OPEN
+                    or health.consecutive_failures >= self.failure_threshold):
+                health.trips += 1
+                cooldown = min(self.max_cooldown, self.base_cooldown * 2 ** (health.trips - 1))
+                # Equal jitter: keys tripped together do not all probe at the same moment
+                cooldown = cooldown / 2 + self._rng.uniform(0, cooldown / 2)
+                health.state = OPEN
+                health.open_until = self._clock() + max(cooldown, delay or 0.0)
+
+    def release(self, index: int):
+        """Return a key without recording an outcome (e.g. the call was cancelled)"""
+        with self._lock:
+            health = self.health[index]
+            health.in_flight = max(0, health.in_flight - 1)
+            if health.state == HALF_OPEN:
+                health.state = OPEN
+
+    def snapshot(self) -> List[Dict[str, object]]:
+        """Per-key state for display; keys themselves are not included"""
+        with self._lock:
+            now = self._clock()
+            return [{
+                "key": i + 1,
+                "state": health.state,
+                "error_rate": round(health.error_rate, 3),
+                "latency_ms": None if health.latency is None else round(health.latency * 1000, 1),
+                "in_flight": health.in_flight,
+                "successes": health.successes,
+                "failures": health.failures,
+                "retry_in": round(max(0.0, health.open_until - now), 1) if health.state == OPEN else 0.0,
+            } for i, health in enumerate(self.health)]
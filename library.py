@@ -0,0 +1,203 @@
+"""Prompt library defaults and file loading (no Streamlit dependency)"""
+import collections.abc
+import json
+import os
+import sys
+import unicodedata
+from types import MappingProxyType
+from typing import Any, Dict, Iterator, Mapping, Optional, Tuple, Union
+
+DATA_FILE = "prompt_generator_data.json"
+
+# Categories in the order they are combined into a prompt
+CATEGORIES = [
+    "characters",
+    "poses",
+    "color_palettes",
+    "art_styles",
+    "lighting_types",
+    "backgrounds",
+    "moods",
+    "expressions"
+]
+
+# Categories stored as name -> description mappings; the rest are plain lists
+MAPPING_CATEGORIES = {"characters", "color_palettes"}
+
+DEFAULT_LIBRARY: Dict[str, Any] = {
+    "characters": {
+        "cyberpunk hacker girl": "neon-lit server room",
+        "futuristic samurai": "cyberpunk Neo-Tokyo",
+        "anime spellcaster": "digital magic realm",
+        "superhero": "cyberpunk metropolis"
+    },
+    "poses": [
+        "dynamic crouched pose ready to strike with glowing weapon",
+        "heroic standing pose with cape flowing in neon wind",
+        "profile view looking upward thoughtfully with glowing eyes",
+        "arms outstretched with energy coursing through body",
+        "confident standing with arms crossed and electric aura",
+        "mid-air jumping pose with trailing energy effects",
+        "sitting meditation pose with floating energy orbs",
+        "walking forward with determination and glowing footsteps",
+        "dramatic pose with one hand extended casting energy",
+        "battle-ready stance with dual weapons glowing"
+    ],
+    "color_palettes": {
+        "Cyberpunk Classic": "electric blue, hot pink, neon purple, cyan",
+        "Neon Sunset": "neon orange, electric pink, bright purple, yellow glow",
+        "Ice Fire": "ice blue, neon red, white, cyan",
+        "Toxic Glow": "neon green, electric purple, bright cyan, lime"
+    },
+    "art_styles": [
+        "anime style digital art",
+        "highly detailed anime illustration",
+        "cyberpunk anime art style",
+        "cinematic anime style digital art",
+        "masterpiece anime artwork"
+    ],
+    "lighting_types": [
+        "dramatic neon lighting",
+        "cinematic rim lighting",
+        "atmospheric neon glow",
+        "multiple colored light sources",
+        "volumetric neon lighting"
+    ],
+    "backgrounds": [
+        "pure black background",
+        "dark void with neon grid",
+        "black background with subtle geometric patterns",
+        "deep space black",
+        "minimalist dark cityscape silhouette"
+    ],
+    "moods": [
+        "dark and mysterious",
+        "vibrant and energetic",
+        "serene and mystical",
+        "intense and dramatic",
+        "futuristic and clean"
+    ],
+    "expressions": [
+        "confident and determined",
+        "mysterious and enigmatic",
+        "fierce and powerful",
+        "calm and contemplative",
+        "rebellious and edgy"
+    ]
+}
+
+
+def default_category(category: str):
+    """Return a fresh, mutable copy of a category's default items"""
+    items = DEFAULT_LIBRARY[category]
+    return dict(items) if category in MAPPING_CATEGORIES else list(items)
+
+
+def read_library_file(path: str = DATA_FILE) -> Optional[Dict[str, Any]]:
+    """Read the saved library JSON; None if the file does not exist"""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def file_signature(path: str) -> Optional[Tuple[int, int]]:
+    """(mtime_ns, size) of a file, None if it does not exist"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+# One category keyed by item_key, in insertion order: {key: (name, value)};
+# value is the description for mapping categories and None otherwise
+ItemIndex = Dict[str, Tuple[str, Optional[str]]]
+
+
+def item_key(name: str) -> str:
+    """Identity of an item for duplicate checks: case-folded, whitespace collapsed"""
+    return " ".join(unicodedata.normalize("NFC", name).casefold().split())
+
+
+def index_items(items) -> ItemIndex:
+    """Index a list or name -> description mapping; the first of equivalent items wins"""
+    pairs = items.items() if isinstance(items, Mapping) else ((name, None) for name in items)
+    index: ItemIndex = {}
+    for name, value in pairs:
+        index.setdefault(item_key(name), (name, value))
+    return index
+
+
+def items_layout(category: str, index: ItemIndex):
+    """An indexed category back in the JSON file layout"""
+    if category in MAPPING_CATEGORIES:
+        return {name: value or "" for name, value in index.values()}
+    return [name for name, _ in index.values()]
+
+
+class _SharedCategory:
+    """Names as a ready-made tuple for selectors, plus O(1) lookup by item_key"""
+    __slots__ = ("names", "_positions")
+
+    def __init__(self, index: ItemIndex):
+        # Interning makes a key that equals its name the same object
+        self.names: Tuple[str, ...] = tuple(sys.intern(name) for name, _ in index.values())
+        self._positions = {sys.intern(key): i for i, key in enumerate(index)}
+
+    def find(self, name: str) -> Optional[str]:
+        """Stored spelling of the item equivalent to name, if there is one"""
+        i = self._positions.get(item_key(name))
+        return None if i is None else self.names[i]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.names)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+class SharedList(_SharedCategory, collections.abc.Sequence):
+    """Immutable list category"""
+    __slots__ = ()
+
+    def __getitem__(self, i):
+        return self.names[i]
+
+    def __contains__(self, name: object) -> bool:
+        return isinstance(name, str) and self.find(name) == name
+
+
+class SharedMapping(_SharedCategory, collections.abc.Mapping):
+    """Immutable name -> description category"""
+    __slots__ = ("_values",)
+
+    def __init__(self, index: ItemIndex):
+        super().__init__(index)
+        self._values = tuple(sys.intern(value or "") for _, value in index.values())
+
+    def __getitem__(self, name: str) -> str:
+        i = self._positions.get(item_key(name)) if isinstance(name, str) else None
+        if i is None or self.names[i] != name:
+            raise KeyError(name)
+        return self._values[i]
+
+
+def freeze_index(category: str, index: ItemIndex) -> Union[SharedList, SharedMapping]:
+    """Immutable copy of one category with interned strings, safe to share between sessions"""
+    return SharedMapping(index) if category in MAPPING_CATEGORIES else SharedList(index)
+
+
+def freeze_library(data: Mapping[str, Any]) -> Mapping[str, Any]:
+    """Read-only library view shared by every session of a process (duplicates dropped)"""
+    return MappingProxyType({category: freeze_index(category, index_items(items))
+                             for category, items in data.items()})
+
+
+def load_library(path: str = DATA_FILE) -> Dict[str, Any]:
+    """Saved library merged over the defaults, one entry per category"""
+    saved = read_library_file(path) or {}
+    return {
+        category: saved[category] if category in saved else default_category(category)
+        for category in CATEGORIES
+    }
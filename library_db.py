@@ -0,0 +1,329 @@
+"""Optional SQLite store for large prompt libraries.
+
+One indexed table holds the items of all categories, unique per category
+and item_key (case and spacing do not make a new item), with tags and an
+FTS5 index for search (LIKE when the SQLite build has no FTS5).
+A small pool of connections (PROMPT_LIBRARY_DB_POOL, default 4) is shared by
+all sessions of a process; each operation checks one out and returns it, so
+Streamlit's per-rerun script threads reuse them. Name lists are cached per
+process and refreshed when any process writes, so sessions never hold their
+own copies.
+
+Enable it in the app with PROMPT_LIBRARY_DB=library.sqlite3. An empty
+database is seeded from prompt_generator_data.json on first use.
+
+    python library_db.py --import prompt_generator_data.json
+    python library_db.py --search poses "wings"
+"""
+import argparse
+import atexit
+import os
+import queue
+import re
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple, Sequence
+
+from library import CATEGORIES, DATA_FILE, MAPPING_CATEGORIES, index_items, item_key
+
+LIBRARY_DB = os.environ.get("PROMPT_LIBRARY_DB", "")
+POOL_SIZE = int(os.environ.get("PROMPT_LIBRARY_DB_POOL", "4"))
+DEFAULT_SEARCH_LIMIT = 50
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY,
+    category TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value TEXT,
+    added REAL NOT NULL,
+    key TEXT NOT NULL  -- item_key(name): case- and whitespace-folded
+);
+CREATE TABLE IF NOT EXISTS tags (
+    item_id INTEGER NOT NULL REFERENCES items(id) ON DELETE CASCADE,
+    tag TEXT NOT NULL,
+    PRIMARY KEY (item_id, tag)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS tags_tag ON tags(tag);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta(name, value) VALUES ('version', 0);
+"""
+
+# After _migrate, so databases from before the key column get it first
+_KEY_INDEX = "CREATE UNIQUE INDEX IF NOT EXISTS items_key ON items(category, key)"
+
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5(
+    name, value, content='items', content_rowid='id', tokenize='unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS items_fts_insert AFTER INSERT ON items BEGIN
+    INSERT INTO items_fts(rowid, name, value) VALUES (new.id, new.name, new.value);
+END;
+CREATE TRIGGER IF NOT EXISTS items_fts_delete AFTER DELETE ON items BEGIN
+    INSERT INTO items_fts(items_fts, rowid, name, value) VALUES ('delete', old.id, old.name, old.value);
+END;
+CREATE TRIGGER IF NOT EXISTS items_fts_update AFTER UPDATE ON items BEGIN
+    INSERT INTO items_fts(items_fts, rowid, name, value) VALUES ('delete', old.id, old.name, old.value);
+    INSERT INTO items_fts(rowid, name, value) VALUES (new.id, new.name, new.value);
+END;
+"""
+
+_ITEM_INSERT = ("INSERT OR IGNORE INTO items(category, name, value, added, key) "
+                "VALUES(?1, ?2, ?3, ?4, item_key(?2))")
+_TAG_INSERT = ("INSERT OR IGNORE INTO tags(item_id, tag) "
+               "SELECT id, ? FROM items WHERE category = ? AND key = item_key(?)")
+_ITEM_ID = "(SELECT id FROM items WHERE category = ? AND key = item_key(?))"
+_WORD = re.compile(r"\w+")
+
+
+def fts_query(text: str) -> str:
+    """Prefix match on every word; quoting keeps FTS5 syntax characters inert"""
+    return " ".join(f'"{word}"*' for word in _WORD.findall(text))
+
+
+class LibraryDB:
+    """Thread-safe library store; one instance per process is enough"""
+
+    def __init__(self, path: str = LIBRARY_DB, pool_size: int = POOL_SIZE):
+        self.path = path
+        self.pool_size = max(1, pool_size)
+        self._pool: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+        self._opened = 0
+        self._closed = False
+        self._pool_lock = threading.Lock()
+        # category -> (version, names); shared by every session of the process
+        self._names: Dict[str, Tuple[int, Tuple[str, ...]]] = {}
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        atexit.register(self.close)
+        with self._connection() as conn:
+            conn.executescript(_SCHEMA)
+        self._migrate()
+        with self._connection() as conn:
+            conn.execute(_KEY_INDEX)
+            try:
+                conn.executescript(_FTS_SCHEMA)
+                self.has_fts = True
+            except sqlite3.OperationalError:
+                self.has_fts = False  # SQLite built without FTS5
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None,
+                               check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.create_function("item_key", 1, item_key, deterministic=True)
+        return conn
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        """A pooled connection for one operation; waits while pool_size are checked out"""
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            with self._pool_lock:
+                create = self._opened < self.pool_size
+                if create:
+                    self._opened += 1
+            if create:
+                try:
+                    conn = self._open()
+                except BaseException:
+                    with self._pool_lock:
+                        self._opened -= 1
+                    raise
+            else:
+                conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            if self._closed:
+                conn.close()
+            else:
+                self._pool.put(conn)
+
+    def close(self):
+        """Close the idle connections; ones in use are closed when they are returned"""
+        self._closed = True
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def __enter__(self) -> "LibraryDB":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _migrate(self):
+        """Add the key column to older databases, dropping items that duplicate an earlier one"""
+        if "key" in {row[1] for row in self._fetch("PRAGMA table_info(items)")}:
+            return
+        with self._transaction() as conn:
+            conn.execute("ALTER TABLE items ADD COLUMN key TEXT")
+            conn.execute("UPDATE items SET key = item_key(name)")
+            conn.execute("DELETE FROM items WHERE id NOT IN "
+                         "(SELECT MIN(id) FROM items GROUP BY category, key)")
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Write transaction; bumps the version when anything changed"""
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                before = conn.total_changes
+                yield conn
+                if conn.total_changes != before:
+                    conn.execute("UPDATE meta SET value = value + 1 WHERE name = 'version'")
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _fetch(self, sql: str, parameters: Sequence[Any] = ()) -> List[Tuple[Any, ...]]:
+        """All rows of a read query, on a pooled connection"""
+        with self._connection() as conn:
+            return conn.execute(sql, parameters).fetchall()
+
+    def version(self) -> int:
+        """Increases with every committed change, from any process"""
+        return self._fetch("SELECT value FROM meta WHERE name = 'version'")[0][0]
+
+    def add(self, category: str, name: str, value: Optional[str] = None,
+            tags: Sequence[str] = ()) -> bool:
+        """Insert an item; False if the category already has it (or an equivalent spelling)"""
+        with self._transaction() as conn:
+            added = conn.execute(_ITEM_INSERT, (category, name, value, time.time())).rowcount > 0
+            conn.executemany(_TAG_INSERT, [(tag, category, name) for tag in tags])
+        return added
+
+    def add_many(self, category: str, items: Iterable[Tuple[str, Optional[str]]]) -> int:
+        """Insert (name, value) pairs in one transaction; returns how many were new"""
+        return self.add_items((category, name, value) for name, value in items)
+
+    def add_items(self, items: Iterable[Tuple[str, str, Optional[str]]]) -> int:
+        """Insert (category, name, value) rows in one transaction; returns how many were new"""
+        now = time.time()
+        with self._transaction() as conn:
+            return conn.executemany(_ITEM_INSERT, ((category, name, value, now)
+                                                   for category, name, value in items)).rowcount
+
+    def remove(self, category: str, name: str) -> bool:
+        with self._transaction() as conn:
+            return conn.execute("DELETE FROM items WHERE category = ? AND key = item_key(?)",
+                                (category, name)).rowcount > 0
+
+    def set_tags(self, category: str, name: str, tags: Sequence[str]):
+        """Replace an item's tags"""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM tags WHERE item_id = " + _ITEM_ID, (category, name))
+            conn.executemany(_TAG_INSERT, [(tag, category, name) for tag in tags])
+
+    def tags(self, category: str, name: str) -> List[str]:
+        return [row[0] for row in self._fetch(
+            "SELECT tag FROM tags WHERE item_id = " + _ITEM_ID + " ORDER BY tag", (category, name))]
+
+    def names_with_tag(self, category: str, tag: str) -> List[str]:
+        return [row[0] for row in self._fetch(
+            "SELECT name FROM items JOIN tags ON items.id = tags.item_id "
+            "WHERE category = ? AND tag = ? ORDER BY items.id", (category, tag))]
+
+    def count(self, category: str) -> int:
+        return self._fetch("SELECT COUNT(*) FROM items WHERE category = ?", (category,))[0][0]
+
+    def names(self, category: str) -> Tuple[str, ...]:
+        """All names in insertion order; one shared tuple per process until the next write"""
+        version = self.version()
+        cached = self._names.get(category)
+        if cached is None or cached[0] != version:
+            names = tuple(row[0] for row in self._fetch(
+                "SELECT name FROM items WHERE category = ? ORDER BY id", (category,)))
+            cached = self._names[category] = (version, names)
+        return cached[1]
+
+    def value(self, category: str, name: str) -> Optional[str]:
+        rows = self._fetch("SELECT value FROM items WHERE category = ? AND key = item_key(?)",
+                           (category, name))
+        return rows[0][0] if rows else None
+
+    def find(self, category: str, name: str) -> Optional[str]:
+        """Stored spelling of the item equivalent to name, if there is one"""
+        rows = self._fetch("SELECT name FROM items WHERE category = ? AND key = item_key(?)",
+                           (category, name))
+        return rows[0][0] if rows else None
+
+    def search(self, category: str, query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> List[str]:
+        """Names matching every word of query by prefix, oldest first (cheap to cut off at limit)"""
+        if self.has_fts and fts_query(query):
+            return [row[0] for row in self._fetch(
+                "SELECT items.name FROM items_fts JOIN items ON items.id = items_fts.rowid "
+                "WHERE items_fts MATCH ? AND items.category = ? ORDER BY items_fts.rowid LIMIT ?",
+                (fts_query(query), category, limit))]
+        pattern = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        return [row[0] for row in self._fetch(
+            "SELECT name FROM items WHERE category = ? AND name LIKE ? ESCAPE '\\' ORDER BY id LIMIT ?",
+            (category, pattern, limit))]
+
+    def import_library(self, data: Mapping[str, Any]) -> int:
+        """Add every item of a library dict (JSON file layout); returns how many were new"""
+        added = 0
+        for category in CATEGORIES:
+            added += self.add_many(category, index_items(data.get(category) or ()).values())
+        return added
+
+    def iter_items(self) -> Iterator[Tuple[str, str, Optional[str]]]:
+        """Every (category, name, value) row, oldest first, straight from the cursor
+        (the connection stays checked out until the iterator is exhausted or closed)"""
+        with self._connection() as conn:
+            yield from conn.execute("SELECT category, name, value FROM items ORDER BY id")
+
+    def as_library(self) -> Dict[str, Any]:
+        """Everything in the JSON file layout (for exports and the batch CLI)"""
+        data: Dict[str, Any] = {category: ({} if category in MAPPING_CATEGORIES else [])
+                                for category in CATEGORIES}
+        for category, name, value in self.iter_items():
+            if category in MAPPING_CATEGORIES:
+                data[category][name] = value or ""
+            elif category in data:
+                data[category].append(name)
+        return data
+
+    def is_empty(self) -> bool:
+        return not self._fetch("SELECT 1 FROM items LIMIT 1")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Manage the SQLite prompt library")
+    parser.add_argument("--db", default=LIBRARY_DB or "library.sqlite3")
+    parser.add_argument("--import", dest="import_path", metavar="JSON",
+                        help=f"add every item of a library JSON file (e.g. {DATA_FILE})")
+    parser.add_argument("--search", nargs=2, metavar=("CATEGORY", "QUERY"))
+    parser.add_argument("--limit", type=int, default=DEFAULT_SEARCH_LIMIT)
+    args = parser.parse_args(argv)
+
+    db = LibraryDB(args.db)
+    if args.import_path:
+        from library_store import LibraryStore
+        added = db.import_library(LibraryStore(args.import_path).read())
+        print(f"{added} items imported into {args.db}", file=sys.stderr)
+    if args.search:
+        category, query = args.search
+        for name in db.search(category, query, args.limit):
+            print(name)
+    if not args.import_path and not args.search:
+        for category in CATEGORIES:
+            print(f"{category}: {db.count(category)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+"""Bulk import and export of library items as CSV or JSONL.
+
+One item per row: category, name and, for characters and palettes, value
+(origin or colors). CSV files need a header row with these column names;
+JSONL lines are objects with the same keys. Imports are parsed and validated
+row by row, deduplicated (see library.item_key) and committed at once: a
+single journal write or a single SQLite transaction, so a 5,000-item pack
+costs one write and one rerun. Exports stream row by row.
+
+    python library_io.py --import pose_pack.csv
+    python library_io.py --import pack.jsonl --dry-run
+    python library_io.py --export library.csv --db library.sqlite3
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+from typing import Any, Iterable, Iterator, List, Mapping, NamedTuple, Optional, TextIO, Tuple
+
+from library import CATEGORIES, DATA_FILE, MAPPING_CATEGORIES
+
+FORMATS = ("csv", "jsonl")
+FIELDS = ("category", "name", "value")
+MAX_NAME_LENGTH = 500
+
+Item = Tuple[str, str, Optional[str]]
+
+
+class RowError(NamedTuple):
+    line: int
+    message: str
+
+
+class ImportReport(NamedTuple):
+    added: int
+    duplicates: int  # repeated in the file or already in the library
+    errors: List[RowError]
+
+
+def guess_format(filename: str) -> str:
+    """csv or jsonl, from the file extension"""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == ".csv":
+        return "csv"
+    if extension in (".jsonl", ".ndjson", ".json"):
+        return "jsonl"
+    raise ValueError(f"Unknown file type {extension or filename!r}; use .csv or .jsonl")
+
+
+def _read_rows(stream: TextIO, fmt: str) -> Iterator[Tuple[int, Any]]:
+    """(line number, row) pairs; a row that cannot be parsed is a str error message"""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        missing = {"category", "name"} - set(reader.fieldnames or ())
+        if missing:
+            yield 1, f"CSV header must name the columns {', '.join(FIELDS)}"
+            return
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield number, f"invalid JSON: {e}"
+            continue
+        yield number, row if isinstance(row, dict) else "expected a JSON object"
+
+
+def _validate(row: Mapping[str, Any]) -> Item:
+    category = str(row.get("category") or "").strip()
+    if category not in CATEGORIES:
+        raise ValueError(f"unknown category {category!r}")
+    name = row.get("name")
+    name = name.strip() if isinstance(name, str) else ""
+    if not name:
+        raise ValueError("missing name")
+    if len(name) > MAX_NAME_LENGTH:
+        raise ValueError(f"name longer than {MAX_NAME_LENGTH} characters")
+    if category not in MAPPING_CATEGORIES:
+        return category, name, None
+    value = row.get("value")
+    value = value.strip() if isinstance(value, str) else ""
+    if not value:
+        raise ValueError(f"{category} items need a value")
+    return category, name, value
+
+
+def read_items(stream: TextIO, fmt: str, errors: List[RowError]) -> Iterator[Item]:
+    """Valid (category, name, value) items, lazily; invalid rows are appended to errors"""
+    for number, row in _read_rows(stream, fmt):
+        if isinstance(row, str):
+            errors.append(RowError(number, row))
+            continue
+        try:
+            yield _validate(row)
+        except ValueError as e:
+            errors.append(RowError(number, str(e)))
+
+
+def import_items(stream: TextIO, fmt: str, target) -> ImportReport:
+    """Validate and add every item of stream to target (a LibraryStore or LibraryDB)
+    with one write; nothing is written when no row is valid"""
+    errors: List[RowError] = []
+    valid = 0
+
+    def counted() -> Iterator[Item]:
+        nonlocal valid
+        for item in read_items(stream, fmt, errors):
+            valid += 1
+            yield item
+
+    added = target.add_items(counted())
+    return ImportReport(added, valid - added, errors)
+
+
+def library_items(library: Mapping[str, Any]) -> Iterator[Item]:
+    """Items of a library in the JSON layout (or its frozen view), category by category"""
+    for category in CATEGORIES:
+        items = library.get(category) or ()
+        if category in MAPPING_CATEGORIES:
+            for name, value in items.items():
+                yield category, name, value
+        else:
+            for name in items:
+                yield category, name, None
+
+
+def export_items(items: Iterable[Item], out: TextIO, fmt: str) -> int:
+    """Write items to out one row at a time; returns how many were written"""
+    count = 0
+    if fmt == "csv":
+        writer = csv.writer(out)
+        writer.writerow(FIELDS)
+        for category, name, value in items:
+            writer.writerow((category, name, value or ""))
+            count += 1
+        return count
+    for category, name, value in items:
+        record = {"category": category, "name": name}
+        if value is not None:
+            record["value"] = value
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        count += 1
+    return count
+
+
+def export_text(items: Iterable[Item], fmt: str) -> str:
+    """Whole export as one string (for download buttons)"""
+    out = io.StringIO()
+    export_items(items, out, fmt)
+    return out.getvalue()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Import or export library items as CSV/JSONL")
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument("--import", dest="import_path", metavar="FILE", help="CSV or JSONL file to add")
+    action.add_argument("--export", dest="export_path", metavar="FILE", help="file to write ('-' for stdout)")
+    parser.add_argument("--format", choices=FORMATS, help="default: from the file extension")
+    parser.add_argument("--data", default=DATA_FILE, help="library JSON file")
+    parser.add_argument("--db", help="SQLite library (overrides --data)")
+    parser.add_argument("--dry-run", action="store_true", help="validate the import without writing")
+    args = parser.parse_args(argv)
+
+    path = args.import_path or args.export_path
+    try:
+        fmt = args.format or ("jsonl" if path == "-" else guess_format(path))
+    except ValueError as e:
+        parser.error(str(e))
+    if args.db:
+        from library_db import LibraryDB
+        target = LibraryDB(args.db)
+    else:
+        from library_store import LibraryStore
+        target = LibraryStore(args.data)
+
+    if args.export_path:
+        items = target.iter_items() if args.db else library_items(target.read())
+        if path == "-":
+            count = export_items(items, sys.stdout, fmt)
+        else:
+            with open(path, "w", encoding="utf-8", newline="") as out:
+                count = export_items(items, out, fmt)
+        print(f"{count} items exported", file=sys.stderr)
+        return 0
+
+    with open(path, encoding="utf-8-sig", newline="") as stream:
+        if args.dry_run:
+            errors: List[RowError] = []
+            valid = sum(1 for _ in read_items(stream, fmt, errors))
+            report = ImportReport(0, 0, errors)
+            print(f"{valid} valid rows", file=sys.stderr)
+        else:
+            report = import_items(stream, fmt, target)
+            print(f"{report.added} items added, {report.duplicates} duplicates skipped", file=sys.stderr)
+    for error in report.errors:
+        print(f"line {error.line}: {error.message}", file=sys.stderr)
+    return 1 if report.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,264 @@
+"""Append-only journaled storage for the prompt library.
+
+The library is a JSON snapshot (DATA_FILE, same format as before) plus a
+JSONL journal of add/remove records next to it. An edit appends one line
+under an exclusive file lock, so it costs O(1) regardless of library size
+and concurrent sessions or worker processes never overwrite each other's
+additions. Once the journal grows past compact_bytes it is folded into a new
+snapshot, written to a temporary file and swapped in with os.replace.
+
+Replaying a record is idempotent (adds set presence, removes clear it), so
+the state only depends on the last record per item. Items are indexed by
+item_key, so equivalent spellings ("Neon  Glow" / "neon glow") are one item
+and duplicate checks are O(1). Older files may still hold duplicates:
+
+    python library_store.py --dry-run   # list them
+    python library_store.py             # rewrite the file without them
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+from contextlib import contextmanager
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Set, Tuple
+
+from library import (
+    CATEGORIES, DATA_FILE, MAPPING_CATEGORIES, ItemIndex, file_signature, freeze_index, index_items,
+    item_key, items_layout, load_library
+)
+
+try:
+    import fcntl
+except ImportError:  # Windows: locking is only process-local
+    fcntl = None
+
+JOURNAL_SUFFIX = ".journal.jsonl"
+COMPACT_BYTES = 256 * 1024
+
+
+def apply_record(data: Dict[str, ItemIndex], record: Mapping[str, Any]) -> Optional[str]:
+    """Apply one journal record in place (O(1)); returns the category it touched"""
+    category = record.get("category")
+    item = record.get("item")
+    if category not in data or not isinstance(item, str):
+        return None
+    items = data[category]
+    key = item_key(item)
+    if record.get("op") == "add":
+        if category in MAPPING_CATEGORIES:
+            # A new description for an existing item keeps its first spelling
+            name = items[key][0] if key in items else item
+            items[key] = (name, record.get("value", ""))
+        elif key in items:
+            return None
+        else:
+            items[key] = (item, None)
+    elif record.get("op") == "remove":
+        if items.pop(key, None) is None:
+            return None
+    else:
+        return None
+    return category
+
+
+def _parse_lines(chunk: bytes) -> Iterator[Dict[str, Any]]:
+    for line in chunk.splitlines():
+        try:
+            yield json.loads(line)
+        except ValueError:
+            continue  # torn write from a crashed process
+
+
+class LibraryStore:
+    """Snapshot + journal for one library file; safe to share between threads"""
+
+    def __init__(self, path: str = DATA_FILE, compact_bytes: int = COMPACT_BYTES):
+        self.path = path
+        self.journal_path = path + JOURNAL_SUFFIX
+        self.compact_bytes = compact_bytes
+        self._thread_lock = threading.RLock()
+        # (snapshot signature, journal offset, live data, frozen view)
+        self._state: Optional[Tuple[Optional[Tuple[int, int]], int, Dict[str, ItemIndex], Mapping[str, Any]]] = None
+
+    @contextmanager
+    def _journal(self, exclusive: bool) -> Iterator[Optional[int]]:
+        """Journal file descriptor under a shared or exclusive lock; None when
+        reading and nothing has been journaled yet"""
+        with self._thread_lock:
+            # Compaction truncates in place, so the journal itself can carry the lock
+            flags = os.O_RDWR | os.O_APPEND | os.O_CREAT if exclusive else os.O_RDONLY
+            flags |= getattr(os, "O_BINARY", 0)  # no newline translation on Windows
+            try:
+                fd = os.open(self.journal_path, flags, 0o644)
+            except FileNotFoundError:
+                fd = None
+            if fd is None:
+                yield None
+                return
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                yield fd
+            finally:
+                os.close(fd)
+
+    def _append(self, *records: Dict[str, Any]) -> int:
+        data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode("utf-8")
+        with self._journal(exclusive=True) as fd:
+            written = 0
+            while written < len(data):
+                written += os.write(fd, data[written:])
+            return os.fstat(fd).st_size
+
+    @staticmethod
+    def _add_record(category: str, item: str, value: Optional[str]) -> Dict[str, Any]:
+        record = {"op": "add", "category": category, "item": item}
+        if category in MAPPING_CATEGORIES:
+            record["value"] = value or ""
+        return record
+
+    def add(self, category: str, item: str, value: Optional[str] = None):
+        """Record an added item (value is the description for mapping categories)"""
+        if self._append(self._add_record(category, item, value)) >= self.compact_bytes:
+            self.compact()
+
+    def add_items(self, items: Iterable[Tuple[str, str, Optional[str]]]) -> int:
+        """Record many (category, name, value) additions with a single journal write
+        (and at most one compaction); items the library or an earlier row already
+        has are skipped. Returns how many were new"""
+        library = self.read()
+        seen: Set[Tuple[str, str]] = set()
+        records = []
+        for category, name, value in items:
+            key = (category, item_key(name))
+            if key in seen or library[category].find(name) is not None:
+                continue
+            seen.add(key)
+            records.append(self._add_record(category, name, value))
+        if records and self._append(*records) >= self.compact_bytes:
+            self.compact()
+        return len(records)
+
+    def remove(self, category: str, item: str):
+        if self._append({"op": "remove", "category": category, "item": item}) >= self.compact_bytes:
+            self.compact()
+
+    @staticmethod
+    def _read_journal(fd: Optional[int], offset: int) -> Tuple[List[Dict[str, Any]], int]:
+        """Complete records after offset, and the offset just past them"""
+        if fd is None:
+            return [], 0
+        size = os.fstat(fd).st_size
+        # lseek + read rather than os.pread, which Windows lacks; the fd is private to this call
+        os.lseek(fd, offset, os.SEEK_SET)
+        parts = []
+        remaining = size - offset
+        while remaining > 0:
+            part = os.read(fd, remaining)
+            if not part:
+                break
+            parts.append(part)
+            remaining -= len(part)
+        chunk = b"".join(parts)
+        complete = chunk.rfind(b"\n") + 1
+        return list(_parse_lines(chunk[:complete])), offset + complete
+
+    def _load_snapshot(self) -> Dict[str, ItemIndex]:
+        return {category: index_items(items) for category, items in load_library(self.path).items()}
+
+    def read(self) -> Mapping[str, Any]:
+        """Current library, frozen and shared; only journal records appended since
+        the previous call are parsed"""
+        with self._journal(exclusive=False) as fd:
+            signature = file_signature(self.path)
+            state = self._state
+            if state is None or state[0] != signature:
+                data = self._load_snapshot()
+                records, offset = self._read_journal(fd, 0)
+                touched: Set[str] = set(CATEGORIES)
+                view: Mapping[str, Any] = {}
+            else:
+                _, offset, data, view = state
+                records, offset = self._read_journal(fd, offset)
+                touched = set()
+            for record in records:
+                category = apply_record(data, record)
+                if category:
+                    touched.add(category)
+            if touched:
+                # Copy-on-write: only changed categories are refrozen, the rest are shared
+                categories = dict(view)
+                categories.update((category, freeze_index(category, data[category])) for category in touched)
+                view = MappingProxyType(categories)
+            self._state = (signature, offset, data, view)
+            return view
+
+    def compact(self, force: bool = False) -> bool:
+        """Fold the journal into a new snapshot (atomic rename) and empty the journal;
+        force rewrites the snapshot even with an empty journal (drops duplicates)"""
+        with self._journal(exclusive=True) as fd:
+            if os.fstat(fd).st_size == 0 and not force:
+                return False
+            data = self._load_snapshot()
+            records, _ = self._read_journal(fd, 0)
+            for record in records:
+                apply_record(data, record)
+            directory = os.path.dirname(os.path.abspath(self.path))
+            tmp_fd, tmp_path = tempfile.mkstemp(prefix=".library-", suffix=".json", dir=directory)
+            try:
+                with os.fdopen(tmp_fd, "w", encoding="utf-8") as f:
+                    json.dump({category: items_layout(category, items) for category, items in data.items()},
+                              f, ensure_ascii=False, indent=2)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.chmod(tmp_path, 0o644)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            # Readers hold the shared lock, so none sees the new snapshot with the old journal
+            os.ftruncate(fd, 0)
+            self._state = None
+            return True
+
+    def duplicates(self) -> Dict[str, List[str]]:
+        """Items of the snapshot file that repeat an earlier item (see item_key), per category"""
+        found: Dict[str, List[str]] = {}
+        for category, items in load_library(self.path).items():
+            index = index_items(items)
+            kept = {name for name, _ in index.values()}
+            names = items if isinstance(items, list) else list(items)
+            if len(names) != len(index):
+                # Repeats of a kept spelling are listed too (lists can hold exact copies)
+                seen: Set[str] = set()
+                for name in names:
+                    if name in kept and name not in seen:
+                        seen.add(name)
+                    else:
+                        found.setdefault(category, []).append(name)
+        return found
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Fold the library journal into the JSON file and drop duplicate items")
+    parser.add_argument("--data", default=DATA_FILE)
+    parser.add_argument("--dry-run", action="store_true", help="only list the duplicates")
+    args = parser.parse_args(argv)
+
+    store = LibraryStore(args.data)
+    duplicates = store.duplicates()
+    for category, names in duplicates.items():
+        for name in names:
+            print(f"{category}: {name!r}")
+    print(f"{sum(map(len, duplicates.values()))} duplicates in {args.data}", file=sys.stderr)
+    if not args.dry_run:
+        store.compact(force=bool(duplicates))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
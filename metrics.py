@@ -0,0 +1,291 @@
+"""Process-wide metrics in the Prometheus text format.
+
+Counters, gauges and histograms with labels, kept in memory by one registry
+per process. Each process is scraped (or writes its file) on its own;
+Prometheus sums them. Exporters are opt-in through the environment:
+
+    PROMPT_METRICS_PORT=9464 streamlit run app.py          # GET /metrics
+    PROMPT_METRICS_FILE=/var/lib/node_exporter/prompt.prom python enhancement_pool.py ...
+
+The file is rewritten atomically every PROMPT_METRICS_INTERVAL seconds and at
+exit (node_exporter textfile collector format).
+"""
+import atexit
+import bisect
+import hashlib
+import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, TypeVar
+
+METRICS_PORT = os.environ.get("PROMPT_METRICS_PORT", "")
+METRICS_FILE = os.environ.get("PROMPT_METRICS_FILE", "")
+METRICS_INTERVAL = float(os.environ.get("PROMPT_METRICS_INTERVAL", "15"))
+# Seconds; API calls take from tens of milliseconds to tens of seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Labels = Tuple[str, ...]
+M = TypeVar("M", bound="_Metric")
+
+
+def key_label(api_key: str) -> str:
+    """Stable, non-reversible label for an API key (the same in every process)"""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:8]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Labels:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} takes the labels {', '.join(self.labels) or '(none)'}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def _matches(self, key: Labels, match: Dict[str, str]) -> bool:
+        return all(key[self.labels.index(name)] == str(value) for name, value in match.items())
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def exposition(self) -> str:
+        header = f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.kind}\n"
+        return header + "".join(line + "\n" for line in self.samples())
+
+
+class Counter(_Metric):
+    """Monotonic count per label set"""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def total(self, **match: str) -> float:
+        """Sum over the series whose labels include match"""
+        with self._lock:
+            return sum(value for key, value in self._values.items() if self._matches(key, match))
+
+    def series(self) -> Dict[Labels, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def samples(self) -> Iterable[str]:
+        for key, value in sorted(self.series().items()):
+            yield f"{self.name}{_format_labels(self.labels, key)} {_number(value)}"
+
+
+class Gauge(Counter):
+    """Current value per label set; can go down"""
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: str):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """Cumulative bucket counts, sum and count per label set"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [per-bucket counts (last is +Inf)], sum
+        self._values: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[position] += 1
+            total[0] += value
+
+    def merged(self, **match: str) -> Tuple[List[int], float]:
+        """Per-bucket counts and sum over the series whose labels include match"""
+        counts = [0] * (len(self.buckets) + 1)
+        total = 0.0
+        with self._lock:
+            for key, (series, series_sum) in self._values.items():
+                if self._matches(key, match):
+                    counts = [a + b for a, b in zip(counts, series)]
+                    total += series_sum[0]
+        return counts, total
+
+    def count(self, **match: str) -> int:
+        return sum(self.merged(**match)[0])
+
+    def quantile(self, q: float, **match: str) -> Optional[float]:
+        """Estimate interpolated within the bucket, like PromQL histogram_quantile"""
+        counts, _ = self.merged(**match)
+        rank = q * sum(counts)
+        if not rank:
+            return None
+        seen = 0
+        for i, count in enumerate(counts):
+            if seen + count >= rank:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = {key: (list(counts), total[0]) for key, (counts, total) in self._values.items()}
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, key)} {_number(total)}"
+            yield f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}"
+
+
+class Registry:
+    """Named metrics of one process"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: M) -> M:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def exposition(self) -> str:
+        """All metrics in the Prometheus text format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "".join(metric.exposition() for metric in metrics)
+
+
+REGISTRY = Registry()
+
+API_LATENCY = REGISTRY.register(Histogram(
+    "gemini_request_duration_seconds", "Gemini API request latency", ("model", "key")))
+API_REQUESTS = REGISTRY.register(Counter(
+    "gemini_requests_total", "Gemini API requests by HTTP status (transport_error when none)",
+    ("model", "key", "status")))
+API_TOKENS = REGISTRY.register(Counter(
+    "gemini_tokens_total", "Tokens reported in usageMetadata", ("model", "kind")))
+API_IN_FLIGHT = REGISTRY.register(Gauge(
+    "gemini_requests_in_flight", "Gemini API requests currently outstanding", ("model",)))
+CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "enhancement_cache_lookups_total", "Enhancement cache lookups per tier", ("tier", "result")))
+FALLBACKS = REGISTRY.register(Counter(
+    "enhancement_fallbacks_total",
+    "Enhancements that moved on to another key (next_key) or returned the prompt unenhanced",
+    ("reason",)))
+COALESCED = REGISTRY.register(Counter(
+    "enhancement_coalesced_total",
+    "Enhancements served by an identical call in flight in this process (thread) or another (process)",
+    ("scope",)))
+PREFETCHES = REGISTRY.register(Counter(
+    "enhancement_prefetches_total",
+    "Speculative enhancements by outcome (scheduled, superseded, enhanced, skipped, joined, timeout, ...)",
+    ("outcome",)))
+
+
+def write_textfile(path: str, registry: Registry = REGISTRY):
+    """Write the exposition to path atomically"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".metrics-", suffix=".prom", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(registry.exposition())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry: Registry = REGISTRY
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.registry.exposition().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_http_server(port: int, host: str = "", registry: Registry = REGISTRY) -> ThreadingHTTPServer:
+    """Serve /metrics from a daemon thread; raises OSError if the port is taken"""
+    handler = type("BoundMetricsHandler", (_MetricsHandler,), {"registry": registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics-http").start()
+    return server
+
+
+def start_textfile_writer(path: str, interval: float = METRICS_INTERVAL,
+                          registry: Registry = REGISTRY) -> threading.Event:
+    """Rewrite path every interval seconds and at exit; set the returned event to stop"""
+    stop = threading.Event()
+
+    def loop():
+        while not stop.wait(interval):
+            write_textfile(path, registry)
+
+    threading.Thread(target=loop, daemon=True, name="metrics-file").start()
+    atexit.register(write_textfile, path, registry)
+    return stop
+
+
+def start_exporters() -> List[str]:
+    """Start the exporters configured in the environment; returns what was started"""
+    started = []
+    if METRICS_PORT:
+        start_http_server(int(METRICS_PORT))
+        started.append(f"http://0.0.0.0:{METRICS_PORT}/metrics")
+    if METRICS_FILE:
+        start_textfile_writer(METRICS_FILE)
+        started.append(METRICS_FILE)
+    return started
@@ -0,0 +1,398 @@
+"""Near-duplicate index over previously enhanced prompts.
+
+Second cache tier. Prompts from the generator are comma separated slots
+(quality, style, character, pose, palette, ...) and usually differ from an
+earlier prompt in a single slot, so two sublinear indexes are kept:
+
+- a slot-neighbourhood index: every prompt is filed under its slot set and
+  under each "slot set minus one slot" digest, so prompts that are equal or
+  differ by one substituted/added/removed slot are found with a handful of
+  dict lookups;
+- a MinHash LSH index (word 3-shingles, banded signatures) for general
+  near-duplicates, verified with exact Jaccard.
+
+A match carries the slot-level diff against the stored prompt so the stored
+enhancement can be patched (old slot text swapped for the new one) instead of
+paying for a new API call. Lookups never touch the network.
+"""
+import hashlib
+import re
+import struct
+import threading
+import time
+import unicodedata
+from array import array
+from difflib import SequenceMatcher
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # optional: only speeds up signature computation
+    np = None
+
+
+DEFAULT_THRESHOLD = 0.9
+# Suggested opt-in lower bar (lookup's patch_threshold) for matches whose slot diff
+# could be patched into the stored enhancement
+PATCH_THRESHOLD = 0.5
+MAX_SLOT_EDITS = 1
+NUM_PERM = 64
+LSH_BANDS = 8  # 8 bands x 8 rows: ~0.99 recall at 0.9 similarity, few candidates below 0.5
+SHINGLE_SIZE = 3
+MAX_CANDIDATES = 16  # verified against a stored fingerprint each, so cheap
+# Re-read this many seconds before the last sync; concurrent writers may commit out of order
+SYNC_OVERLAP = 5.0
+
+_TOKEN = re.compile(r"[\w'-]+")
+# 64 independent 32-bit hashes per shingle from one extendable-output digest
+_UNPACK = struct.Struct(f"<{NUM_PERM}I").unpack
+
+
+def shingles(text: str, k: int = SHINGLE_SIZE) -> FrozenSet[str]:
+    """Word k-shingles of the case-folded prompt"""
+    if not text.isascii():
+        text = unicodedata.normalize("NFC", text)
+    tokens = _TOKEN.findall(text.casefold())
+    if len(tokens) < k:
+        return frozenset([" ".join(tokens)]) if tokens else frozenset()
+    return frozenset(map(" ".join, zip(*(tokens[i:] for i in range(k)))))
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a and not b:
+        return 1.0
+    common = len(a & b)
+    return common / (len(a) + len(b) - common)
+
+
+def minhash(items: FrozenSet[str]) -> Tuple[int, ...]:
+    """MinHash signature; stable across processes"""
+    if not items:
+        return (0,) * NUM_PERM
+    if np is not None:
+        digests = b"".join(hashlib.shake_128(item.encode("utf-8")).digest(NUM_PERM * 4) for item in items)
+        return tuple(np.frombuffer(digests, dtype="<u4").reshape(-1, NUM_PERM).min(axis=0).tolist())
+    rows = [_UNPACK(hashlib.shake_128(item.encode("utf-8")).digest(NUM_PERM * 4)) for item in items]
+    return tuple(map(min, zip(*rows)))
+
+
+def split_slots(prompt: str) -> List[str]:
+    """Comma separated slots with whitespace collapsed"""
+    parts = (" ".join(part.split()) for part in unicodedata.normalize("NFC", prompt).split(","))
+    return [part for part in parts if part]
+
+
+def _slot_set(slots: Sequence[str]) -> FrozenSet[str]:
+    return frozenset(slot.casefold() for slot in slots)
+
+
+class SlotEdit(NamedTuple):
+    """One differing stretch of slots; anchor is the slot preceding an insertion"""
+    old: str
+    new: str
+    anchor: str
+
+
+def slot_diff(old_prompt: str, new_prompt: str) -> List[SlotEdit]:
+    """Slot-level edits that turn old_prompt into new_prompt"""
+    old_slots, new_slots = split_slots(old_prompt), split_slots(new_prompt)
+    old_folded, new_folded = [s.casefold() for s in old_slots], [s.casefold() for s in new_slots]
+    # Neighbours share most slots at both ends: only the middle needs a real diff
+    head = 0
+    while head < min(len(old_folded), len(new_folded)) and old_folded[head] == new_folded[head]:
+        head += 1
+    tail = 0
+    while (tail < min(len(old_folded), len(new_folded)) - head
+           and old_folded[-1 - tail] == new_folded[-1 - tail]):
+        tail += 1
+    old_end, new_end = len(old_folded) - tail, len(new_folded) - tail
+    if head == old_end and head == new_end:
+        opcodes = []
+    elif head in (old_end, new_end) or (old_end - head, new_end - head) == (1, 1):
+        opcodes = [("replace", head, old_end, head, new_end)]
+    else:
+        matcher = SequenceMatcher(a=old_folded[head:old_end], b=new_folded[head:new_end], autojunk=False)
+        opcodes = [(tag, i1 + head, i2 + head, j1 + head, j2 + head)
+                   for tag, i1, i2, j1, j2 in matcher.get_opcodes()]
+    edits = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag != "equal":
+            anchor = old_slots[i1 - 1] if i1 > 0 else ""
+            edits.append(SlotEdit(", ".join(old_slots[i1:i2]), ", ".join(new_slots[j1:j2]), anchor))
+    return edits
+
+
+def _find_phrase(text: str, phrase: str) -> Optional[Tuple[int, int]]:
+    """Span of the only whole-word occurrence of phrase in text (any case); None when it is
+    missing, only part of a longer word (e.g. "hero" in "superheroes") or ambiguous"""
+    pattern = re.compile(r"(?<!\w)" + re.escape(phrase) + r"(?!\w)", re.IGNORECASE)
+    found = pattern.search(text)
+    if found is None or pattern.search(text, found.start() + 1) is not None:
+        return None
+    return found.span()
+
+
+def patch_enhancement(enhanced: str, edits: Sequence[SlotEdit]) -> Optional[str]:
+    """Apply slot edits to a stored enhancement; None unless every old slot (or the
+    anchor of an insertion) occurs exactly once there as whole words"""
+    for edit in edits:
+        if edit.old:
+            span = _find_phrase(enhanced, edit.old)
+            if span is None:
+                return None
+            start, end = span
+            if not edit.new:
+                # Drop the separator along with a removed slot
+                trailing = re.match(r"\s*,\s*", enhanced[end:])
+                end += trailing.end() if trailing else 0
+            enhanced = enhanced[:start] + edit.new + enhanced[end:]
+        elif edit.new:
+            span = _find_phrase(enhanced, edit.anchor) if edit.anchor else None
+            if edit.anchor and span is None:
+                return None
+            position = span[1] if span else 0
+            insert = f", {edit.new}" if span else f"{edit.new}, "
+            enhanced = enhanced[:position] + insert + enhanced[position:]
+    return enhanced
+
+
+class Match(NamedTuple):
+    key: str
+    prompt: str
+    value: str
+    similarity: float
+    slot_diff: List[SlotEdit]
+
+
+class _Entry(NamedTuple):
+    key: str
+    prompt: str
+    value: str
+    partition: str
+    created: float
+    fingerprint: array  # hashes of the prompt's shingles, for the exact Jaccard at lookup
+    buckets: Tuple[Tuple[int, ...], Tuple[int, ...]]  # (slot, LSH) keys, to unlink on eviction
+
+
+def _bucket_add(buckets: Dict[int, object], bucket: int, entry_id: int):
+    # Most buckets hold a single entry; only promote to a set on collision
+    existing = buckets.get(bucket)
+    if existing is None:
+        buckets[bucket] = entry_id
+    elif isinstance(existing, set):
+        existing.add(entry_id)
+    elif existing != entry_id:
+        buckets[bucket] = {existing, entry_id}
+
+
+def _bucket_remove(buckets: Dict[int, object], bucket: int, entry_id: int):
+    existing = buckets.get(bucket)
+    if existing == entry_id:
+        del buckets[bucket]
+    elif isinstance(existing, set):
+        existing.discard(entry_id)
+        if len(existing) == 1:
+            buckets[bucket] = existing.pop()
+
+
+def _bucket_get(buckets: Dict[int, object], bucket: int) -> Sequence[int]:
+    found = buckets.get(bucket)
+    if found is None:
+        return ()
+    return found if isinstance(found, set) else (found,)
+
+
+class NearDuplicateIndex:
+    """In-memory index, partitioned by generation settings (model, focus).
+
+    Mirrors the persistent cache's limits: entries older than ttl are never
+    returned, and beyond max_entries the oldest are dropped.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, max_entries: Optional[int] = None,
+                 ttl: Optional[float] = None):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # Insertion order is (roughly) creation order: the oldest entries come first
+        self._entries: Dict[int, _Entry] = {}
+        self._ids: Dict[Tuple[str, str], int] = {}
+        self._next_id = 0
+        self._slot_buckets: Dict[int, object] = {}
+        self._lsh_buckets: Dict[int, object] = {}
+        self._lock = threading.Lock()
+        # Newest cache entry already loaded by sync_from_cache; held while a sync runs
+        self.synced_until = 0.0
+        self.sync_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @staticmethod
+    def _slot_keys(partition: str, slots: Iterable[str]) -> List[int]:
+        """Digest of the slot set first, then of the set minus each slot. A set's digest is
+        the XOR of its slots' hashes, so each neighbour costs one XOR, not a new frozenset"""
+        hashes = [hash(slot) for slot in slots]
+        whole = 0
+        for slot_hash in hashes:
+            whole ^= slot_hash
+        keys = [hash((partition, whole))]
+        keys.extend(hash((partition, whole ^ slot_hash)) for slot_hash in hashes)
+        return keys
+
+    @staticmethod
+    def _band_keys(partition: str, signature: Tuple[int, ...]) -> List[int]:
+        rows = NUM_PERM // LSH_BANDS
+        return [hash((partition, band, signature[band * rows:(band + 1) * rows]))
+                for band in range(LSH_BANDS)]
+
+    def _expired(self, entry: _Entry, now: float) -> bool:
+        return self.ttl is not None and now - entry.created > self.ttl
+
+    def add(self, key: str, prompt: str, value: str, partition: str = "",
+            created: Optional[float] = None):
+        """Index an enhancement; created defaults to now (cache rows pass their own)"""
+        created = time.time() if created is None else created
+        prompt_shingles = shingles(prompt)
+        fingerprint = array("q", map(hash, prompt_shingles))
+        band_keys = tuple(self._band_keys(partition, minhash(prompt_shingles)))
+        slot_keys = tuple(self._slot_keys(partition, _slot_set(split_slots(prompt))))
+        with self._lock:
+            entry_id = self._ids.get((partition, key))
+            if entry_id is not None:
+                # Same cache key re-added: same prompt, so the buckets stay; refresh value and age
+                del self._entries[entry_id]
+            else:
+                entry_id = self._next_id
+                self._next_id += 1
+                self._ids[(partition, key)] = entry_id
+                for bucket in slot_keys:
+                    _bucket_add(self._slot_buckets, bucket, entry_id)
+                for bucket in band_keys:
+                    _bucket_add(self._lsh_buckets, bucket, entry_id)
+            self._entries[entry_id] = _Entry(key, prompt, value, partition, created, fingerprint,
+                                             (slot_keys, band_keys))
+            self._evict(time.time())
+
+    def _evict(self, now: float):
+        """Drop expired entries and the oldest beyond max_entries (caller holds the lock)"""
+        while self._entries:
+            entry_id = next(iter(self._entries))
+            entry = self._entries[entry_id]
+            over = self.max_entries is not None and len(self._entries) > self.max_entries
+            if not over and not self._expired(entry, now):
+                break
+            del self._entries[entry_id]
+            del self._ids[(entry.partition, entry.key)]
+            slot_keys, band_keys = entry.buckets
+            for bucket in slot_keys:
+                _bucket_remove(self._slot_buckets, bucket, entry_id)
+            for bucket in band_keys:
+                _bucket_remove(self._lsh_buckets, bucket, entry_id)
+
+    def _candidates(self, prompt: str, partition: str, query_shingles: FrozenSet[str]) -> List[int]:
+        """Up to MAX_CANDIDATES slot neighbours however large their buckets (same slot set
+        first), else the MAX_CANDIDATES LSH entries sharing the most bands"""
+        # Neighbours missing a short slot first: they share the most words with the query
+        slot_keys = self._slot_keys(partition, sorted(_slot_set(split_slots(prompt)), key=len))
+        with self._lock:
+            found: Dict[int, None] = {}
+            for bucket in slot_keys:
+                for entry_id in _bucket_get(self._slot_buckets, bucket):
+                    found[entry_id] = None
+                    if len(found) >= MAX_CANDIDATES:
+                        return list(found)
+            if found:
+                return list(found)
+        # The signature is only needed when the cheap slot lookup found nothing
+        signature = minhash(query_shingles)
+        with self._lock:
+            collisions: Dict[int, int] = {}
+            for bucket in self._band_keys(partition, signature):
+                for entry_id in _bucket_get(self._lsh_buckets, bucket):
+                    collisions[entry_id] = collisions.get(entry_id, 0) + 1
+        return sorted(collisions, key=collisions.__getitem__, reverse=True)[:MAX_CANDIDATES]
+
+    def lookup(self, prompt: str, partition: str = "",
+               threshold: Optional[float] = None,
+               max_slot_edits: int = MAX_SLOT_EDITS,
+               patch_threshold: Optional[float] = None) -> Optional[Match]:
+        """Closest stored prompt at or above the similarity threshold. With patch_threshold
+        (opt-in), a prompt below the threshold but above patch_threshold also matches when
+        it is within max_slot_edits slot edits"""
+        threshold = self.threshold if threshold is None else threshold
+        floor = threshold if patch_threshold is None else min(threshold, patch_threshold)
+        query_shingles = shingles(prompt)
+        query_hashes = frozenset(map(hash, query_shingles))
+        now = time.time()
+        scored = []
+        for entry_id in self._candidates(prompt, partition, query_shingles):
+            entry = self._entries.get(entry_id)
+            if entry is None or entry.partition != partition or self._expired(entry, now):
+                continue  # evicted meanwhile, hash bucket collision, or past the cache TTL
+            # Jaccard over shingle hashes: no need to re-shingle the stored prompt
+            common = len(query_hashes.intersection(entry.fingerprint))
+            union = len(query_hashes) + len(entry.fingerprint) - common
+            similarity = common / union if union else 1.0
+            if similarity >= floor:
+                scored.append((similarity, entry_id, entry))
+                if similarity == 1.0:
+                    break  # nothing can be closer
+
+        # Most similar first; the (costlier) slot diff only decides candidates below the threshold
+        for similarity, _, entry in sorted(scored, key=lambda item: item[:2], reverse=True):
+            edits = slot_diff(entry.prompt, prompt)
+            if similarity >= threshold or len(edits) <= max_slot_edits:
+                return Match(entry.key, entry.prompt, entry.value, similarity, edits)
+        return None
+
+
+def reuse_enhancement(match: Match, threshold: float = DEFAULT_THRESHOLD) -> Optional[str]:
+    """Enhancement to reuse for a match: patched when the slot diff applies cleanly,
+    unpatched only when the prompts are similar enough for the diff not to matter"""
+    if not match.slot_diff:
+        return match.value
+    patched = patch_enhancement(match.value, match.slot_diff)
+    if patched is not None:
+        return patched
+    return match.value if match.similarity >= threshold else None
+
+
+def _sync(index: NearDuplicateIndex, cache) -> int:
+    since = index.synced_until - SYNC_OVERLAP
+    if index.ttl is not None:
+        since = max(since, time.time() - index.ttl)
+    rows = cache.entries_since(since)
+    if index.max_entries is not None:
+        rows = rows[-index.max_entries:]  # oldest first: only the newest would survive anyway
+    for key, prompt, partition, value, created in rows:
+        index.add(key, prompt, value, partition or "", created)
+        index.synced_until = max(index.synced_until, created)
+    return len(rows)
+
+
+def sync_from_cache(index: NearDuplicateIndex, cache) -> int:
+    """Load entries other processes (or earlier runs) wrote to the persistent cache.
+    Returns 0 at once while another thread is syncing, e.g. the initial warm-up"""
+    if not index.sync_lock.acquire(blocking=False):
+        return 0
+    try:
+        return _sync(index, cache)
+    finally:
+        index.sync_lock.release()
+
+
+def warm_from_cache(index: NearDuplicateIndex, cache) -> threading.Thread:
+    """Initial sync on a daemon thread, so a fresh process does not load the whole
+    cache inside the first request; lookups meanwhile see a partial index"""
+    index.sync_lock.acquire()  # taken here so no request-time sync starts the full load first
+
+    def warm():
+        try:
+            _sync(index, cache)
+        finally:
+            index.sync_lock.release()
+
+    thread = threading.Thread(target=warm, daemon=True, name="similarity-warm")
+    thread.start()
+    return thread
@@ -0,0 +1,171 @@
+"""Search index for large option lists in the selectors.
+
+Every word of every name is kept in one sorted array, so the names that
+contain a word starting with the query are a bisect range in it: a
+keystroke costs O(log n + page size) instead of a scan over the whole
+list, and only one page of matches is sent to the browser. Matching is
+case- and accent-insensitive. Several query words intersect their ranges
+as sets when checking names one by one would not fill a page quickly. A
+query that starts no word matches nothing, and paging stops after
+MAX_MATCHES matches, so no keystroke ever scans the whole list.
+"""
+import bisect
+import re
+import sys
+import unicodedata
+from functools import lru_cache
+from itertools import accumulate, islice
+from typing import Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+PAGE_SIZE = 50
+# Deepest a query pages; beyond it the query has to be narrowed
+MAX_MATCHES = 500
+# Queries per index whose matches are kept for paging
+RECENT_QUERIES = 32
+# Least names a multi-word query checks one by one before intersecting its word ranges
+CHECK_BUDGET = 512
+
+_WORD = re.compile(r"\w+")
+_MAX_CHAR = chr(sys.maxunicode)
+
+
+def fold(text: str) -> str:
+    """Case-folded words without accents, joined by single spaces"""
+    text = text.casefold()
+    if not text.isascii():
+        decomposed = unicodedata.normalize("NFKD", text)
+        text = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(_WORD.findall(text))
+
+
+class SearchPage(NamedTuple):
+    names: List[str]
+    has_more: bool
+    capped: bool = False  # on the page that reaches MAX_MATCHES: further matches exist
+
+
+class OptionIndex:
+    """Immutable word-prefix index over one list of names; share it between sessions"""
+    __slots__ = ("names", "_text", "_starts", "_words", "_owners", "_recent")
+
+    def __init__(self, names: Sequence[str]):
+        self.names = names
+        self._recent = lru_cache(maxsize=RECENT_QUERIES)(self._paged_matches)
+        folded = [fold(name) for name in names]
+        # All folded names in one string, each behind a space so " " + token is
+        # found exactly where a word starts with token
+        self._text = "".join(" " + name + "\n" for name in folded)
+        self._starts = list(accumulate((len(name) + 2 for name in folded), initial=0))
+        words: List[str] = []
+        owners: List[int] = []
+        for i, name in enumerate(folded):
+            unique = set(map(sys.intern, name.split()))
+            words.extend(unique)
+            owners.extend([i] * len(unique))
+        order = sorted(range(len(words)), key=words.__getitem__)  # stable: library order per word
+        self._words = list(map(words.__getitem__, order))
+        # Lists rather than arrays: slices of them feed sets and dicts without boxing every int
+        self._owners = list(map(owners.__getitem__, order))
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def _folded(self, i: int) -> str:
+        return self._text[self._starts[i]:self._starts[i + 1] - 1]
+
+    def _range(self, token: str) -> Tuple[int, int]:
+        return (bisect.bisect_left(self._words, token),
+                bisect.bisect_left(self._words, token + _MAX_CHAR))
+
+    def _unique_owners(self, lo: int, hi: int, wanted: int, keep: Optional[Set[int]] = None) -> List[int]:
+        """First wanted distinct names in [lo, hi) of the word array (only those in keep),
+        deduplicated a growing chunk at a time in C"""
+        found: Dict[int, None] = {}
+        chunk = 64
+        while lo < hi and len(found) < wanted:
+            owners = self._owners[lo:min(lo + chunk, hi)]
+            found.update(dict.fromkeys(owners if keep is None else filter(keep.__contains__, owners)))
+            lo += chunk
+            chunk = min(chunk * 2, 8192)
+        return list(islice(found, wanted))
+
+    def _intersection(self, ranges: List[Tuple[int, int]], needles: List[str]) -> Set[int]:
+        """Names with a word in every range; ranges narrowest first"""
+        lo, hi = ranges[0]
+        keep = set(self._owners[lo:hi])
+        for (lo, hi), needle in zip(ranges[1:], needles[1:]):
+            if not keep:
+                break
+            if hi - lo <= 4 * len(keep):
+                keep.intersection_update(self._owners[lo:hi])
+            else:  # a far wider range: checking the few names left is cheaper
+                keep = {i for i in keep if needle in self._folded(i)}
+        return keep
+
+    def _matches(self, tokens: List[str], wanted: int) -> List[int]:
+        """First wanted names matching every token, grouped by the narrowest token's words"""
+        ranked = sorted(((self._range(token), " " + token) for token in tokens),
+                        key=lambda item: item[0][1] - item[0][0])
+        ranges = [item[0] for item in ranked]
+        needles = [item[1] for item in ranked]
+        lo, hi = ranges[0]
+        if len(ranges) == 1 or lo == hi:
+            return self._unique_owners(lo, hi, wanted)
+        # Dense: check the other words name by name, which fills a page quickly when many
+        # names match, until the density seen so far says intersecting would be cheaper
+        narrowest = hi - lo
+        budget = max(CHECK_BUDGET, (2 * narrowest + sum(min(end - start, 4 * narrowest)
+                                                        for start, end in ranges[1:])) // 5)
+        found: Dict[int, None] = {}
+        text, starts, others = self._text, self._starts, needles[1:]
+        for chunk in range(lo, hi, 256):
+            for i in self._owners[chunk:min(chunk + 256, hi)]:
+                if i in found:
+                    continue
+                folded = text[starts[i]:starts[i + 1]]
+                for needle in others:
+                    if needle not in folded:
+                        break
+                else:
+                    found[i] = None
+                    if len(found) >= wanted:
+                        return list(found)
+            if (len(found) + 1) * budget < wanted * (chunk + 256 - lo):
+                break
+        else:
+            return list(found)
+        # Sparse: intersect the ranges as sets and walk the narrowest one for the order
+        return self._unique_owners(lo, hi, wanted, self._intersection(ranges, needles))
+
+    def _paged_matches(self, tokens: Tuple[str, ...]) -> Tuple[str, ...]:
+        """Up to MAX_MATCHES + 1 matching names; cached per index for the pages of recent queries"""
+        return tuple(self.names[i] for i in self._matches(list(tokens), MAX_MATCHES + 1))
+
+    def search(self, query: str, offset: int = 0, limit: int = PAGE_SIZE,
+               extra: Sequence[str] = ()) -> SearchPage:
+        """One page of names matching every word of query by word prefix (grouped by the
+        matching word; library order for an empty query). extra are a few names searched
+        by a plain scan after the indexed ones, e.g. a session's unsaved additions"""
+        tokens = fold(query).split()
+        if not tokens:
+            total = len(self.names) + len(extra)
+            page = list(self.names[offset:offset + limit])
+            if len(page) < limit:
+                page.extend(extra[max(0, offset - len(self.names)):offset + limit - len(self.names)])
+            return SearchPage(page, total > offset + limit)
+        wanted = min(offset + limit, MAX_MATCHES) + 1
+        if wanted <= PAGE_SIZE + 1:
+            names = [self.names[i] for i in self._matches(tokens, wanted)]
+        else:  # paging: all pages of the query come from one computation
+            names = list(self._recent(tuple(tokens)))
+        if len(names) < wanted and extra:
+            needles = [" " + token for token in tokens]
+            for name in extra:
+                folded = " " + fold(name)
+                if all(needle in folded for needle in needles):
+                    names.append(name)
+                    if len(names) >= wanted:
+                        break
+        capped = len(names) > MAX_MATCHES
+        stop = min(offset + limit, MAX_MATCHES)
+        return SearchPage(names[offset:stop], len(names) > stop and stop < MAX_MATCHES, capped)
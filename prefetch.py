@@ -0,0 +1,138 @@
+"""Speculative, debounced background enhancement.
+
+Every rerun of the generator form schedules the current selection for its
+session. A job only starts once the selection has been left alone for the
+debounce interval; a newer selection from the same session replaces the
+pending job (superseded), so quickly clicking through options costs nothing.
+Jobs run on a small thread pool and write to the enhancement cache, so the
+later click is a cache hit. A job that is already running is not
+interrupted; a click on the same prompt waits for it, up to CLAIM_TIMEOUT,
+before sending its own request. The job is never shared with the click, so
+the click's call is not held up by a job that hangs.
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from metrics import PREFETCHES
+
+PREFETCH_DEBOUNCE = float(os.environ.get("PROMPT_PREFETCH_DEBOUNCE", "1.0"))
+PREFETCH_WORKERS = int(os.environ.get("PROMPT_PREFETCH_WORKERS", "2"))
+# Longest a click waits for a running prefetch of its prompt before calling the API itself.
+# Deliberately below the HTTP timeouts: the job keeps running detached from the click
+CLAIM_TIMEOUT = float(os.environ.get("PROMPT_PREFETCH_CLAIM_TIMEOUT", "10"))
+# Single-flight key prefix of prefetch calls, which never coalesce with clicks
+PREFETCH_FLIGHT = "prefetch:"
+MAX_PENDING = 256  # sessions with a scheduled job; the oldest is dropped beyond this
+
+
+class _Job:
+    __slots__ = ("session", "key", "run", "due", "cancelled")
+
+    def __init__(self, session: str, key: str, run: Callable[[], bool], due: float):
+        self.session = session
+        self.key = key
+        self.run = run
+        self.due = due
+        self.cancelled = False
+
+
+class _Running:
+    """A job on the pool; enhanced is only meaningful once done is set"""
+    __slots__ = ("done", "enhanced")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.enhanced = False
+
+
+class Prefetcher:
+    """Process-wide debounced job queue, one pending job per session"""
+
+    def __init__(self, debounce: float = PREFETCH_DEBOUNCE, workers: int = PREFETCH_WORKERS):
+        self.debounce = debounce
+        self._pending: Dict[str, _Job] = {}  # by session
+        self._queue: List[Tuple[float, int, _Job]] = []  # (due, tie-breaker, job) heap
+        self._order = itertools.count()
+        self._running: Dict[str, _Running] = {}  # by key
+        self._lock = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        threading.Thread(target=self._dispatch, daemon=True, name="prefetch-dispatch").start()
+
+    def schedule(self, session: str, key: str, run: Callable[[], bool]):
+        """Run run() after the debounce interval unless the session schedules something else
+        first. run returns False when there was nothing to do (e.g. already cached)"""
+        with self._lock:
+            current = self._pending.get(session)
+            if current is not None:
+                if current.key == key:
+                    return  # same selection rerendered: keep the original deadline
+                current.cancelled = True
+                PREFETCHES.inc(outcome="superseded")
+            if key in self._running:
+                self._pending.pop(session, None)
+                return
+            if session not in self._pending and len(self._pending) >= MAX_PENDING:
+                oldest = min(self._pending.values(), key=lambda job: job.due)
+                oldest.cancelled = True
+                del self._pending[oldest.session]
+                PREFETCHES.inc(outcome="dropped")
+            job = self._pending[session] = _Job(session, key, run, time.monotonic() + self.debounce)
+            heapq.heappush(self._queue, (job.due, next(self._order), job))
+            PREFETCHES.inc(outcome="scheduled")
+            self._lock.notify()
+
+    def cancel(self, session: str):
+        """Drop the session's pending job (e.g. when it turns speculation off)"""
+        with self._lock:
+            job = self._pending.pop(session, None)
+            if job is not None:
+                job.cancelled = True
+                PREFETCHES.inc(outcome="cancelled")
+
+    def claim(self, key: str, timeout: Optional[float] = CLAIM_TIMEOUT) -> bool:
+        """Called before enhancing key in the foreground: cancels a pending job for it
+        and waits up to timeout for a running one. True only if that job enhanced the
+        prompt (it is then in the cache); otherwise the caller goes ahead at once"""
+        with self._lock:
+            for session, job in list(self._pending.items()):
+                if job.key == key:
+                    job.cancelled = True
+                    del self._pending[session]
+                    PREFETCHES.inc(outcome="claimed")
+            running = self._running.get(key)
+        if running is None:
+            return False
+        PREFETCHES.inc(outcome="joined")
+        if not running.done.wait(timeout):
+            PREFETCHES.inc(outcome="timeout")
+            return False
+        return running.enhanced
+
+    def _dispatch(self):
+        while True:
+            with self._lock:
+                while not self._queue or self._queue[0][0] > time.monotonic():
+                    self._lock.wait(None if not self._queue else self._queue[0][0] - time.monotonic())
+                _, _, job = heapq.heappop(self._queue)
+                if job.cancelled or job.key in self._running:
+                    continue
+                if self._pending.get(job.session) is job:
+                    del self._pending[job.session]
+                running = self._running[job.key] = _Running()
+            self._executor.submit(self._run, job, running)
+
+    def _run(self, job: _Job, running: _Running):
+        try:
+            running.enhanced = bool(job.run())
+            PREFETCHES.inc(outcome="enhanced" if running.enhanced else "skipped")
+        except Exception:
+            PREFETCHES.inc(outcome="failed")  # speculative: the click retries in the foreground
+        finally:
+            with self._lock:
+                del self._running[job.key]
+            running.done.set()
@@ -0,0 +1,259 @@
+"""Headless prompt assembly engine.
+
+Pure Python (no Streamlit imports) so it can be used from the UI, batch
+workers and command line tools alike.
+"""
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+from templates import JsonTemplate, PromptTemplate, Slot
+
+GENERATOR_NAME = "Neon Anime Prompt Generator v2.1"
+DEFAULT_TIMESTAMP = "2025-08-03"
+
+QUALITY_LEVELS = [
+    "masterpiece, best quality, ultra detailed",
+    "8K ultra HD, professional artwork",
+    "award-winning digital art, perfect composition",
+    "studio quality, photorealistic rendering"
+]
+
+VISUAL_EFFECTS = [
+    "soft outer glow",
+    "volumetric lighting",
+    "particle effects",
+    "energy aura",
+    "holographic elements",
+    "light bloom and lens flare",
+    "electromagnetic field visualization"
+]
+
+DEFAULT_EFFECTS = ["soft outer glow", "volumetric lighting"]
+
+
+class PromptSelection(NamedTuple):
+    """Everything the user picks in the generator form"""
+    character: str
+    origin: str
+    pose: str
+    palette_name: str
+    colors: str
+    art_style: str
+    lighting: str
+    background: str
+    mood: str
+    expression: str
+    quality: str = QUALITY_LEVELS[0]
+    effects: Sequence[str] = tuple(DEFAULT_EFFECTS)
+
+    @property
+    def effects_text(self) -> str:
+        return ", ".join(self.effects) if self.effects else "soft outer glow"
+
+
+class PromptResult(NamedTuple):
+    """Output of the engine for a single selection"""
+    base_prompt: str
+    alternative_prompts: Dict[str, str]
+    prompt_data: Dict[str, Any]
+
+
+# Platform templates use {field} slots of PromptSelection and are compiled once
+BASE_TEMPLATE = PromptTemplate(
+    "{quality}, {art_style}, {character} from {origin}, {expression} expression, {pose}, "
+    "wearing detailed outfit with intricate design elements, {lighting} with strong rim lighting "
+    "creating dramatic shadows, {background}, {colors} with glowing edges and neon accents, "
+    "{effects_text}, {mood} atmosphere, sharp focus, perfect composition, cinematic quality"
+)
+
+PLATFORM_TEMPLATES: Dict[str, PromptTemplate] = {}
+
+
+def register_platform(name: str, source: str) -> PromptTemplate:
+    """Add (or replace) an alternative prompt, e.g.
+    register_platform("flux", "{character}, {pose}, {lighting}, {colors}")"""
+    template = PromptTemplate(source)
+    unknown = [field for field in template.fields if not hasattr(PromptSelection, field)]
+    if unknown:
+        raise ValueError(f"Unknown template fields for {name}: {', '.join(unknown)}")
+    PLATFORM_TEMPLATES[name] = template
+    return template
+
+
+register_platform("short_version", "{art_style}, {character}, {pose}, {colors}, {background}")
+register_platform("midjourney_style",
+                  "{character} from {origin} :: {pose} :: {colors} :: {lighting} :: anime style --ar 16:9 --niji")
+register_platform("stable_diffusion",
+                  "({quality}), {art_style}, {character}, {origin}, {pose}, {colors}, {lighting}, {background}")
+
+
+def build_base_prompt(sel: PromptSelection) -> str:
+    """Build the DALL-E optimized base prompt"""
+    return BASE_TEMPLATE.render(sel)
+
+
+def build_alternative_prompts(sel: PromptSelection) -> Dict[str, str]:
+    """Build the prompt variants for other platforms"""
+    return {name: template.render(sel) for name, template in PLATFORM_TEMPLATES.items()}
+
+
+# Static sections of every prompt_data document (each document gets its own notes dict)
+STYLE_TAGS = (
+    "cyberpunk", "neon", "anime", "digital_art", "futuristic",
+    "glowing_effects", "dramatic_lighting", "high_contrast", "professional_quality"
+)
+PROMPT_ENGINEERING_NOTES = {
+    "strength_keywords": ("masterpiece", "ultra detailed", "professional", "cinematic"),
+    "color_emphasis": "neon glow effects prioritized",
+    "composition_focus": "character-centered with dramatic lighting",
+    "style_consistency": "maintained anime aesthetic with cyberpunk elements"
+}
+
+
+class PromptFields(NamedTuple):
+    """Every value of a prompt_data document that depends on the selection"""
+    timestamp: str
+    version: str
+    ai_enhanced: bool
+    enhancement_model: Optional[str]
+    character: str
+    origin: str
+    expression: str
+    visual_description: str
+    art_style: str
+    pose: str
+    lighting: str
+    background: str
+    mood: str
+    palette_name: str
+    colors: str
+    quality: str
+    visual_effects: List[str]
+    detailed_prompt: str
+    base_prompt: str
+    alternative_prompts: Dict[str, str]
+
+
+def prompt_fields(sel: PromptSelection, base_prompt: str, alternative_prompts: Dict[str, str],
+                  detailed_prompt: Optional[str] = None,
+                  timestamp: str = DEFAULT_TIMESTAMP) -> PromptFields:
+    if detailed_prompt is None:
+        detailed_prompt = base_prompt
+    ai_enhanced = detailed_prompt != base_prompt
+    # Positional: keyword construction of a 20-field NamedTuple costs as much as the rest
+    return PromptFields(
+        timestamp,
+        "professional_ai_enhanced" if ai_enhanced else "professional",
+        ai_enhanced,
+        "ai_model" if ai_enhanced else None,
+        sel.character,
+        sel.origin,
+        sel.expression,
+        f"{sel.expression} {sel.character} with intricate design details",
+        sel.art_style,
+        sel.pose,
+        sel.lighting,
+        sel.background,
+        sel.mood,
+        sel.palette_name,
+        sel.colors,
+        sel.quality,
+        list(sel.effects),
+        detailed_prompt,
+        base_prompt,
+        alternative_prompts
+    )
+
+
+def _document(f: PromptFields) -> Dict[str, Any]:
+    """prompt_data layout; also compiled into PROMPT_DATA_JSON with Slot fields"""
+    return {
+        "metadata": {
+            "generator": GENERATOR_NAME,
+            "timestamp": f.timestamp,
+            "version": f.version,
+            "style_category": "cyberpunk_neon_anime",
+            "ai_enhanced": f.ai_enhanced,
+            "enhancement_model": f.enhancement_model
+        },
+        "character_details": {
+            "character_name": f.character,
+            "origin_world": f.origin,
+            "personality": f.expression,
+            "visual_description": f.visual_description
+        },
+        "visual_composition": {
+            "art_style": f.art_style,
+            "pose_description": f.pose,
+            "lighting_system": f.lighting,
+            "background_setting": f.background,
+            "atmosphere": f.mood
+        },
+        "color_system": {
+            "palette_name": f.palette_name,
+            "color_scheme": f.colors,
+            "glow_effects": "neon edges with luminescent outlines",
+            "contrast": "high contrast with vibrant saturation"
+        },
+        "technical_specifications": {
+            "quality_level": f.quality,
+            "visual_effects": f.visual_effects,
+            "rendering_style": "photorealistic with anime aesthetics",
+            "resolution": "8K ultra HD",
+            "lighting_model": "ray-traced with volumetric rendering"
+        },
+        "dall_e_optimized_prompt": f.detailed_prompt,
+        "base_prompt": f.base_prompt,
+        "alternative_prompts": f.alternative_prompts,
+        "style_tags": STYLE_TAGS,
+        "prompt_engineering_notes": dict(PROMPT_ENGINEERING_NOTES)
+    }
+
+
+PROMPT_DATA_JSON = JsonTemplate(_document(PromptFields(*(
+    Slot(name, text=PromptFields.__annotations__[name] is str) for name in PromptFields._fields))))
+
+
+def build_prompt_data(sel: PromptSelection, base_prompt: str, alternative_prompts: Dict[str, str],
+                      detailed_prompt: Optional[str] = None,
+                      timestamp: str = DEFAULT_TIMESTAMP) -> Dict[str, Any]:
+    """Build the full JSON document; detailed_prompt is the AI enhanced text if any"""
+    return _document(prompt_fields(sel, base_prompt, alternative_prompts, detailed_prompt, timestamp))
+
+
+def render_prompt_json(sel: PromptSelection, detailed_prompt: Optional[str] = None,
+                       timestamp: str = DEFAULT_TIMESTAMP) -> str:
+    """prompt_data for one selection straight to JSON text, without building the dicts
+    (same text as json.dumps(build_prompt(...).prompt_data, ensure_ascii=False))"""
+    base_prompt = BASE_TEMPLATE.render(sel)
+    return PROMPT_DATA_JSON.render(prompt_fields(
+        sel, base_prompt, build_alternative_prompts(sel), detailed_prompt, timestamp))
+
+
+def build_prompt(sel: PromptSelection, detailed_prompt: Optional[str] = None,
+                 timestamp: str = DEFAULT_TIMESTAMP) -> PromptResult:
+    """Assemble base prompt, alternatives and prompt_data for one selection"""
+    base_prompt = build_base_prompt(sel)
+    alternative_prompts = build_alternative_prompts(sel)
+    prompt_data = build_prompt_data(sel, base_prompt, alternative_prompts, detailed_prompt, timestamp)
+    return PromptResult(base_prompt, alternative_prompts, prompt_data)
+
+
+def selection_from_library(library: Dict[str, Any], character: str, pose: str, palette_name: str,
+                           art_style: str, lighting: str, background: str, mood: str,
+                           expression: str, quality: str = QUALITY_LEVELS[0],
+                           effects: Optional[List[str]] = None) -> PromptSelection:
+    """Resolve character origin and palette colors from a library dict"""
+    return PromptSelection(
+        character=character,
+        origin=library["characters"][character],
+        pose=pose,
+        palette_name=palette_name,
+        colors=library["color_palettes"][palette_name],
+        art_style=art_style,
+        lighting=lighting,
+        background=background,
+        mood=mood,
+        expression=expression,
+        quality=quality,
+        effects=tuple(DEFAULT_EFFECTS if effects is None else effects)
+    )
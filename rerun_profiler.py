@@ -0,0 +1,195 @@
+"""Opt-in timing of Streamlit reruns, phase by phase.
+
+The app brackets each rerun with begin()/end() and wraps its phases
+(library load, session state, widgets, sidebar, ...) in phase(name). Phase
+times are summed per name within a rerun; names are dotted for nesting
+("generate_prompt.selectors" runs inside "generate_prompt"). Finished reruns
+go into a rolling window shared by all sessions of the process, and are
+appended to PROMPT_PROFILE_DIR/reruns.jsonl for offline analysis.
+
+    PROMPT_PROFILE=1 streamlit run app.py                        # phase timings
+    PROMPT_PROFILE=cprofile,tracemalloc streamlit run app.py     # + hotspots and allocations
+
+With cprofile each rerun is also saved as a .prof file (pstats/snakeviz).
+Disabled, begin/end/phase are no-ops.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import statistics
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from typing import Any, ContextManager, Deque, Dict, Iterator, List, Optional
+
+PROFILE = os.environ.get("PROMPT_PROFILE", "")
+PROFILE_DIR = os.environ.get("PROMPT_PROFILE_DIR", "profiles")
+PROFILE_WINDOW = int(os.environ.get("PROMPT_PROFILE_WINDOW", "200"))
+HOTSPOTS = 15  # functions kept per cProfile run
+TOP_ALLOCATIONS = 10
+
+_DISABLED = nullcontext()
+
+
+class _Rerun:
+    """A rerun in progress on the current thread"""
+    __slots__ = ("started", "start", "phases", "profile", "snapshot")
+
+    def __init__(self):
+        self.started = time.time()
+        self.start = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.profile: Optional[cProfile.Profile] = None
+        self.snapshot: Optional[tracemalloc.Snapshot] = None
+
+
+class RerunProfiler:
+    """Per-thread rerun timing with a process-wide rolling window"""
+
+    def __init__(self, enabled: bool = True, cprofile: bool = False, trace_memory: bool = False,
+                 window: int = PROFILE_WINDOW, dump_dir: Optional[str] = PROFILE_DIR):
+        self.enabled = enabled
+        self.cprofile = cprofile
+        self.trace_memory = trace_memory
+        self.dump_dir = dump_dir
+        self.reruns: Deque[Dict[str, Any]] = deque(maxlen=window)
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if enabled and trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()  # one frame: allocations are reported per line
+
+    @classmethod
+    def from_env(cls, setting: str = PROFILE) -> "RerunProfiler":
+        """PROMPT_PROFILE: empty/0 disables; any other value enables timing, and the
+        comma-separated flags cprofile and tracemalloc add the snapshots"""
+        flags = {flag.strip().lower() for flag in setting.split(",") if flag.strip()}
+        return cls(enabled=bool(flags - {"0", "off", "false"}),
+                   cprofile="cprofile" in flags, trace_memory="tracemalloc" in flags)
+
+    def begin(self):
+        """Start timing a rerun on this thread (an unfinished one is discarded)"""
+        if not self.enabled:
+            return
+        rerun = self._local.rerun = _Rerun()
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            rerun.snapshot = tracemalloc.take_snapshot()
+        if self.cprofile:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:  # another session's rerun is being profiled (Python 3.12+)
+                profile = None
+            rerun.profile = profile
+            rerun.start = time.perf_counter()
+
+    def phase(self, name: str) -> ContextManager:
+        """Context manager adding its duration to the phase name of the current rerun"""
+        if not self.enabled or getattr(self._local, "rerun", None) is None:
+            return _DISABLED
+        return self._timed(self._local.rerun, name)
+
+    @staticmethod
+    @contextmanager
+    def _timed(rerun: _Rerun, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            rerun.phases[name] = rerun.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def end(self) -> Optional[Dict[str, Any]]:
+        """Finish the rerun of this thread; returns its record"""
+        rerun = getattr(self._local, "rerun", None) if self.enabled else None
+        if rerun is None:
+            return None
+        self._local.rerun = None
+        total = time.perf_counter() - rerun.start
+        if rerun.profile is not None:
+            rerun.profile.disable()
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+        record: Dict[str, Any] = {
+            "seq": seq,
+            "pid": os.getpid(),
+            "started": rerun.started,
+            "total_ms": total * 1000,
+            "phases": {name: seconds * 1000 for name, seconds in rerun.phases.items()},
+        }
+        if rerun.snapshot is not None:
+            record["memory"] = self._memory(rerun.snapshot)
+        if rerun.profile is not None:
+            record["hotspots"] = self._hotspots(rerun.profile)
+            record["profile"] = self._save_profile(rerun.profile, seq)
+        with self._lock:
+            self.reruns.append(record)
+        self._log(record)
+        return record
+
+    @staticmethod
+    def _memory(before: tracemalloc.Snapshot) -> Dict[str, Any]:
+        current, peak = tracemalloc.get_traced_memory()
+        own = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        after = tracemalloc.take_snapshot().filter_traces(own)
+        top = after.compare_to(before.filter_traces(own), "lineno")[:TOP_ALLOCATIONS]
+        return {"current_kb": current / 1024, "peak_kb": peak / 1024,
+                "top": [f"{stat.traceback[0]}: {stat.size_diff / 1024:+.1f} KiB ({stat.count_diff:+d})"
+                        for stat in top]}
+
+    @staticmethod
+    def _hotspots(profile: cProfile.Profile) -> List[Dict[str, Any]]:
+        stats = pstats.Stats(profile, stream=io.StringIO())
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:HOTSPOTS]
+        return [{"function": f"{os.path.basename(filename)}:{line}({function})",
+                 "calls": calls, "own_ms": own * 1000, "cumulative_ms": cumulative * 1000}
+                for (filename, line, function), (_, calls, own, cumulative, _) in rows]
+
+    def _save_profile(self, profile: cProfile.Profile, seq: int) -> Optional[str]:
+        if not self.dump_dir:
+            return None
+        os.makedirs(self.dump_dir, exist_ok=True)
+        path = os.path.join(self.dump_dir, f"rerun-{os.getpid()}-{seq}.prof")
+        profile.dump_stats(path)
+        return path
+
+    def _log(self, record: Dict[str, Any]):
+        if not self.dump_dir:
+            return
+        os.makedirs(self.dump_dir, exist_ok=True)
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock, open(os.path.join(self.dump_dir, "reruns.jsonl"), "a", encoding="utf-8") as f:
+            f.write(line)
+
+    def recent(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self.reruns)
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """Per phase over the window (plus "total"), slowest mean first"""
+        samples: Dict[str, List[float]] = {}
+        for record in self.recent():
+            samples.setdefault("total", []).append(record["total_ms"])
+            for name, ms in record["phases"].items():
+                samples.setdefault(name, []).append(ms)
+        rows = []
+        for name, values in samples.items():
+            ordered = sorted(values)
+            rows.append({"phase": name, "reruns": len(values), "mean_ms": statistics.mean(values),
+                         "p95_ms": ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+                         "max_ms": ordered[-1]})
+        return sorted(rows, key=lambda row: row["mean_ms"], reverse=True)
+
+    def dump(self, path: Optional[str] = None) -> str:
+        """Write the window and its summary as one JSON file; returns the path"""
+        if path is None:
+            os.makedirs(self.dump_dir or ".", exist_ok=True)
+            path = os.path.join(self.dump_dir or ".", time.strftime("reruns-%Y%m%d-%H%M%S.json"))
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"summary": self.summary(), "reruns": self.recent()}, f, ensure_ascii=False, indent=2)
+        return path
@@ -0,0 +1,201 @@
+"""Weighted random sampling of prompt selections.
+
+Every category is an integer-indexed array of names. With NumPy, index
+tuples are drawn for a whole chunk at once, per category, with optional
+weights. Rows that hit an exclusion rule are redrawn until none does. Only
+the resulting rows are turned into PromptSelections, so millions of draws
+cost about as much as rendering them. Without NumPy the same rules are
+applied with the random module (same results for a seed within a backend,
+not across backends).
+
+Rules are a JSON document:
+
+    {"weights": {"color_palettes": {"Neon Sunset": 3, "Ice Fire": 0}},
+     "exclude": [{"poses": "sitting meditation pose with floating energy orbs",
+                  "backgrounds": "dark void with neon grid"}]}
+
+Weights default to 1 and 0 removes a value; each exclusion forbids one
+pair of values from appearing together. The app's surprise button and
+batch.py read the file named by PROMPT_SAMPLER_RULES.
+"""
+import bisect
+import itertools
+import json
+import os
+import random
+from typing import Any, Callable, Dict, Iterator, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+from library import CATEGORIES, MAPPING_CATEGORIES
+from prompt_engine import DEFAULT_EFFECTS, QUALITY_LEVELS, PromptSelection
+
+try:
+    import numpy as np
+except ImportError:  # optional: the sampler falls back to the random module
+    np = None
+
+SAMPLER_RULES = os.environ.get("PROMPT_SAMPLER_RULES", "")
+CHUNK_SIZE = 65536
+MAX_REDRAWS = 64  # rounds of redrawing excluded rows before giving up
+
+Row = Tuple[str, ...]
+
+
+class Exclusion(NamedTuple):
+    """Indices of two values (in CATEGORIES positions) that must not be drawn together"""
+    first: int
+    first_value: int
+    second: int
+    second_value: int
+
+
+def load_rules(path: str) -> Dict[str, Any]:
+    """Weights and exclusions from a JSON file; no rules for an empty path"""
+    if not path:
+        return {}
+    with open(path, encoding="utf-8") as f:
+        rules = json.load(f)
+    if not isinstance(rules, dict):
+        raise ValueError(f"{path}: expected a JSON object with weights and exclude")
+    return rules
+
+
+class PromptSampler:
+    """Seeded weighted sampler over the library's categories"""
+
+    def __init__(self, options: Mapping[str, Sequence[str]], describe: Callable[[str, str], str],
+                 rules: Optional[Mapping[str, Any]] = None, seed: Optional[int] = None):
+        """options: names per category; describe(category, name): origin or colors"""
+        rules = rules or {}
+        self.options: List[Sequence[str]] = [options[category] for category in CATEGORIES]
+        self.describe = describe
+        weights = rules.get("weights") or {}
+        unknown = set(weights) - set(CATEGORIES)
+        if unknown:
+            raise ValueError(f"Unknown categories in weights: {', '.join(sorted(unknown))}")
+        self.weights = [self._weights(category, names, weights.get(category))
+                        for category, names in zip(CATEGORIES, self.options)]
+        self.exclusions = self._exclusions(rules.get("exclude") or ())
+        if np is not None:
+            self._rng = np.random.default_rng(seed)
+            self._probabilities = [None if w is None else np.asarray(w, dtype=float) / sum(w)
+                                   for w in self.weights]
+            self._excluded = self._excluded_codes()
+            self._arrays = [np.array(names, dtype=object) for names in self.options]
+        else:
+            self._rng = random.Random(seed)
+            self._cumulative = [None if w is None else list(itertools.accumulate(w))
+                                for w in self.weights]
+            self._excluded_pairs = {(e.first, e.second): set() for e in self.exclusions}
+            for e in self.exclusions:
+                self._excluded_pairs[e.first, e.second].add((e.first_value, e.second_value))
+
+    @classmethod
+    def from_library(cls, library: Mapping[str, Any], rules: Optional[Mapping[str, Any]] = None,
+                     seed: Optional[int] = None) -> "PromptSampler":
+        """Sampler over a library dict or frozen library view"""
+        values = {category: dict(library[category]) for category in MAPPING_CATEGORIES}
+        return cls({category: list(library[category]) for category in CATEGORIES},
+                   lambda category, name: values[category][name], rules, seed)
+
+    @staticmethod
+    def _weights(category: str, names: Sequence[str],
+                 given: Optional[Mapping[str, float]]) -> Optional[List[float]]:
+        """Per-index weights, None for uniform"""
+        if not names:
+            raise ValueError(f"Category {category} is empty")
+        if not given:
+            return None
+        if any(weight < 0 for weight in given.values()):
+            raise ValueError(f"Negative weight in {category}")
+        weights = [float(given.get(name, 1.0)) for name in names]
+        if not any(weights):
+            raise ValueError(f"Every value of {category} has weight 0")
+        return weights
+
+    def _exclusions(self, rules: Sequence[Mapping[str, str]]) -> List[Exclusion]:
+        positions: Dict[str, Dict[str, int]] = {}
+        exclusions = []
+        for rule in rules:
+            if len(rule) != 2 or not set(rule) <= set(CATEGORIES):
+                raise ValueError(f"An exclusion names two categories: {rule}")
+            (a, a_name), (b, b_name) = sorted(rule.items(), key=lambda item: CATEGORIES.index(item[0]))
+            for category in (a, b):
+                if category not in positions:  # only the categories rules mention are indexed
+                    names = self.options[CATEGORIES.index(category)]
+                    positions[category] = {name: i for i, name in enumerate(names)}
+            if a_name in positions[a] and b_name in positions[b]:  # stale rules are ignored
+                exclusions.append(Exclusion(CATEGORIES.index(a), positions[a][a_name],
+                                            CATEGORIES.index(b), positions[b][b_name]))
+        return exclusions
+
+    def _excluded_codes(self) -> Dict[Tuple[int, int], "np.ndarray"]:
+        """Forbidden pairs per category pair, encoded as first * len(second) + second"""
+        codes: Dict[Tuple[int, int], List[int]] = {}
+        for e in self.exclusions:
+            codes.setdefault((e.first, e.second), []).append(
+                e.first_value * len(self.options[e.second]) + e.second_value)
+        return {pair: np.unique(np.asarray(values, dtype=np.int64)) for pair, values in codes.items()}
+
+    def _draw_array(self, n: int) -> "np.ndarray":
+        columns = [self._rng.integers(0, len(names), n) if p is None else self._rng.choice(len(names), n, p=p)
+                   for names, p in zip(self.options, self._probabilities)]
+        return np.stack(columns, axis=1)
+
+    def _rejected(self, rows: "np.ndarray") -> "np.ndarray":
+        bad = np.zeros(len(rows), dtype=bool)
+        for (first, second), codes in self._excluded.items():
+            pairs = rows[:, first].astype(np.int64) * len(self.options[second]) + rows[:, second]
+            bad |= np.isin(pairs, codes)
+        return bad
+
+    def _draw_row(self) -> Tuple[int, ...]:
+        return tuple(self._rng.randrange(len(names)) if cumulative is None else
+                     bisect.bisect(cumulative, self._rng.random() * cumulative[-1])
+                     for names, cumulative in zip(self.options, self._cumulative))
+
+    def _allowed(self, row: Tuple[int, ...]) -> bool:
+        return not any((row[first], row[second]) in pairs
+                       for (first, second), pairs in self._excluded_pairs.items())
+
+    def draw(self, n: int) -> Iterator[Row]:
+        """n rows of names (in CATEGORIES order) that pass every exclusion"""
+        if np is None:
+            rows = []
+            for _ in range(n):
+                for _ in range(MAX_REDRAWS):
+                    row = self._draw_row()
+                    if self._allowed(row):
+                        break
+                else:
+                    raise ValueError("The exclusion rules reject almost every combination")
+                rows.append(tuple(names[i] for names, i in zip(self.options, row)))
+            return iter(rows)
+        rows = self._draw_array(n)
+        pending = np.flatnonzero(self._rejected(rows)) if self._excluded else ()
+        for _ in range(MAX_REDRAWS):
+            if not len(pending):
+                # Names are looked up a column at a time: far cheaper than rows.tolist()
+                return zip(*(array[column].tolist() for array, column in zip(self._arrays, rows.T)))
+            rows[pending] = self._draw_array(len(pending))
+            pending = pending[self._rejected(rows[pending])]
+        raise ValueError("The exclusion rules reject almost every combination")
+
+    def selection(self, row: Row, quality: str = QUALITY_LEVELS[0],
+                  effects: Sequence[str] = DEFAULT_EFFECTS) -> PromptSelection:
+        character, pose, palette, art_style, lighting, background, mood, expression = row
+        return PromptSelection(
+            character, self.describe("characters", character), pose,
+            palette, self.describe("color_palettes", palette),
+            art_style, lighting, background, mood, expression, quality, tuple(effects))
+
+    def selections(self, n: int, quality: str = QUALITY_LEVELS[0],
+                   effects: Sequence[str] = DEFAULT_EFFECTS,
+                   chunk_size: int = CHUNK_SIZE) -> Iterator[PromptSelection]:
+        """n weighted random selections, drawn chunk by chunk"""
+        for start in range(0, n, chunk_size):
+            for row in self.draw(min(chunk_size, n - start)):
+                yield self.selection(row, quality, effects)
+
+    def surprise(self) -> Dict[str, str]:
+        """One random pick per category"""
+        return dict(zip(CATEGORIES, next(self.draw(1))))
@@ -0,0 +1,162 @@
+"""Request coalescing: identical calls in flight at the same time share one execution.
+
+The first caller of a key becomes the leader and runs the call; callers of
+the same key arriving before it finishes wait and get its result (and, when
+the leader reports progress, each partial result as it arrives). A waiter
+whose leader died with an exception (e.g. its session was rerun) retries and
+may become the next leader.
+
+Across processes the leader additionally holds an exclusive lock file per key
+in PROMPT_SINGLE_FLIGHT_DIR (flock, POSIX only). A leader that had to wait
+for that lock first calls recheck(), which normally reads the result the
+other process has just cached. Unset, coalescing is per process.
+"""
+import hashlib
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple, TypeVar
+
+try:
+    import fcntl
+except ImportError:  # Windows: coalescing stays within the process
+    fcntl = None
+
+from metrics import COALESCED
+
+SINGLE_FLIGHT_DIR = os.environ.get("PROMPT_SINGLE_FLIGHT_DIR", "")
+# Longest wait for another process's call before making our own anyway
+LOCK_TIMEOUT = float(os.environ.get("PROMPT_SINGLE_FLIGHT_TIMEOUT", "60"))
+LOCK_POLL = 0.05
+
+T = TypeVar("T")
+Progress = Callable[[str], None]
+
+
+class _Call:
+    """One execution in flight and what its waiters see"""
+    __slots__ = ("cond", "done", "failed", "result", "partial")
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.done = False
+        self.failed = False
+        self.result: Any = None
+        self.partial: Optional[str] = None
+
+
+class SingleFlight:
+    """Per-process table of calls in flight, keyed by the caller's request key"""
+
+    def __init__(self, lock_dir: str = SINGLE_FLIGHT_DIR, lock_timeout: float = LOCK_TIMEOUT):
+        self.lock_dir = lock_dir if fcntl is not None else ""
+        self.lock_timeout = lock_timeout
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable[[Progress], T], on_progress: Optional[Progress] = None,
+           recheck: Optional[Callable[[], Optional[T]]] = None) -> Tuple[T, bool]:
+        """Run fn(publish) unless an identical call is in flight; returns (result, shared).
+        publish(text) forwards partial results to on_progress of the leader and all waiters"""
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+            if leader:
+                return self._lead(key, call, fn, on_progress, recheck)
+            COALESCED.inc(scope="thread")
+            if self._wait(call, on_progress):
+                return call.result, True
+
+    def in_flight(self, key: str) -> bool:
+        """Whether a call for key is running in this process"""
+        with self._lock:
+            return key in self._calls
+
+    def _wait(self, call: _Call, on_progress: Optional[Progress]) -> bool:
+        """Follow call until it ends; False if its leader failed"""
+        shown = None
+        while True:
+            with call.cond:
+                while not call.done and call.partial is shown:
+                    call.cond.wait()
+                done, partial = call.done, call.partial
+            if done:
+                return not call.failed
+            shown = partial
+            if on_progress is not None:
+                on_progress(partial)  # outside the lock: the leader never waits on a slow page
+
+    def _lead(self, key: str, call: _Call, fn: Callable[[Progress], T], on_progress: Optional[Progress],
+              recheck: Optional[Callable[[], Optional[T]]]) -> Tuple[T, bool]:
+        def publish(text: str):
+            with call.cond:
+                call.partial = text
+                call.cond.notify_all()
+            if on_progress is not None:
+                on_progress(text)
+
+        lock = None
+        try:
+            shared = False
+            lock, waited = self._lock_file(key)
+            result = recheck() if waited and recheck is not None else None
+            if result is not None:
+                COALESCED.inc(scope="process")
+                shared = True
+            else:
+                result = fn(publish)
+            call.result = result
+            return result, shared
+        except BaseException:
+            call.failed = True
+            raise
+        finally:
+            if lock is not None:
+                self._unlock_file(*lock)
+            with self._lock:
+                del self._calls[key]
+            with call.cond:
+                call.done = True
+                call.cond.notify_all()
+
+    def _lock_file(self, key: str) -> Tuple[Optional[Tuple[int, str]], bool]:
+        """Exclusive lock file for key as ((fd, path), waited); (None, waited) when
+        cross-process coalescing is off or the lock was not granted in time"""
+        if not self.lock_dir:
+            return None, False
+        os.makedirs(self.lock_dir, exist_ok=True)
+        path = os.path.join(self.lock_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".lock")
+        deadline = time.monotonic() + self.lock_timeout
+        waited = False
+        while True:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                waited = True
+                if time.monotonic() > deadline:
+                    return None, waited
+                time.sleep(LOCK_POLL)
+                continue
+            # The previous holder unlinks the file on release: a lock on the unlinked
+            # inode excludes nobody, so start over on the current file
+            try:
+                current = os.stat(path).st_ino == os.fstat(fd).st_ino
+            except FileNotFoundError:
+                current = False
+            if current:
+                return (fd, path), waited
+            os.close(fd)
+
+    @staticmethod
+    def _unlock_file(fd: int, path: str):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
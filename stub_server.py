@@ -0,0 +1,241 @@
+"""Local stand-in for the Gemini generateContent endpoint.
+
+Used to exercise the enhancement pool and benchmarks offline. Latency, error
+rate and a per-key rate limit are configurable. streamGenerateContent is
+answered with chunked server-sent events, one event every chunk_delay
+seconds after the initial latency.
+
+    python stub_server.py --port 8765 --latency 0.2 --error-rate 0.05
+    GEMINI_API_BASE=http://127.0.0.1:8765/v1beta streamlit run app.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence
+
+PROMPT_MARKER = "Original prompt to enhance:"
+BATCH_MARKER = "Prompts to enhance (JSON):"
+ENHANCEMENT_SUFFIX = "intricate neon reflections, volumetric haze, razor-sharp detail"
+
+
+def enhance_text(prompt: str) -> str:
+    """Deterministic fake enhancement, labelled like the real model sometimes does"""
+    return f"Enhanced prompt: {prompt}, {ENHANCEMENT_SUFFIX}"
+
+
+class StubConfig:
+    """Mutable behaviour switches shared by all handler threads"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 error_status: int = 500, rate_limit: Optional[float] = None,
+                 retry_after: int = 1, seed: Optional[int] = None,
+                 failing_keys: Sequence[str] = (), chunk_delay: float = 0.0,
+                 chunk_words: int = 2, batch_drop_rate: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        # Requests per second allowed per API key; None disables 429s
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        # API keys that always get a 503, to exercise key failover
+        self.failing_keys = set(failing_keys)
+        self.chunk_delay = chunk_delay
+        self.chunk_words = chunk_words
+        # Share of items left out of batch answers, to exercise per-item retries
+        self.batch_drop_rate = batch_drop_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.requests_by_key: Dict[str, int] = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._last_seen: Dict[str, List[float]] = {}
+
+    def admit(self, api_key: str) -> Optional[int]:
+        """Record a request; returns an error status to send, or None for success"""
+        with self.lock:
+            self.requests += 1
+            self.requests_by_key[api_key] = self.requests_by_key.get(api_key, 0) + 1
+            if api_key in self.failing_keys:
+                return 503
+            if self.rate_limit is not None:
+                now = time.monotonic()
+                window = [t for t in self._last_seen.get(api_key, []) if now - t < 1.0]
+                if len(window) >= self.rate_limit:
+                    self._last_seen[api_key] = window
+                    return 429
+                window.append(now)
+                self._last_seen[api_key] = window
+            if self.error_rate and self.rng.random() < self.error_rate:
+                return self.error_status
+            return None
+
+    def delay(self) -> float:
+        with self.lock:
+            return max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes; with keep-alive, Nagle + delayed ACK adds ~40 ms each
+    disable_nagle_algorithm = True
+    config: StubConfig = StubConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: Dict, headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _stream_events(self, text: str):
+        """Chunked SSE, split every chunk_words words so labels straddle chunk boundaries"""
+        config = self.config
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        words = text.split(" ")
+        for start in range(0, len(words), config.chunk_words):
+            piece = " ".join(words[start:start + config.chunk_words])
+            if start:
+                piece = " " + piece
+                time.sleep(config.chunk_delay)
+            event = {"candidates": [{"content": {"parts": [{"text": piece}]}}]}
+            self._send_chunk(f"data: {json.dumps(event)}\r\n\r\n".encode("utf-8"))
+        self._send_chunk(b"")
+
+    def _read_text(self) -> str:
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        return body["contents"][0]["parts"][0]["text"]
+
+    def _answer(self, text: str) -> str:
+        """Model output for a request: one enhancement, or a JSON array for a batch"""
+        if BATCH_MARKER not in text:
+            return enhance_text(text.split(PROMPT_MARKER, 1)[-1].strip())
+        items = json.loads(text.split(BATCH_MARKER, 1)[1])
+        with self.config.lock:
+            kept = [item for item in items if self.config.rng.random() >= self.config.batch_drop_rate]
+        return json.dumps([{"id": item["id"], "enhanced": enhance_text(item["prompt"])} for item in kept])
+
+    def do_POST(self):
+        config = self.config
+        streaming = ":streamGenerateContent" in self.path
+        if ":generateContent" not in self.path and not streaming:
+            self._send_json(404, {"error": {"code": 404, "message": "Not found"}})
+            return
+        text = self._read_text()
+        api_key = self.headers.get("x-goog-api-key", "")
+
+        with config.lock:
+            config.in_flight += 1
+            config.max_in_flight = max(config.max_in_flight, config.in_flight)
+        try:
+            time.sleep(config.delay())
+            status = config.admit(api_key)
+            if status == 429:
+                self._send_json(429, {"error": {"code": 429, "message": "Resource exhausted"}},
+                                {"Retry-After": str(config.retry_after)})
+            elif status is not None:
+                self._send_json(status, {"error": {"code": status, "message": "Injected failure"}})
+            elif streaming:
+                self._stream_events(self._answer(text))
+            else:
+                answer = self._answer(text)
+                self._send_json(200, {
+                    "candidates": [{"content": {"parts": [{"text": answer}]}}],
+                    "usageMetadata": {
+                        "promptTokenCount": len(text.split()),
+                        "candidatesTokenCount": len(answer.split())
+                    }
+                })
+        finally:
+            with config.lock:
+                config.in_flight -= 1
+
+
+class _StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 stalls connects under concurrent load
+    request_queue_size = 256
+
+
+class StubGeminiServer:
+    """Threaded stub server, usable as a context manager.
+
+        with StubGeminiServer(latency=0.05) as server:
+            generate_content(prompt, "key", base_url=server.base_url)
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, **config):
+        self.config = StubConfig(**config)
+        handler = type("BoundStubHandler", (StubHandler,), {"config": self.config})
+        self.httpd = _StubHTTPServer((host, port), handler)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1beta"
+
+    def start(self) -> "StubGeminiServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> "StubGeminiServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local Gemini API stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds per request")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--rate-limit", type=float, default=None, help="requests/second per key")
+    parser.add_argument("--fail-key", action="append", default=[], help="API key that always gets 503")
+    parser.add_argument("--chunk-delay", type=float, default=0.05, help="seconds between stream events")
+    parser.add_argument("--batch-drop-rate", type=float, default=0.0,
+                        help="share of items left out of batch answers")
+    args = parser.parse_args()
+
+    server = StubGeminiServer(args.host, args.port, latency=args.latency, jitter=args.jitter,
+                              error_rate=args.error_rate, error_status=args.error_status,
+                              rate_limit=args.rate_limit, failing_keys=args.fail_key,
+                              chunk_delay=args.chunk_delay, batch_drop_rate=args.batch_drop_rate)
+    print(f"Stub Gemini API on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
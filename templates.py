@@ -0,0 +1,110 @@
+"""Compiled prompt and JSON templates.
+
+A PromptTemplate is written with {field} placeholders and compiled once into
+a function returning a single f-string over the object's attributes. CPython
+builds that in one step, so rendering costs about as much as joining the
+pieces.
+
+A JsonTemplate is a document with Slot markers where values vary. It is
+serialized once and compiled the same way. Rendering only JSON-encodes the
+slot values; no dicts are built. The output is identical to json.dumps of
+the filled-in document (ensure_ascii=False).
+"""
+import json
+import re
+import string
+from json.encoder import encode_basestring
+from typing import Any, Callable, List, Optional, Tuple
+
+_FIELD = re.compile(r"[A-Za-z_]\w*(\.[A-Za-z_]\w*)*\Z")
+_SLOT_MARKER = re.compile(r'"\\u0000([\w.]+)\\u0000"')
+# Reused: json.dumps with non-default options builds a new encoder per call
+_ENCODER = json.JSONEncoder(ensure_ascii=False)
+
+
+def _json_value(value: Any) -> str:
+    """json.dumps(value, ensure_ascii=False), with shortcuts for flat containers of strings"""
+    if value is None:
+        return "null"
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    if type(value) in (list, tuple) and all(type(item) is str for item in value):
+        return "[" + ", ".join(map(encode_basestring, value)) + "]"
+    if type(value) is dict and all(type(key) is str and type(item) is str for key, item in value.items()):
+        return "{" + ", ".join(encode_basestring(key) + ": " + encode_basestring(item)
+                               for key, item in value.items()) + "}"
+    return _ENCODER.encode(value)
+
+
+def _compile(parts: List[Tuple[str, Optional[str]]], **helpers: Callable) -> Callable[[Any], str]:
+    """Function rendering (literal, expression) parts as one f-string.
+
+    Expressions are validated attribute paths of obj, optionally wrapped in
+    one of the helpers; literals go through repr, so no template text is
+    ever evaluated.
+    """
+    body = "".join(literal.replace("{", "{{").replace("}", "}}")
+                   + ("" if expression is None else "{" + expression + "}")
+                   for literal, expression in parts)
+    defaults = "".join(f", {name}={name}" for name in helpers)
+    return eval(f"lambda obj{defaults}: f{body!r}", {}, helpers)
+
+
+def _attribute(field: str) -> str:
+    if not _FIELD.match(field):
+        raise ValueError(f"Template fields must be attribute names: {field!r}")
+    return "obj." + field
+
+
+class PromptTemplate:
+    """Text template with {field} slots filled from an object's attributes"""
+    __slots__ = ("source", "fields", "render")
+
+    def __init__(self, source: str):
+        parts: List[Tuple[str, Optional[str]]] = []
+        fields = []
+        for literal, field, spec, conversion in string.Formatter().parse(source):
+            if field is not None and (spec or conversion):
+                raise ValueError(f"Only plain {{field}} slots are supported: {source!r}")
+            parts.append((literal, None if field is None else _attribute(field)))
+            if field is not None:
+                fields.append(field)
+        self.source = source
+        self.fields: Tuple[str, ...] = tuple(fields)
+        self.render: Callable[[Any], str] = _compile(parts)
+
+
+class Slot:
+    """Placeholder for a varying value in a JsonTemplate document; text slots
+    always hold a str, the others any JSON-serializable value"""
+    __slots__ = ("name", "text")
+
+    def __init__(self, name: str, text: bool = True):
+        self.name = name
+        self.text = text
+
+
+class JsonTemplate:
+    """JSON document serialized once; Slot values are filled from an object's attributes"""
+    __slots__ = ("fields", "render")
+
+    def __init__(self, document: Any):
+        slots = {}
+
+        def marker(obj: Any) -> str:
+            if not isinstance(obj, Slot):
+                raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+            slots[obj.name] = obj
+            return f"\0{obj.name}\0"
+
+        # Slots are dumped as marker strings, then cut out of the text
+        pieces = _SLOT_MARKER.split(json.dumps(document, ensure_ascii=False, default=marker))
+        self.fields: Tuple[str, ...] = tuple(pieces[1::2])
+        parts: List[Tuple[str, Optional[str]]] = [
+            (literal, f"{'_text' if slots[field].text else '_json'}({_attribute(field)})")
+            for literal, field in zip(pieces[0::2], self.fields)
+        ]
+        parts.append((pieces[-1], None))
+        self.render: Callable[[Any], str] = _compile(parts, _text=encode_basestring, _json=_json_value)
@@ -0,0 +1,38 @@
+import itertools
+import tracemalloc
+
+from batch import count_combinations, iter_random
+from library import CATEGORIES, MAPPING_CATEGORIES
+
+
+def make_library(size):
+    return {category: ({f"{category} {i}": f"about {i}" for i in range(size)}
+                       if category in MAPPING_CATEGORIES else [f"{category} {i}" for i in range(size)])
+            for category in CATEGORIES}
+
+
+def combination(selection):
+    return (selection.character, selection.pose, selection.palette_name, selection.art_style,
+            selection.lighting, selection.background, selection.mood, selection.expression)
+
+
+def test_unique_random_mode_covers_the_product_once():
+    library = make_library(3)
+    total = count_combinations(library)
+    drawn = [combination(selection) for selection in iter_random(library, total, seed=1)]
+    assert len(drawn) == len(set(drawn)) == total
+    assert drawn == [combination(selection) for selection in iter_random(library, total, seed=1)]
+    assert drawn != [combination(selection) for selection in iter_random(library, total, seed=2)]
+
+
+def test_unique_random_mode_does_not_materialize_the_product():
+    library = make_library(1000)  # 10^24 combinations
+    total = count_combinations(library)
+    tracemalloc.start()
+    try:
+        drawn = {combination(selection) for selection in itertools.islice(iter_random(library, total, seed=7), 5000)}
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert len(drawn) == 5000
+    assert peak < 8 * 1024 * 1024  # the drawn set itself, not anything sized by the product
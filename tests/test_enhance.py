@@ -0,0 +1,75 @@
+import threading
+import time
+
+import pytest
+
+import app
+from enhancement_cache import EnhancementCache
+from key_pool import KeyPool
+from near_duplicate import NearDuplicateIndex
+from prefetch import Prefetcher
+from single_flight import SingleFlight
+
+BASE = "a knight in a dark forest, oil painting"
+FOCUS = "Genel Artistik Kalite"
+
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch):
+    """Process-wide resources of the app, fresh for each test, and a stub API where the
+    first key always fails and prefetch calls on it take prefetch_delay seconds"""
+    state = {"pool": KeyPool(["key-1", "key-2"]), "calls": [], "prefetch_delay": 0.2,
+             "prefetch_started": threading.Event()}
+    cache = EnhancementCache(str(tmp_path / "cache.sqlite3"))
+    index = NearDuplicateIndex()
+    resources = {"get_key_pool": state["pool"], "get_enhancement_cache": cache,
+                 "_similarity_index": index, "get_similarity_index": index,
+                 "get_single_flight": SingleFlight(lock_dir=""),
+                 "get_prefetcher": Prefetcher(debounce=0.0)}
+    for name, value in resources.items():
+        monkeypatch.setattr(app, name, lambda value=value: value)
+
+    def call_gemini_api(prompt, key_pool, key_index, *args, quiet=False, **kwargs):
+        state["calls"].append((key_index, quiet))
+        if quiet:
+            state["prefetch_started"].set()
+            time.sleep(state["prefetch_delay"])
+        if key_index == 0:
+            key_pool.record_failure(key_index, 500)
+            return None
+        key_pool.record_success(key_index, 0.01)
+        return "enhanced " + prompt
+
+    monkeypatch.setattr(app, "call_gemini_api", call_gemini_api)
+    return state
+
+
+def start_prefetch(backend):
+    """Schedule the speculative enhancement of BASE and wait for its (first-key) call"""
+    cache_key = app.enhancement_key(BASE, app.DEFAULT_MODEL, 0.8, 200, FOCUS)
+    job = app.prefetch_job(cache_key, BASE, 0.8, 200, FOCUS, app.DEFAULT_THRESHOLD)
+    app.get_prefetcher().schedule("session", cache_key, job)
+    assert backend["prefetch_started"].wait(1)
+
+
+def test_click_falls_back_when_the_prefetch_key_fails(backend, monkeypatch):
+    monkeypatch.setattr(app, "CLAIM_TIMEOUT", 0.05)  # give up on the prefetch while it still runs
+    start_prefetch(backend)
+    enhanced, debug = app.enhance_prompt_with_gemini(BASE, "knight", "oil")
+
+    assert enhanced == "enhanced " + BASE
+    assert debug["api_key"] == 2 and not debug.get("coalesced")
+    assert backend["calls"][0] == (0, True)  # the prefetch tried the failing key only
+    assert (1, False) in backend["calls"]
+
+
+def test_click_does_not_wait_out_a_hanging_prefetch(backend, monkeypatch):
+    monkeypatch.setattr(app, "CLAIM_TIMEOUT", 0.2)
+    backend["prefetch_delay"] = 1.5  # e.g. stuck until the 15 s read timeout
+    start_prefetch(backend)
+    begin = time.monotonic()
+    enhanced, debug = app.enhance_prompt_with_gemini(BASE, "knight", "oil")
+
+    assert time.monotonic() - begin < 1.0
+    assert enhanced == "enhanced " + BASE
+    assert not debug.get("prefetched") and not debug.get("coalesced")
@@ -0,0 +1,42 @@
+import time
+
+import enhancement_cache
+from enhancement_cache import EnhancementCache
+
+
+def test_expired_entries_are_misses(tmp_path, monkeypatch):
+    cache = EnhancementCache(str(tmp_path / "cache.sqlite3"), ttl=60)
+    cache.set("k", "value")
+    assert cache.contains("k") and cache.get("k") == "value"
+
+    later = time.time() + 61
+    monkeypatch.setattr(enhancement_cache.time, "time", lambda: later)
+    assert not cache.contains("k")
+    assert cache.get("k") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 0)
+
+
+def test_evict_drops_expired_then_least_recently_used(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(enhancement_cache.time, "time", lambda: now[0])
+    cache = EnhancementCache(str(tmp_path / "cache.sqlite3"), max_entries=2, ttl=100)
+    cache.set("stale", "0")
+    now[0] += 50
+    for key in ("a", "b", "c"):
+        cache.set(key, key)
+        now[0] += 1
+    cache.get("a")  # now more recently used than b and c
+
+    now[0] += 50  # only "stale" is past its TTL
+    assert cache.evict() == 2
+    assert [cache.contains(key) for key in ("stale", "a", "b", "c")] == [False, True, False, True]
+    assert cache.stats()["evictions"] == 2
+
+
+def test_size_is_enforced_on_write(tmp_path, monkeypatch):
+    monkeypatch.setattr(enhancement_cache, "EVICT_EVERY", 4)
+    cache = EnhancementCache(str(tmp_path / "cache.sqlite3"), max_entries=2)
+    for i in range(4):
+        cache.set(str(i), "value")
+    assert cache.stats()["entries"] == 2
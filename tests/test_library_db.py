@@ -0,0 +1,51 @@
+import threading
+
+import pytest
+
+from library_db import LibraryDB
+
+
+@pytest.fixture
+def db(tmp_path):
+    with LibraryDB(str(tmp_path / "library.sqlite3"), pool_size=2) as db:
+        yield db
+
+
+def test_items_are_unique_per_normalized_name(db):
+    assert db.add("poses", "Flying Through Air", tags=["action"])
+    assert not db.add("poses", "flying  through air")
+    assert db.find("poses", "FLYING through air") == "Flying Through Air"
+    assert db.names_with_tag("poses", "action") == ["Flying Through Air"]
+    assert db.search("poses", "fly") == ["Flying Through Air"]
+    assert db.remove("poses", "flying through air")
+    assert db.is_empty()
+
+
+def test_threads_share_a_bounded_pool(db):
+    db.add_items([("poses", f"pose {i}", None) for i in range(10)])
+    errors = []
+
+    def work():
+        try:
+            for _ in range(20):
+                assert db.count("poses") == 10
+                assert len(list(db.iter_items())) == 10
+        except Exception as e:  # pragma: no cover - reported below
+            errors.append(e)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert db._opened <= db.pool_size
+
+
+def test_version_and_names_follow_writes_from_another_instance(db):
+    other = LibraryDB(db.path)
+    before = db.version()
+    other.add("moods", "serene")
+    assert db.version() > before
+    assert "serene" in db.names("moods")
+    other.close()
@@ -0,0 +1,119 @@
+import time
+
+from enhancement_cache import EnhancementCache
+import near_duplicate
+from near_duplicate import (
+    PATCH_THRESHOLD, NearDuplicateIndex, SlotEdit, patch_enhancement, reuse_enhancement, slot_diff,
+    sync_from_cache, warm_from_cache
+)
+
+STORED = ("masterpiece, best quality, anime style, cyberpunk hacker girl, standing pose, "
+          "neon pink and cyan palette, rim lighting, city background")
+ENHANCED = ("masterpiece, best quality, anime style, cyberpunk hacker girl, standing pose, "
+            "glowing neon pink and cyan palette, dramatic rim lighting, rainy city background")
+# One slot differs; about 0.67 similar to STORED
+OTHER_POSE = STORED.replace("standing pose", "sitting cross-legged pose")
+
+
+def index_with_stored() -> NearDuplicateIndex:
+    index = NearDuplicateIndex()
+    index.add("k1", STORED, ENHANCED, "p")
+    return index
+
+
+def test_exact_prompt_matches_at_full_threshold():
+    match = index_with_stored().lookup(STORED, "p", threshold=1.0)
+    assert match is not None and match.similarity == 1.0
+    assert reuse_enhancement(match, 1.0) == ENHANCED
+
+
+def test_slot_neighbour_below_threshold_is_not_served():
+    index = index_with_stored()
+    assert index.lookup(OTHER_POSE, "p", threshold=1.0) is None
+    assert index.lookup(OTHER_POSE, "p", threshold=0.9) is None
+
+
+def test_slot_neighbour_above_threshold_is_patched():
+    match = index_with_stored().lookup(OTHER_POSE, "p", threshold=0.6)
+    assert match is not None
+    assert reuse_enhancement(match, 0.6) == ENHANCED.replace("standing pose", "sitting cross-legged pose")
+
+
+def test_patching_below_threshold_is_opt_in():
+    index = index_with_stored()
+    match = index.lookup(OTHER_POSE, "p", threshold=1.0, patch_threshold=PATCH_THRESHOLD)
+    assert match is not None and len(match.slot_diff) == 1
+    assert "sitting cross-legged pose" in reuse_enhancement(match, 1.0)
+
+
+def test_patch_only_replaces_whole_words():
+    enhanced = "a group of superheroes watching a hero on the rooftop, neon city"
+    assert patch_enhancement(enhanced, [SlotEdit("hero", "villain", "")]) == (
+        "a group of superheroes watching a villain on the rooftop, neon city")
+    # Only inside a longer word: no slot to replace, so nothing is patched
+    assert patch_enhancement("a team of superheroes, neon city", [SlotEdit("hero", "villain", "")]) is None
+
+
+def test_ambiguous_patch_is_refused():
+    enhanced = "red sky, red coat, rim lighting"
+    assert patch_enhancement(enhanced, [SlotEdit("red", "blue", "")]) is None
+    assert patch_enhancement(enhanced, [SlotEdit("", "fog", "red")]) is None
+    assert patch_enhancement(enhanced, [SlotEdit("", "fog", "rim lighting")]) == enhanced + ", fog"
+
+
+def test_unpatchable_neighbour_is_not_served_below_threshold():
+    stored = STORED.replace("cyberpunk hacker girl", "hero")
+    index = NearDuplicateIndex()
+    index.add("k1", stored, "masterpiece, a lone superhero in a standing pose, rim lighting", "p")
+    match = index.lookup(stored.replace("hero", "villain"), "p", threshold=1.0, patch_threshold=PATCH_THRESHOLD)
+    assert match is not None and match.slot_diff == [SlotEdit("hero", "villain", "anime style")]
+    assert reuse_enhancement(match, 1.0) is None
+
+
+def test_slot_diff_trims_the_shared_ends():
+    assert slot_diff("a, b, c, d", "a, x, c, d") == [SlotEdit("b", "x", "a")]
+    assert slot_diff("a, b, c", "a, b, x, c") == [SlotEdit("", "x", "b")]
+    assert slot_diff("a, b, c", "a, c") == [SlotEdit("b", "", "a")]
+    assert slot_diff("a, B, c", "a, b, c") == []
+
+
+def test_neighbour_candidates_are_bounded(monkeypatch):
+    monkeypatch.setattr(near_duplicate, "MAX_CANDIDATES", 3)
+    index = NearDuplicateIndex()
+    for place in range(20):  # all in the bucket of STORED without its background slot
+        index.add(f"k{place}", STORED.replace("city", f"place {place}"), ENHANCED, "p")
+    candidates = index._candidates(STORED, "p", near_duplicate.shingles(STORED))
+    assert len(candidates) == 3
+
+
+def test_partitions_are_separate():
+    assert index_with_stored().lookup(STORED, "other", threshold=0.5) is None
+
+
+def test_entries_past_ttl_are_not_served():
+    index = NearDuplicateIndex(ttl=60)
+    index.add("old", STORED, ENHANCED, "p", created=time.time() - 120)
+    assert index.lookup(STORED, "p") is None
+    index.add("new", STORED, ENHANCED, "p")
+    assert index.lookup(STORED, "p").key == "new"
+
+
+def test_oldest_entries_are_dropped_beyond_max_entries():
+    index = NearDuplicateIndex(max_entries=2)
+    prompts = [STORED.replace("city", place) for place in ("city", "forest", "desert")]
+    for i, prompt in enumerate(prompts):
+        index.add(f"k{i}", prompt, ENHANCED, "p")
+    assert len(index) == 2
+    assert index.lookup(prompts[0], "p", threshold=1.0) is None
+    assert index.lookup(prompts[2], "p", threshold=1.0).key == "k2"
+
+
+def test_sync_skips_expired_rows_and_respects_the_cap(tmp_path):
+    cache = EnhancementCache(str(tmp_path / "cache.sqlite3"), ttl=3600)
+    for i in range(5):
+        cache.set(f"k{i}", ENHANCED, STORED.replace("city", f"city {i}"), "p")
+    index = NearDuplicateIndex(max_entries=3, ttl=3600)
+    warm_from_cache(index, cache).join()
+    assert len(index) == 3
+    assert sync_from_cache(index, cache) == 3  # overlap window re-reads the newest rows
+    assert len(index) == 3
@@ -0,0 +1,52 @@
+import option_search
+from option_search import MAX_MATCHES, PAGE_SIZE, OptionIndex
+
+COLORS = ["red", "blue", "green", "amber"]
+ANIMALS = ["dragon", "fox", "owl", "tiger", "wolf"]
+NAMES = tuple(f"{color} {animal} {i}" for i in range(200) for color in COLORS for animal in ANIMALS)
+
+
+def every_match(index, query, extra=()):
+    names, offset = [], 0
+    while True:
+        page = index.search(query, offset, extra=extra)
+        names += page.names
+        if not page.has_more:
+            return names, page
+        offset += PAGE_SIZE
+
+
+def test_words_match_by_prefix_in_any_order():
+    index = OptionIndex(NAMES + ("Émeraude Renard",))
+    assert every_match(index, "dra gre")[0] == every_match(index, "green drag")[0]
+    assert set(every_match(index, "dra gre")[0]) == {name for name in NAMES if name.startswith("green dragon")}
+    assert index.search("renard EME").names == ["Émeraude Renard"]
+
+
+def test_sparse_intersections_are_exact(monkeypatch):
+    monkeypatch.setattr(option_search, "CHECK_BUDGET", 8)  # force the set intersection
+    index = OptionIndex(NAMES)
+    names, _ = every_match(index, "amber wolf 19")
+    assert names == [name for name in NAMES if name.startswith("amber wolf 19")]
+
+
+def test_no_substring_fallback():
+    index = OptionIndex(NAMES)
+    assert index.search("ragon").names == []
+    assert not index.search("ragon").has_more
+
+
+def test_paging_stops_at_the_cap():
+    index = OptionIndex(NAMES)
+    names, last = every_match(index, "red")
+    assert len(names) == MAX_MATCHES == len(set(names))
+    assert last.capped and not last.has_more
+    assert index.search("red", offset=MAX_MATCHES).names == []
+
+
+def test_extra_names_follow_the_indexed_matches():
+    index = OptionIndex(NAMES[:100])
+    extra = ("red phoenix", "blue phoenix")
+    assert index.search("phoenix", extra=extra).names == list(extra)
+    assert every_match(index, "red", extra)[0][-1] == "red phoenix"
+    assert every_match(index, "", extra)[0] == list(NAMES[:100] + extra)
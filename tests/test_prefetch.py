@@ -0,0 +1,63 @@
+import threading
+import time
+
+from prefetch import Prefetcher
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_only_the_last_selection_of_a_session_runs():
+    ran = []
+    prefetcher = Prefetcher(debounce=0.05)
+    for key in "abc":
+        prefetcher.schedule("session", key, lambda key=key: ran.append(key) or True)
+    wait_until(lambda: ran)
+    time.sleep(0.1)
+    assert ran == ["c"]
+
+
+def test_claim_cancels_a_pending_job():
+    ran = []
+    prefetcher = Prefetcher(debounce=0.05)
+    prefetcher.schedule("session", "k", lambda: ran.append("k") or True)
+    assert not prefetcher.claim("k")
+    time.sleep(0.15)
+    assert ran == []
+
+
+def run_claimed(result, job_time=0.2, timeout=2.0):
+    started = threading.Event()
+
+    def job():
+        started.set()
+        time.sleep(job_time)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    prefetcher = Prefetcher(debounce=0.0)
+    prefetcher.schedule("session", "k", job)
+    assert started.wait(1)
+    begin = time.monotonic()
+    return prefetcher.claim("k", timeout), time.monotonic() - begin
+
+
+def test_claim_waits_for_a_job_that_enhances():
+    claimed, _ = run_claimed(True)
+    assert claimed
+
+
+def test_claim_reports_skipped_or_failed_jobs():
+    assert not run_claimed(False)[0]
+    assert not run_claimed(RuntimeError("boom"))[0]
+
+
+def test_claim_gives_up_after_its_timeout():
+    claimed, waited = run_claimed(True, job_time=1.0, timeout=0.1)
+    assert not claimed
+    assert waited < 0.5
@@ -0,0 +1,29 @@
+import json
+
+from library import DEFAULT_LIBRARY
+from prompt_engine import (
+    PROMPT_ENGINEERING_NOTES, build_prompt, render_prompt_json, selection_from_library
+)
+
+
+def default_selection():
+    first = {category: next(iter(items)) for category, items in DEFAULT_LIBRARY.items()}
+    return selection_from_library(
+        DEFAULT_LIBRARY, first["characters"], first["poses"], first["color_palettes"],
+        first["art_styles"], first["lighting_types"], first["backgrounds"], first["moods"],
+        first["expressions"])
+
+
+def test_documents_do_not_share_their_notes():
+    sel = default_selection()
+    first = build_prompt(sel).prompt_data
+    first["prompt_engineering_notes"]["color_emphasis"] = "edited"
+    second = build_prompt(sel).prompt_data
+    assert second["prompt_engineering_notes"]["color_emphasis"] == PROMPT_ENGINEERING_NOTES["color_emphasis"]
+
+
+def test_rendered_json_matches_the_document():
+    sel = default_selection()
+    for detailed in (None, 'an "enhanced" prompt, 100% {neon}\n'):
+        document = build_prompt(sel, detailed).prompt_data
+        assert render_prompt_json(sel, detailed) == json.dumps(document, ensure_ascii=False)
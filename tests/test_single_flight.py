@@ -0,0 +1,126 @@
+import threading
+import time
+
+import pytest
+
+from single_flight import SingleFlight, fcntl
+
+
+def start_all(threads):
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+
+def test_concurrent_callers_share_one_call_and_its_progress():
+    flights = SingleFlight(lock_dir="")
+    calls = []
+    leader_started = threading.Event()
+
+    def fn(publish):
+        calls.append(1)
+        leader_started.set()
+        time.sleep(0.2)  # the others join meanwhile
+        publish("par")
+        time.sleep(0.05)
+        publish("partial")
+        time.sleep(0.05)
+        return "result"
+
+    results, progress = [], []
+
+    def call():
+        seen = []
+        results.append(flights.do("k", fn, on_progress=seen.append))
+        progress.append(seen)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    assert leader_started.wait(1)
+    start_all([threading.Thread(target=call) for _ in range(5)])
+    leader.join(5)
+
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False] + [True] * 5
+    assert {result for result, _ in results} == {"result"}
+    # Waiters may skip an intermediate partial, never reorder or miss the last one
+    assert all(seen in (["par", "partial"], ["partial"]) for seen in progress)
+
+
+def test_waiter_takes_over_when_the_leader_fails():
+    flights = SingleFlight(lock_dir="")
+    attempts = []
+    leader_started = threading.Event()
+
+    def fn(publish):
+        attempts.append(1)
+        if len(attempts) == 1:
+            leader_started.set()
+            time.sleep(0.1)
+            raise KeyboardInterrupt  # e.g. the leader's session was rerun
+        return "second try"
+
+    outcome = {}
+
+    def leader():
+        with pytest.raises(KeyboardInterrupt):
+            flights.do("k", fn)
+
+    def waiter():
+        assert leader_started.wait(1)
+        outcome["waiter"] = flights.do("k", fn)
+
+    start_all([threading.Thread(target=leader), threading.Thread(target=waiter)])
+    assert outcome["waiter"] == ("second try", False)
+    assert len(attempts) == 2
+
+
+def test_failed_result_is_shared_not_retried():
+    flights = SingleFlight(lock_dir="")
+    started = threading.Event()
+
+    def fn(publish):
+        started.set()
+        time.sleep(0.1)
+        return None  # e.g. every key failed
+
+    results = []
+    first = threading.Thread(target=lambda: results.append(flights.do("k", fn)))
+    first.start()
+    assert started.wait(1)
+    results.append(flights.do("k", lambda publish: "unexpected"))
+    first.join()
+    assert sorted(results, key=lambda item: item[1]) == [(None, False), (None, True)]
+
+
+def test_distinct_keys_do_not_wait_for_each_other():
+    flights = SingleFlight(lock_dir="")
+    begin = time.monotonic()
+    start_all([threading.Thread(target=flights.do, args=(key, lambda publish: time.sleep(0.2)))
+               for key in "abcd"])
+    assert time.monotonic() - begin < 0.6
+
+
+@pytest.mark.skipif(fcntl is None, reason="lock files need fcntl")
+def test_lock_holder_in_another_process_is_rechecked(tmp_path):
+    other = SingleFlight(lock_dir=str(tmp_path))
+    flights = SingleFlight(lock_dir=str(tmp_path))
+    lock, waited = other._lock_file("k")  # as if another process were calling
+    assert lock is not None and not waited
+    threading.Timer(0.2, other._unlock_file, lock).start()
+
+    result = flights.do("k", lambda publish: "own call", recheck=lambda: "cached by the other")
+    assert result == ("cached by the other", True)
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.skipif(fcntl is None, reason="lock files need fcntl")
+def test_lock_timeout_falls_back_to_an_own_call(tmp_path):
+    other = SingleFlight(lock_dir=str(tmp_path))
+    flights = SingleFlight(lock_dir=str(tmp_path), lock_timeout=0.1)
+    lock, _ = other._lock_file("k")
+    try:
+        assert flights.do("k", lambda publish: "own call", recheck=lambda: None) == ("own call", False)
+    finally:
+        other._unlock_file(*lock)